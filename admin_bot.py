@@ -1,14 +1,24 @@
 # admin_panel.py - نسخه کاملاً اصلاح شده
+import os
 import logging
 import asyncio
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardMarkup
-from config import ADMIN_BOT_TOKEN, ADMIN_PASSWORD
-from database import Database
+from config import (
+    MAIN_BOT_TOKEN, ADMIN_BOT_TOKEN, ADMIN_PASSWORD, DATABASE_NAME, LEAGUES_PAGE_SIZE,
+    STATS_RECONCILE_INTERVAL, BACKUP_INTERVAL, BACKUP_SEND_LIMIT_MB, TELEGRAM_API_SERVER
+)
+from database import RegistrationResult, get_shared_async_database
+from cache import all_cache_stats
+from bot_session import get_shared_session
+from fsm_storage import SQLiteStorage
+from callbacks import CallbackRouter
+from outbox import outbox
+from broadcast import start_broadcast, resume_broadcasts, cancel_broadcasts, progress_text
+from backup import create_backup
 
 # تنظیمات لاگ
 logging.basicConfig(
@@ -27,25 +37,21 @@ class AdminStates(StatesGroup):
     waiting_new_username = State()
     waiting_user_id_to_add = State()
     waiting_username_for_new_user = State()
+    waiting_broadcast_text = State()
 
 # ---------- متغیرهای سراسری ----------
-db = Database()
+db = get_shared_async_database(DATABASE_NAME)
 admin_sessions = set()
 
 # ---------- اینیشیالایز ----------
-bot = Bot(token=ADMIN_BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+bot = Bot(token=ADMIN_BOT_TOKEN, session=get_shared_session())
+# پیام گروهی از طرف ربات اصلی به کاربران ارسال می‌شود (روی همان session مشترک)
+main_bot = Bot(token=MAIN_BOT_TOKEN, session=get_shared_session())
+# وضعیت‌های FSM در دیتابیس ذخیره می‌شوند تا با راه‌اندازی مجدد از بین نروند
+dp = Dispatcher(storage=SQLiteStorage(db, name="fsm_admin"))
 
-# ---------- تابع کمکی برای استخراج league_id ----------
-def extract_league_id(callback_data: str) -> int:
-    """استخراج league_id از callback data"""
-    try:
-        # همیشه آخرین بخش را به عنوان league_id بگیر
-        parts = callback_data.split('_')
-        return int(parts[-1])
-    except (IndexError, ValueError) as e:
-        logger.error(f"خطا در استخراج league_id از '{callback_data}': {e}")
-        raise ValueError(f"Invalid league_id in callback data: {callback_data}")
+# مسیریابی callback‌ها: callback data به شکل "action:league_id[:user_id]"
+callbacks = CallbackRouter()
 
 # ---------- ایجاد اینلاین کیبورد همیشگی ----------
 def get_persistent_inline_keyboard():
@@ -65,9 +71,9 @@ def get_persistent_inline_keyboard():
 async def show_hall_of_fame(message_or_callback, include_persistent_keyboard=True):
     """نمایش تالار افتخارات"""
     
-    champions = db.get_all_champions()
+    has_champions, text = await db.get_hall_of_fame()
     
-    if not champions:
+    if not has_champions:
         text = (
             "🏆 تالار افتخارات\n\n"
             "PERSIAN FORMATION🏆\n\n"
@@ -75,19 +81,6 @@ async def show_hall_of_fame(message_or_callback, include_persistent_keyboard=Tru
             "برای ثبت قهرمان، ابتدا یک لیگ را غیرفعال کنید\n"
             "سپس از بخش مدیریت لیگ، قهرمان آن را تعیین کنید."
         )
-    else:
-        header = " قهرمان های تورنومنت ولیگ های\nPERSIAN FORMATION🏆\n\n"
-        
-        champions_text = ""
-        for league_name, champ_game_id, champ_display, set_date in champions:
-            if champ_display:
-                display = f"{champ_display}"
-            else:
-                display = f"{champ_game_id}"
-            
-            champions_text += f"{league_name}: {champ_game_id}({display})🏆\n"
-        
-        text = header + champions_text
     
     # ترکیب کیبورد تالار افتخارات
     builder = InlineKeyboardBuilder()
@@ -153,7 +146,7 @@ async def check_password(message: types.Message, state: FSMContext):
 
 # ---------- هندلرهای inline کیبورد ----------
 
-@dp.callback_query(F.data == "list_leagues_persistent")
+@callbacks.route("list_leagues_persistent")
 async def list_leagues_persistent(callback: types.CallbackQuery):
     await callback.answer()
     user_id = callback.from_user.id
@@ -163,7 +156,7 @@ async def list_leagues_persistent(callback: types.CallbackQuery):
     
     await list_leagues_handler(callback, include_persistent_keyboard=True)
 
-@dp.callback_query(F.data == "hall_of_fame_persistent")
+@callbacks.route("hall_of_fame_persistent")
 async def hall_of_fame_persistent(callback: types.CallbackQuery):
     await callback.answer()
     user_id = callback.from_user.id
@@ -173,7 +166,7 @@ async def hall_of_fame_persistent(callback: types.CallbackQuery):
     
     await show_hall_of_fame(callback, include_persistent_keyboard=True)
 
-@dp.callback_query(F.data == "create_league_persistent")
+@callbacks.route("create_league_persistent")
 async def create_league_persistent(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
     user_id = callback.from_user.id
@@ -184,7 +177,7 @@ async def create_league_persistent(callback: types.CallbackQuery, state: FSMCont
     await callback.message.edit_text("📝 لطفاً نام لیگ جدید را وارد کنید:")
     await state.set_state(AdminStates.waiting_league_name)
 
-@dp.callback_query(F.data == "refresh_admin_panel")
+@callbacks.route("refresh_admin_panel")
 async def refresh_admin_panel_persistent(callback: types.CallbackQuery):
     await callback.answer()
     user_id = callback.from_user.id
@@ -197,7 +190,7 @@ async def refresh_admin_panel_persistent(callback: types.CallbackQuery):
         reply_markup=get_persistent_inline_keyboard()
     )
 
-@dp.callback_query(F.data == "back_to_admin_menu_persistent")
+@callbacks.route("back_to_admin_menu_persistent")
 async def back_to_admin_menu_persistent(callback: types.CallbackQuery):
     await callback.answer()
     await callback.message.edit_text(
@@ -205,17 +198,17 @@ async def back_to_admin_menu_persistent(callback: types.CallbackQuery):
         reply_markup=get_persistent_inline_keyboard()
     )
 
-@dp.callback_query(F.data == "refresh_hall_of_fame")
+@callbacks.route("refresh_hall_of_fame")
 async def refresh_hall_of_fame(callback: types.CallbackQuery):
     await callback.answer()
     await show_hall_of_fame(callback, include_persistent_keyboard=True)
 
-@dp.callback_query(F.data == "add_new_champion")
+@callbacks.route("add_new_champion")
 async def add_new_champion_from_hall(callback: types.CallbackQuery):
     await callback.answer()
     
     # لیگ‌های غیرفعال بدون قهرمان
-    leagues = db.get_leagues_without_champion()
+    leagues = await db.get_leagues_without_champion()
     
     if not leagues:
         builder = InlineKeyboardBuilder()
@@ -234,7 +227,7 @@ async def add_new_champion_from_hall(callback: types.CallbackQuery):
     
     builder = InlineKeyboardBuilder()
     for league_id, league_name in leagues:
-        builder.button(text=f"🏆 {league_name}", callback_data=f"set_champion_{league_id}")
+        builder.button(text=f"🏆 {league_name}", callback_data=f"set_champion:{league_id}")
     
     builder.button(text="🔙 بازگشت", callback_data="hall_of_fame_persistent")
     builder.adjust(1)
@@ -245,7 +238,7 @@ async def add_new_champion_from_hall(callback: types.CallbackQuery):
         reply_markup=builder.as_markup()
     )
 
-@dp.callback_query(F.data == "show_stats_persistent")
+@callbacks.route("show_stats_persistent")
 async def show_stats_persistent(callback: types.CallbackQuery):
     await callback.answer()
     user_id = callback.from_user.id
@@ -253,7 +246,7 @@ async def show_stats_persistent(callback: types.CallbackQuery):
         await callback.message.edit_text("❌ دسترسی ندارید. ابتدا /start را بزنید.")
         return
     
-    stats = db.get_total_stats()
+    stats = await db.get_total_stats()
     
     total_leagues = stats.get('total_leagues', 0)
     active_leagues = stats.get('active_leagues', 0)
@@ -269,6 +262,16 @@ async def show_stats_persistent(callback: types.CallbackQuery):
     builder.adjust(2, 1)
     
     percentage = round((total_registrations / total_capacity * 100) if total_capacity > 0 else 0, 1)
+    cache_lines = "".join(
+        f"\n🗄️ کش {name}: {stats['hits']} hit / {stats['misses']} miss ({stats['hit_rate'] * 100:.1f}%)"
+        for name, stats in sorted(all_cache_stats().items())
+    )
+    outbox_stats = outbox.stats()
+    outbox_line = (
+        f"\n📤 صف ارسال: {outbox_stats['pending']} در انتظار، {outbox_stats['sent']} ارسال، "
+        f"{outbox_stats['retried']} تلاش مجدد، {outbox_stats['failed']} خطا "
+        f"(p99={outbox_stats['latency_p99_ms']}ms)"
+    )
     
     await callback.message.edit_text(
         f"📊 آمار کلی سیستم:\n\n"
@@ -279,14 +282,17 @@ async def show_stats_persistent(callback: types.CallbackQuery):
         f"👥 کاربران منحصر به فرد: {total_users}\n"
         f"📝 تعداد کل ثبت‌نام‌ها: {total_registrations}\n"
         f"📈 ظرفیت کل فعال: {total_capacity}\n"
-        f"📊 درصد پر شدن: {percentage}%",
+        f"📊 درصد پر شدن: {percentage}%\n"
+        f"{cache_lines}"
+        f"{outbox_line}",
         reply_markup=builder.as_markup()
     )
 
 # ---------- نمایش لیست لیگ‌ها ----------
 
-async def list_leagues_handler(message_or_callback, include_persistent_keyboard=True):
-    leagues = db.get_all_leagues()
+async def list_leagues_handler(message_or_callback, include_persistent_keyboard=True, page=0):
+    total = await db.get_league_count()
+    leagues = await db.get_leagues_overview(limit=LEAGUES_PAGE_SIZE, offset=page * LEAGUES_PAGE_SIZE)
     
     if not leagues:
         text = "⚠️ هنوز لیگی ایجاد نشده است."
@@ -307,16 +313,24 @@ async def list_leagues_handler(message_or_callback, include_persistent_keyboard=
         return
     
     builder = InlineKeyboardBuilder()
-    for league in leagues:
-        league_id, name, capacity, is_active, created_at = league
-        user_count = db.get_league_user_count(league_id)
+    for league_id, name, capacity, is_active, created_at, user_count, has_champion in leagues:
         status = "✅" if is_active == 1 else "❌"
-        
-        # بررسی آیا قهرمان دارد
-        has_champion = db.get_champion(league_id) is not None
         champion_icon = "👑" if has_champion else ""
         text = f"{status}{champion_icon} {name} ({user_count}/{capacity})"
-        builder.button(text=text, callback_data=f"admin_league_{league_id}")
+        builder.button(text=text, callback_data=f"admin_league:{league_id}")
+    layout = [1] * len(leagues)
+    
+    # صفحه‌بندی برای تعداد زیاد لیگ‌ها
+    pages = (total + LEAGUES_PAGE_SIZE - 1) // LEAGUES_PAGE_SIZE
+    if pages > 1:
+        nav = 0
+        if page > 0:
+            builder.button(text="⬅️ قبلی", callback_data=f"list_leagues_page:{page - 1}")
+            nav += 1
+        if page < pages - 1:
+            builder.button(text="➡️ بعدی", callback_data=f"list_leagues_page:{page + 1}")
+            nav += 1
+        layout.append(nav)
     
     # اضافه کردن دکمه‌های همیشگی
     if include_persistent_keyboard:
@@ -324,186 +338,234 @@ async def list_leagues_handler(message_or_callback, include_persistent_keyboard=
         builder.button(text="➕ ایجاد لیگ", callback_data="create_league_persistent")
         builder.button(text="📊 آمار کلی", callback_data="show_stats_persistent")
         builder.button(text="🔙 بازگشت", callback_data="back_to_admin_menu_persistent")
-        builder.adjust(1, 1, 2, 1)
+        builder.adjust(*layout, 1, 1, 2, 1)
     else:
         builder.button(text="🔙 بازگشت", callback_data="back_to_admin_menu_persistent")
-        builder.adjust(1)
+        builder.adjust(*layout, 1)
     
     text = "🏆 لیست لیگ‌ها:\n\nبرای مدیریت روی یک لیگ کلیک کنید:\n👑 = دارای قهرمان\n✅ = فعال\n❌ = غیرفعال"
+    if pages > 1:
+        text += f"\n\n📄 صفحه {page + 1} از {pages}"
     
     if isinstance(message_or_callback, types.CallbackQuery):
         await message_or_callback.message.edit_text(text, reply_markup=builder.as_markup())
     else:
         await message_or_callback.answer(text, reply_markup=builder.as_markup())
 
+@callbacks.route("list_leagues_page", int)
+async def list_leagues_page(callback: types.CallbackQuery, page: int):
+    await callback.answer()
+    user_id = callback.from_user.id
+    if user_id not in admin_sessions:
+        await callback.message.edit_text("❌ دسترسی ندارید. ابتدا /start را بزنید.")
+        return
+    
+    await list_leagues_handler(callback, include_persistent_keyboard=True, page=page)
+
 # ---------- مدیریت لیگ‌ها ----------
 
-@dp.callback_query(F.data.startswith("admin_league_"))
-async def manage_league(callback: types.CallbackQuery):
+async def show_league_panel(callback: types.CallbackQuery, league_id: int):
+    """نمایش پنل مدیریت یک لیگ از روی get_league_detail"""
+    detail = await db.get_league_detail(league_id, users_limit=10)
+    
+    if not detail:
+        await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
+        return
+    
+    league_id, name, capacity, is_active, created_at = detail['league']
+    user_count = detail['user_count']
+    status = "فعال" if is_active == 1 else "غیرفعال"
+    
+    # بررسی آیا قهرمان دارد
+    champion_text = ""
+    champion = detail['champion']
+    if champion:
+        champ_game_id, champ_display, set_at = champion
+        champion_text = f"\n👑 قهرمان: {champ_game_id} ({champ_display})\n📅 تاریخ: {set_at}"
+    
+    # ده کاربر اول
+    users = detail['users']
+    if users:
+        users_list = "\n".join([f"{i+1}. {username if username else f'آیدی: {user_id}'}" 
+                               for i, (user_id, username) in enumerate(users)])
+        if user_count > len(users):
+            users_list += f"\n... و {user_count - len(users)} کاربر دیگر"
+    else:
+        users_list = "هیچ کاربری ثبت‌نام نکرده است."
+    
+    # ایجاد دکمه‌های مدیریت
+    builder = InlineKeyboardBuilder()
+    builder.button(text=f"🔄 {'غیرفعال' if is_active == 1 else 'فعال'} کردن", callback_data=f"toggle:{league_id}")
+    builder.button(text="👥 مدیریت کاربران", callback_data=f"view_users:{league_id}")
+    builder.button(text="📣 ارسال پیام به لیگ", callback_data=f"broadcast:{league_id}")
+    
+    # بررسی وجود قهرمان برای دکمه‌ها
+    has_champion = champion is not None
+    
+    if is_active == 0:  # فقط لیگ‌های غیرفعال می‌توانند قهرمان داشته باشند
+        if has_champion:
+            builder.button(text="✏️ ویرایش قهرمان", callback_data=f"edit_champion:{league_id}")
+            builder.button(text="🗑️ حذف قهرمان", callback_data=f"remove_champion:{league_id}")
+        else:
+            builder.button(text="👑 تعیین قهرمان", callback_data=f"set_champion:{league_id}")
+    
+    builder.button(text="🗑️ حذف لیگ", callback_data=f"delete_league:{league_id}")
+    builder.button(text="📋 لیست لیگ‌ها", callback_data="list_leagues_persistent")
+    builder.button(text="🏆 تالار افتخارات", callback_data="hall_of_fame_persistent")
+    
+    # تنظیم چیدمان دکمه‌ها
+    if is_active == 0 and has_champion:
+        builder.adjust(2, 1, 2, 2, 1)
+    elif is_active == 0:
+        builder.adjust(2, 1, 1, 2, 1)
+    else:
+        builder.adjust(2, 1, 2, 1)
+    
+    await callback.message.edit_text(
+        f"🏆 لیگ: {name}\n"
+        f"📊 ظرفیت: {user_count}/{capacity}\n"
+        f"🔧 وضعیت: {status}\n"
+        f"📅 تاریخ ایجاد: {created_at}{champion_text}\n\n"
+        f"کاربران ثبت‌نام کرده ({user_count} نفر):\n{users_list}",
+        reply_markup=builder.as_markup()
+    )
+
+@callbacks.route("admin_league", int)
+async def manage_league(callback: types.CallbackQuery, league_id: int):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
-        
-        if not league:
-            await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
-            return
-        
-        league_id, name, capacity, is_active, created_at = league
-        user_count = db.get_league_user_count(league_id)
-        status = "فعال" if is_active == 1 else "غیرفعال"
-        
-        # بررسی آیا قهرمان دارد
-        champion_text = ""
-        champion = db.get_champion(league_id)
-        if champion:
-            champ_game_id, champ_display, set_at, league_name = champion
-            champion_text = f"\n👑 قهرمان: {champ_game_id} ({champ_display})\n📅 تاریخ: {set_at}"
-        
-        # دریافت لیست کاربران
-        users = db.get_league_users(league_id)
-        if users:
-            users_list = "\n".join([f"{i+1}. {username if username else f'آیدی: {user_id}'}" 
-                                   for i, (user_id, username) in enumerate(users[:10])])  # فقط 10 کاربر اول
-            if len(users) > 10:
-                users_list += f"\n... و {len(users) - 10} کاربر دیگر"
-        else:
-            users_list = "هیچ کاربری ثبت‌نام نکرده است."
-        
-        # ایجاد دکمه‌های مدیریت
-        builder = InlineKeyboardBuilder()
-        builder.button(text=f"🔄 {'غیرفعال' if is_active == 1 else 'فعال'} کردن", callback_data=f"toggle_{league_id}")
-        builder.button(text="👥 مدیریت کاربران", callback_data=f"view_users_{league_id}")
-        
-        # بررسی وجود قهرمان برای دکمه‌ها
-        has_champion = champion is not None
-        
-        if is_active == 0:  # فقط لیگ‌های غیرفعال می‌توانند قهرمان داشته باشند
-            if has_champion:
-                builder.button(text="✏️ ویرایش قهرمان", callback_data=f"edit_champion_{league_id}")
-                builder.button(text="🗑️ حذف قهرمان", callback_data=f"remove_champion_{league_id}")
-            else:
-                builder.button(text="👑 تعیین قهرمان", callback_data=f"set_champion_{league_id}")
-        
-        builder.button(text="🗑️ حذف لیگ", callback_data=f"delete_league_{league_id}")
-        builder.button(text="📋 لیست لیگ‌ها", callback_data="list_leagues_persistent")
-        builder.button(text="🏆 تالار افتخارات", callback_data="hall_of_fame_persistent")
-        
-        # تنظیم چیدمان دکمه‌ها
-        if is_active == 0 and has_champion:
-            builder.adjust(2, 2, 2, 2)
-        elif is_active == 0:
-            builder.adjust(2, 2, 1, 2)
-        else:
-            builder.adjust(2, 2, 2)
-        
-        await callback.message.edit_text(
-            f"🏆 لیگ: {name}\n"
-            f"📊 ظرفیت: {user_count}/{capacity}\n"
-            f"🔧 وضعیت: {status}\n"
-            f"📅 تاریخ ایجاد: {created_at}{champion_text}\n\n"
-            f"کاربران ثبت‌نام کرده ({user_count} نفر):\n{users_list}",
-            reply_markup=builder.as_markup()
-        )
+        await show_league_panel(callback, league_id)
     except Exception as e:
         logger.error(f"خطا در مدیریت لیگ: {e}")
         await callback.message.edit_text("⚠️ خطا در نمایش اطلاعات لیگ!")
 
-@dp.callback_query(F.data.startswith("toggle_"))
-async def toggle_league(callback: types.CallbackQuery):
-    await callback.answer()
-    
+@callbacks.route("toggle", int)
+async def toggle_league(callback: types.CallbackQuery, league_id: int):
     try:
-        league_id = extract_league_id(callback.data)
-        new_status = db.toggle_league_status(league_id)
+        new_status = await db.toggle_league_status(league_id)
         
         if new_status is not None:
             status_text = "فعال" if new_status == 1 else "غیرفعال"
             await callback.answer(f"✅ وضعیت لیگ به '{status_text}' تغییر یافت!")
             
             # بازگشت به مدیریت لیگ
-            league = db.get_league(league_id)
-            if league:
-                league_id, name, capacity, is_active, created_at = league
-                user_count = db.get_league_user_count(league_id)
-                
-                # بررسی آیا قهرمان دارد
-                champion_text = ""
-                champion = db.get_champion(league_id)
-                if champion:
-                    champ_game_id, champ_display, set_at, league_name = champion
-                    champion_text = f"\n👑 قهرمان: {champ_game_id} ({champ_display})"
-                
-                status_text = "فعال" if is_active == 1 else "غیرفعال"
-                users = db.get_league_users(league_id)
-                if users:
-                    users_list = "\n".join([f"{i+1}. {username if username else f'آیدی: {user_id}'}" 
-                                           for i, (user_id, username) in enumerate(users[:10])])
-                    if len(users) > 10:
-                        users_list += f"\n... و {len(users) - 10} کاربر دیگر"
-                else:
-                    users_list = "هیچ کاربری ثبت‌نام نکرده است."
-                
-                builder = InlineKeyboardBuilder()
-                builder.button(text=f"🔄 {'غیرفعال' if is_active == 1 else 'فعال'} کردن", callback_data=f"toggle_{league_id}")
-                builder.button(text="👥 مدیریت کاربران", callback_data=f"view_users_{league_id}")
-                
-                has_champion = champion is not None
-                
-                if is_active == 0:
-                    if has_champion:
-                        builder.button(text="✏️ ویرایش قهرمان", callback_data=f"edit_champion_{league_id}")
-                        builder.button(text="🗑️ حذف قهرمان", callback_data=f"remove_champion_{league_id}")
-                    else:
-                        builder.button(text="👑 تعیین قهرمان", callback_data=f"set_champion_{league_id}")
-                
-                builder.button(text="🗑️ حذف لیگ", callback_data=f"delete_league_{league_id}")
-                builder.button(text="📋 لیست لیگ‌ها", callback_data="list_leagues_persistent")
-                builder.button(text="🏆 تالار افتخارات", callback_data="hall_of_fame_persistent")
-                
-                if is_active == 0 and has_champion:
-                    builder.adjust(2, 2, 2, 2)
-                elif is_active == 0:
-                    builder.adjust(2, 2, 1, 2)
-                else:
-                    builder.adjust(2, 2, 2)
-                
-                await callback.message.edit_text(
-                    f"🏆 لیگ: {name}\n"
-                    f"📊 ظرفیت: {user_count}/{capacity}\n"
-                    f"🔧 وضعیت: {status_text}{champion_text}\n"
-                    f"📅 تاریخ ایجاد: {created_at}\n\n"
-                    f"کاربران ثبت‌نام کرده ({user_count} نفر):\n{users_list}",
-                    reply_markup=builder.as_markup()
-                )
+            await show_league_panel(callback, league_id)
         else:
+            await callback.answer()
             await callback.message.edit_text("⚠️ خطا در تغییر وضعیت لیگ!")
     except Exception as e:
         logger.error(f"خطا در تغییر وضعیت لیگ: {e}")
         await callback.message.edit_text("⚠️ خطا در تغییر وضعیت لیگ!")
 
+# ---------- پیام گروهی به لیگ ----------
+
+@callbacks.route("broadcast", int)
+async def broadcast_start(callback: types.CallbackQuery, league_id: int, state: FSMContext):
+    await callback.answer()
+    user_id = callback.from_user.id
+    if user_id not in admin_sessions:
+        await callback.message.edit_text("❌ دسترسی ندارید. ابتدا /start را بزنید.")
+        return
+    
+    try:
+        league = await db.get_league(league_id)
+        
+        if not league:
+            await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
+            return
+        
+        await state.update_data(broadcast_league_id=league_id)
+        await callback.message.edit_text(
+            f"📣 ارسال پیام به شرکت‌کنندگان لیگ '{league[1]}'\n\n"
+            f"لطفاً متن پیام را وارد کنید:"
+        )
+        
+        await state.set_state(AdminStates.waiting_broadcast_text)
+    except Exception as e:
+        logger.error(f"خطا در شروع پیام گروهی: {e}")
+        await callback.message.edit_text("⚠️ خطا در شروع ارسال پیام!")
+
+@dp.message(AdminStates.waiting_broadcast_text)
+async def get_broadcast_text(message: types.Message, state: FSMContext):
+    text = (message.text or "").strip()
+    
+    if not text:
+        await message.answer("❌ متن پیام نمی‌تواند خالی باشد. لطفاً دوباره وارد کنید:")
+        return
+    
+    data = await state.get_data()
+    league_id = data.get('broadcast_league_id')
+    await state.update_data(broadcast_text=text)
+    # خروج از حالت انتظار؛ داده‌ها تا تأیید یا لغو باقی می‌مانند
+    await state.set_state(None)
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✅ ارسال", callback_data=f"confirm_broadcast:{league_id}")
+    builder.button(text="❌ لغو", callback_data=f"admin_league:{league_id}")
+    builder.adjust(2)
+    
+    await message.answer(
+        f"📣 پیش‌نمایش پیام:\n\n{text}\n\n"
+        f"پیام برای تمام شرکت‌کنندگان لیگ ارسال شود؟",
+        reply_markup=builder.as_markup()
+    )
+
+@callbacks.route("confirm_broadcast", int)
+async def confirm_broadcast(callback: types.CallbackQuery, league_id: int, state: FSMContext):
+    await callback.answer()
+    user_id = callback.from_user.id
+    if user_id not in admin_sessions:
+        await callback.message.edit_text("❌ دسترسی ندارید. ابتدا /start را بزنید.")
+        return
+    
+    try:
+        data = await state.get_data()
+        text = data.get('broadcast_text')
+        await state.clear()
+        
+        league = await db.get_league(league_id)
+        if not league or not text or data.get('broadcast_league_id') != league_id:
+            await callback.message.edit_text("⚠️ اطلاعات پیام پیدا نشد. دوباره تلاش کنید.")
+            return
+        
+        # ثبت در دیتابیس قبل از هر کار دیگر: با دو بار زدن دکمه فقط یکی از
+        # دو ثبت موفق می‌شود (یک پیام گروهی در حال اجرا برای هر لیگ)
+        broadcast_id = await db.create_broadcast(
+            league_id, text, callback.message.chat.id, callback.message.message_id
+        )
+        if not broadcast_id:
+            await callback.message.answer("⚠️ پیام گروهی ثبت نشد؛ ممکن است ارسال دیگری برای این لیگ در جریان باشد.")
+            return
+        
+        await callback.message.edit_text(
+            progress_text(league[1], await db.get_league_user_count(league_id), 0, 0)
+        )
+        start_broadcast(db, broadcast_id, main_bot, bot)
+    except Exception as e:
+        logger.error(f"خطا در ارسال پیام گروهی: {e}")
+        await callback.message.edit_text("⚠️ خطا در ارسال پیام گروهی!")
+
 # ---------- مدیریت کاربران ----------
 
-@dp.callback_query(F.data.startswith("view_users_"))
-async def view_users(callback: types.CallbackQuery):
+@callbacks.route("view_users", int)
+async def view_users(callback: types.CallbackQuery, league_id: int):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
             return
         
-        users = db.get_league_users(league_id)
+        users = await db.get_league_users(league_id)
         
         if not users:
             users_text = "هیچ کاربری ثبت‌نام نکرده است."
             builder = InlineKeyboardBuilder()
-            builder.button(text="➕ افزودن کاربر", callback_data=f"add_user_{league_id}")
-            builder.button(text="🔙 بازگشت", callback_data=f"admin_league_{league_id}")
+            builder.button(text="➕ افزودن کاربر", callback_data=f"add_user:{league_id}")
+            builder.button(text="🔙 بازگشت", callback_data=f"admin_league:{league_id}")
             builder.adjust(2)
         else:
             users_text = "\n".join([f"{i+1}. {username if username else f'آیدی: {user_id}'}" 
@@ -516,10 +578,10 @@ async def view_users(callback: types.CallbackQuery):
                 display_name = username if username else str(user_id)
                 if len(display_name) > 20:
                     display_name = display_name[:20] + "..."
-                builder.button(text=f"✏️ {display_name}", callback_data=f"edit_user_{league_id}_{user_id}")
+                builder.button(text=f"✏️ {display_name}", callback_data=f"edit_user:{league_id}:{user_id}")
             
-            builder.button(text="➕ افزودن کاربر", callback_data=f"add_user_{league_id}")
-            builder.button(text="🔙 بازگشت به مدیریت", callback_data=f"admin_league_{league_id}")
+            builder.button(text="➕ افزودن کاربر", callback_data=f"add_user:{league_id}")
+            builder.button(text="🔙 بازگشت به مدیریت", callback_data=f"admin_league:{league_id}")
             builder.button(text="📋 لیست لیگ‌ها", callback_data="list_leagues_persistent")
             
             if len(users) <= 5:
@@ -537,31 +599,23 @@ async def view_users(callback: types.CallbackQuery):
         logger.error(f"خطا در نمایش کاربران: {e}")
         await callback.message.edit_text("⚠️ خطا در نمایش کاربران!")
 
-@dp.callback_query(F.data.startswith("edit_user_"))
-async def edit_user_options(callback: types.CallbackQuery):
+@callbacks.route("edit_user", int, str)
+async def edit_user_options(callback: types.CallbackQuery, league_id: int, user_id: str):
     await callback.answer()
     
     try:
-        parts = callback.data.split('_')
-        if len(parts) < 4:
-            await callback.message.edit_text("⚠️ خطا در شناسایی کاربر!")
-            return
-        
-        league_id = int(parts[2])
-        user_id = '_'.join(parts[3:])  # چون user_id می‌تواند شامل _ باشد
-        
-        user_info = db.get_user_info(league_id, user_id)
+        user_info = await db.get_user_info(league_id, user_id)
         if not user_info:
             await callback.message.edit_text("⚠️ کاربر پیدا نشد!")
             return
         
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         league_name = league[1] if league else "لیگ"
         
         builder = InlineKeyboardBuilder()
-        builder.button(text="✏️ تغییر نام کاربری", callback_data=f"change_username_{league_id}_{user_id}")
-        builder.button(text="🗑️ حذف کاربر از لیگ", callback_data=f"delete_user_{league_id}_{user_id}")
-        builder.button(text="🔙 بازگشت به لیست کاربران", callback_data=f"view_users_{league_id}")
+        builder.button(text="✏️ تغییر نام کاربری", callback_data=f"change_username:{league_id}:{user_id}")
+        builder.button(text="🗑️ حذف کاربر از لیگ", callback_data=f"delete_user:{league_id}:{user_id}")
+        builder.button(text="🔙 بازگشت به لیست کاربران", callback_data=f"view_users:{league_id}")
         builder.adjust(2, 1)
         
         await callback.message.edit_text(
@@ -576,20 +630,12 @@ async def edit_user_options(callback: types.CallbackQuery):
         logger.error(f"خطا در ویرایش کاربر: {e}")
         await callback.message.edit_text("⚠️ خطا در نمایش اطلاعات کاربر!")
 
-@dp.callback_query(F.data.startswith("change_username_"))
-async def change_username_start(callback: types.CallbackQuery, state: FSMContext):
+@callbacks.route("change_username", int, str)
+async def change_username_start(callback: types.CallbackQuery, league_id: int, user_id: str, state: FSMContext):
     await callback.answer()
     
     try:
-        parts = callback.data.split('_')
-        if len(parts) < 4:
-            await callback.message.edit_text("⚠️ خطا در شناسایی کاربر!")
-            return
-        
-        league_id = int(parts[2])
-        user_id = '_'.join(parts[3:])
-        
-        user_info = db.get_user_info(league_id, user_id)
+        user_info = await db.get_user_info(league_id, user_id)
         if not user_info:
             await callback.message.edit_text("⚠️ کاربر پیدا نشد!")
             return
@@ -633,7 +679,7 @@ async def save_new_username(message: types.Message, state: FSMContext):
         await state.clear()
         return
     
-    success = db.update_user_username(league_id, user_id, new_username)
+    success = await db.update_user_username(league_id, user_id, new_username)
     
     if success:
         await message.answer(
@@ -648,30 +694,22 @@ async def save_new_username(message: types.Message, state: FSMContext):
     
     await state.clear()
 
-@dp.callback_query(F.data.startswith("delete_user_"))
-async def delete_user_confirmation(callback: types.CallbackQuery):
+@callbacks.route("delete_user", int, str)
+async def delete_user_confirmation(callback: types.CallbackQuery, league_id: int, user_id: str):
     await callback.answer()
     
     try:
-        parts = callback.data.split('_')
-        if len(parts) < 4:
-            await callback.message.edit_text("⚠️ خطا در شناسایی کاربر!")
-            return
-        
-        league_id = int(parts[2])
-        user_id = '_'.join(parts[3:])
-        
-        user_info = db.get_user_info(league_id, user_id)
+        user_info = await db.get_user_info(league_id, user_id)
         if not user_info:
             await callback.message.edit_text("⚠️ کاربر پیدا نشد!")
             return
         
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         league_name = league[1] if league else "لیگ"
         
         builder = InlineKeyboardBuilder()
-        builder.button(text="✅ بله، حذف کن", callback_data=f"confirm_delete_user_{league_id}_{user_id}")
-        builder.button(text="❌ خیر، انصراف", callback_data=f"edit_user_{league_id}_{user_id}")
+        builder.button(text="✅ بله، حذف کن", callback_data=f"confirm_delete_user:{league_id}:{user_id}")
+        builder.button(text="❌ خیر، انصراف", callback_data=f"edit_user:{league_id}:{user_id}")
         builder.adjust(2)
         
         await callback.message.edit_text(
@@ -686,33 +724,25 @@ async def delete_user_confirmation(callback: types.CallbackQuery):
         logger.error(f"خطا در تایید حذف کاربر: {e}")
         await callback.message.edit_text("⚠️ خطا در تایید حذف کاربر!")
 
-@dp.callback_query(F.data.startswith("confirm_delete_user_"))
-async def delete_user_final(callback: types.CallbackQuery):
+@callbacks.route("confirm_delete_user", int, str)
+async def delete_user_final(callback: types.CallbackQuery, league_id: int, user_id: str):
     await callback.answer()
     
     try:
-        parts = callback.data.split('_')
-        if len(parts) < 4:
-            await callback.message.edit_text("⚠️ خطا در شناسایی کاربر!")
-            return
-        
-        league_id = int(parts[2])
-        user_id = '_'.join(parts[3:])
-        
-        user_info = db.get_user_info(league_id, user_id)
+        user_info = await db.get_user_info(league_id, user_id)
         if not user_info:
             await callback.message.edit_text("⚠️ کاربر پیدا نشد!")
             return
         
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         league_name = league[1] if league else "لیگ"
         
-        success = db.remove_user_from_league(league_id, user_id)
+        success = await db.remove_user_from_league(league_id, user_id)
         
         if success:
             builder = InlineKeyboardBuilder()
-            builder.button(text="🔙 بازگشت به لیست کاربران", callback_data=f"view_users_{league_id}")
-            builder.button(text="🏆 مدیریت لیگ", callback_data=f"admin_league_{league_id}")
+            builder.button(text="🔙 بازگشت به لیست کاربران", callback_data=f"view_users:{league_id}")
+            builder.button(text="🏆 مدیریت لیگ", callback_data=f"admin_league:{league_id}")
             builder.adjust(1)
             
             await callback.message.edit_text(
@@ -730,20 +760,19 @@ async def delete_user_final(callback: types.CallbackQuery):
 
 # ---------- افزودن کاربر جدید ----------
 
-@dp.callback_query(F.data.startswith("add_user_"))
-async def add_user_start(callback: types.CallbackQuery, state: FSMContext):
+@callbacks.route("add_user", int)
+async def add_user_start(callback: types.CallbackQuery, league_id: int, state: FSMContext):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
             return
         
         # بررسی ظرفیت لیگ
-        user_count = db.get_league_user_count(league_id)
+        user_count = await db.get_league_user_count(league_id)
         if user_count >= league[2]:  # capacity
             await callback.message.edit_text("🚫 ظرفیت این لیگ تکمیل شده است!")
             return
@@ -780,14 +809,14 @@ async def get_user_id_for_add(message: types.Message, state: FSMContext):
         return
     
     # بررسی آیا کاربر قبلاً در این لیگ ثبت‌نام کرده
-    if db.is_user_in_league(user_id, league_id):
+    if await db.is_user_in_league(user_id, league_id):
         await message.answer("⚠️ این کاربر قبلاً در این لیگ ثبت‌نام کرده است!")
         await state.clear()
         return
     
     await state.update_data(add_user_id=user_id)
     
-    league = db.get_league(league_id)
+    league = await db.get_league(league_id)
     league_name = league[1] if league else "لیگ"
     
     await message.answer(
@@ -820,10 +849,10 @@ async def save_new_user(message: types.Message, state: FSMContext):
         return
     
     # ثبت کاربر
-    success = db.register_user(user_id, username, league_id)
+    result = await db.try_register_user(user_id, username, league_id)
     
-    if success:
-        league = db.get_league(league_id)
+    if result == RegistrationResult.REGISTERED:
+        league = await db.get_league(league_id)
         league_name = league[1] if league else "لیگ"
         
         await message.answer(
@@ -834,11 +863,14 @@ async def save_new_user(message: types.Message, state: FSMContext):
             reply_markup=get_persistent_inline_keyboard()
         )
     else:
+        reasons = {
+            RegistrationResult.DUPLICATE: "کاربر قبلاً در لیگ ثبت‌نام کرده است",
+            RegistrationResult.INACTIVE: "لیگ غیرفعال شده است",
+            RegistrationResult.FULL: "ظرفیت لیگ تکمیل شده است",
+            RegistrationResult.NOT_FOUND: "لیگ پیدا نشد",
+        }
         await message.answer(
-            "❌ خطا در افزودن کاربر! ممکن است:\n"
-            "1. کاربر قبلاً در لیگ ثبت‌نام کرده باشد\n"
-            "2. لیگ غیرفعال شده باشد\n"
-            "3. ظرفیت لیگ تکمیل شده باشد",
+            f"❌ خطا در افزودن کاربر! {reasons.get(result, 'خطای دیتابیس')}.",
             reply_markup=get_persistent_inline_keyboard()
         )
     
@@ -846,13 +878,12 @@ async def save_new_user(message: types.Message, state: FSMContext):
 
 # ---------- مدیریت قهرمانان ----------
 
-@dp.callback_query(F.data.startswith("set_champion_"))
-async def set_champion_start(callback: types.CallbackQuery, state: FSMContext):
+@callbacks.route("set_champion", int)
+async def set_champion_start(callback: types.CallbackQuery, league_id: int, state: FSMContext):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
@@ -907,10 +938,10 @@ async def get_champion_display_name(message: types.Message, state: FSMContext):
         return
     
     # ذخیره قهرمان
-    success = db.set_champion(league_id, game_id, display_name if display_name else "", admin_id)
+    success = await db.set_champion(league_id, game_id, display_name if display_name else "", admin_id)
     
     if success:
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         league_name = league[1] if league else "لیگ"
         
         display_text = f" ({display_name})" if display_name else ""
@@ -929,14 +960,13 @@ async def get_champion_display_name(message: types.Message, state: FSMContext):
     
     await state.clear()
 
-@dp.callback_query(F.data.startswith("edit_champion_"))
-async def edit_champion_start(callback: types.CallbackQuery, state: FSMContext):
+@callbacks.route("edit_champion", int)
+async def edit_champion_start(callback: types.CallbackQuery, league_id: int, state: FSMContext):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
-        champion = db.get_champion(league_id)
+        league = await db.get_league(league_id)
+        champion = await db.get_champion(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
@@ -966,14 +996,13 @@ async def edit_champion_start(callback: types.CallbackQuery, state: FSMContext):
         logger.error(f"خطا در شروع ویرایش قهرمان: {e}")
         await callback.message.edit_text("⚠️ خطا در ویرایش قهرمان!")
 
-@dp.callback_query(F.data.startswith("remove_champion_"))
-async def remove_champion_confirmation(callback: types.CallbackQuery):
+@callbacks.route("remove_champion", int)
+async def remove_champion_confirmation(callback: types.CallbackQuery, league_id: int):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
-        champion = db.get_champion(league_id)
+        league = await db.get_league(league_id)
+        champion = await db.get_champion(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
@@ -986,8 +1015,8 @@ async def remove_champion_confirmation(callback: types.CallbackQuery):
         champ_game_id, champ_display, set_at, league_name = champion
         
         builder = InlineKeyboardBuilder()
-        builder.button(text="✅ بله، حذف کن", callback_data=f"confirm_remove_champion_{league_id}")
-        builder.button(text="❌ خیر، انصراف", callback_data=f"admin_league_{league_id}")
+        builder.button(text="✅ بله، حذف کن", callback_data=f"confirm_remove_champion:{league_id}")
+        builder.button(text="❌ خیر، انصراف", callback_data=f"admin_league:{league_id}")
         builder.adjust(2)
         
         display_text = f" ({champ_display})" if champ_display else ""
@@ -1003,19 +1032,18 @@ async def remove_champion_confirmation(callback: types.CallbackQuery):
         logger.error(f"خطا در تایید حذف قهرمان: {e}")
         await callback.message.edit_text("⚠️ خطا در تایید حذف قهرمان!")
 
-@dp.callback_query(F.data.startswith("confirm_remove_champion_"))
-async def remove_champion_final(callback: types.CallbackQuery):
+@callbacks.route("confirm_remove_champion", int)
+async def remove_champion_final(callback: types.CallbackQuery, league_id: int):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
             return
         
-        success = db.remove_champion(league_id)
+        success = await db.remove_champion(league_id)
         
         if success:
             await callback.message.edit_text(
@@ -1030,20 +1058,19 @@ async def remove_champion_final(callback: types.CallbackQuery):
 
 # ---------- حذف لیگ ----------
 
-@dp.callback_query(F.data.startswith("delete_league_"))
-async def delete_league_confirmation(callback: types.CallbackQuery):
+@callbacks.route("delete_league", int)
+async def delete_league_confirmation(callback: types.CallbackQuery, league_id: int):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
             return
         
-        user_count = db.get_league_user_count(league_id)
-        champion = db.get_champion(league_id)
+        user_count = await db.get_league_user_count(league_id)
+        champion = await db.get_champion(league_id)
         
         warning_text = ""
         if user_count > 0:
@@ -1053,8 +1080,8 @@ async def delete_league_confirmation(callback: types.CallbackQuery):
             warning_text += f"\n⚠️ این لیگ دارای قهرمان است که حذف خواهد شد!"
         
         builder = InlineKeyboardBuilder()
-        builder.button(text="✅ بله، حذف کن", callback_data=f"confirm_delete_league_{league_id}")
-        builder.button(text="❌ خیر، انصراف", callback_data=f"admin_league_{league_id}")
+        builder.button(text="✅ بله، حذف کن", callback_data=f"confirm_delete_league:{league_id}")
+        builder.button(text="❌ خیر، انصراف", callback_data=f"admin_league:{league_id}")
         builder.adjust(2)
         
         await callback.message.edit_text(
@@ -1069,20 +1096,19 @@ async def delete_league_confirmation(callback: types.CallbackQuery):
         logger.error(f"خطا در تایید حذف لیگ: {e}")
         await callback.message.edit_text("⚠️ خطا در تایید حذف لیگ!")
 
-@dp.callback_query(F.data.startswith("confirm_delete_league_"))
-async def delete_league_final(callback: types.CallbackQuery):
+@callbacks.route("confirm_delete_league", int)
+async def delete_league_final(callback: types.CallbackQuery, league_id: int):
     await callback.answer()
     
     try:
-        league_id = extract_league_id(callback.data)
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         
         if not league:
             await callback.message.edit_text("⚠️ لیگ پیدا نشد!")
             return
         
         league_name = league[1]
-        success = db.delete_league(league_id)
+        success = await db.delete_league(league_id)
         
         if success:
             await callback.message.edit_text(
@@ -1127,7 +1153,7 @@ async def get_league_capacity(message: types.Message, state: FSMContext):
         
         data = await state.get_data()
         league_name = data.get('new_league_name')
-        league_id = db.create_league(league_name, capacity)
+        league_id = await db.create_league(league_name, capacity)
         
         if league_id > 0:
             await message.answer(
@@ -1145,6 +1171,43 @@ async def get_league_capacity(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("⚠️ لطفاً یک عدد صحیح و مثبت وارد کنید:")
 
+# ---------- مسیریابی callback‌ها ----------
+@dp.callback_query()
+async def route_callback(callback: types.CallbackQuery, state: FSMContext):
+    """تمام callback‌های ربات ادمین با یک جستجو در جدول callbacks اجرا می‌شوند"""
+    if not await callbacks.dispatch(callback, state):
+        await callback.answer("⚠️ این دکمه قدیمی است؛ لطفاً از منوی جدید استفاده کنید.", show_alert=True)
+
+# ---------- پشتیبان‌گیری ----------
+@dp.message(Command("backup"))
+async def backup_command(message: types.Message):
+    """ایجاد پشتیبان آنلاین و ارسال فایل برای ادمین"""
+    if message.from_user.id not in admin_sessions:
+        await message.answer("❌ دسترسی ندارید. ابتدا /start را بزنید.")
+        return
+
+    status = await message.answer("💾 در حال ایجاد پشتیبان...")
+    # کپی و فشرده‌سازی در رشته جدا انجام می‌شود تا حلقه رویداد آزاد بماند
+    path = await asyncio.to_thread(create_backup)
+    if not path:
+        await status.edit_text("❌ خطا در ایجاد پشتیبان؛ لاگ سرور را بررسی کنید.")
+        return
+
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    # محدودیت حجم آپلود فقط برای سرور رسمی Bot API است
+    if size_mb > BACKUP_SEND_LIMIT_MB and not TELEGRAM_API_SERVER:
+        await status.edit_text(
+            f"✅ پشتیبان ایجاد شد ({size_mb:.1f}MB) اما برای ارسال در تلگرام بزرگ است.\n"
+            f"📁 مسیر روی سرور: {path}"
+        )
+        return
+
+    await message.answer_document(
+        types.FSInputFile(path),
+        caption=f"💾 پشتیبان دیتابیس ({size_mb:.1f}MB)"
+    )
+    await status.delete()
+
 # ---------- تابع لغو ----------
 @dp.message(Command("cancel"))
 async def cancel_command(message: types.Message, state: FSMContext):
@@ -1171,6 +1234,41 @@ async def handle_unexpected_messages(message: types.Message, state: FSMContext):
         else:
             await message.answer("لطفاً با دستور /start شروع کنید.")
 
+# ---------- شمارش مجدد دوره‌ای آمار ----------
+async def stats_reconcile_loop():
+    """اصلاح دوره‌ای انحراف شمارنده‌های آمار با شمارش کامل"""
+    while True:
+        await asyncio.sleep(STATS_RECONCILE_INTERVAL)
+        await db.reconcile_stats()
+
+# ---------- پشتیبان‌گیری دوره‌ای ----------
+async def backup_loop():
+    """پشتیبان‌گیری خودکار هر BACKUP_INTERVAL ثانیه"""
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        await asyncio.to_thread(create_backup)
+
+# ---------- شروع و پایان (مشترک بین polling و وبهوک) ----------
+background_tasks = []
+
+@dp.startup()
+async def on_startup():
+    # پاک‌کننده وضعیت‌های منقضی FSM حتی بدون ترافیک جدید
+    dp.storage.start()
+    background_tasks.append(asyncio.create_task(stats_reconcile_loop()))
+    if BACKUP_INTERVAL:
+        background_tasks.append(asyncio.create_task(backup_loop()))
+    await resume_broadcasts(db, main_bot, bot)
+
+@dp.shutdown()
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await cancel_broadcasts()
+    await db.close()
+
 # ---------- تابع اصلی اجرا ----------
 async def main():
     print("🤖 ربات ادمین با aiogram در حال راه‌اندازی...")
@@ -1183,8 +1281,6 @@ async def main():
         await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"خطا در اجرای ربات ادمین: {e}")
-    finally:
-        db.close()
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
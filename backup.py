@@ -0,0 +1,227 @@
+# backup.py
+"""
+پشتیبان‌گیری آنلاین از دیتابیس با backup API خود SQLite
+
+    python backup.py [--compression gzip|lzma|none] [--keep N] [db_path]
+
+کپی فایل با shutil در حالی که ربات‌ها می‌نویسند ممکن است نیمه‌کاره باشد و
+فایل -wal را هم جا می‌اندازد. Connection.backup صفحه‌ها را از دید یک
+تراکنش خواندن و مرحله به مرحله کپی می‌کند، پس نتیجه همیشه یک تصویر سالم
+از دیتابیس است و ربات‌ها بین مراحل به کار خود ادامه می‌دهند.
+
+خروجی در {stem}_backup_{timestamp}.db[.gz|.xz] نوشته می‌شود (timestamp با
+دقت میکروثانیه تا دو پشتیبان در یک ثانیه روی هم نوشته نشوند) و فقط
+BACKUP_KEEP فایل آخر نگه داشته می‌شوند.
+"""
+import os
+import sys
+import gzip
+import lzma
+import time
+import shutil
+import functools
+import logging
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+from config import (
+    DATABASE_NAME, BACKUP_DIR, BACKUP_KEEP, BACKUP_COMPRESSION,
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP, BACKUP_MAX_RESTARTS
+)
+
+logger = logging.getLogger(__name__)
+
+# پسوند و تابع باز کردن فایل برای هر نوع فشرده‌سازی؛ gzip سطح 6 روی
+# دیتابیس تقریباً همان حجم سطح 9 (پیش‌فرض) را با یک‌سوم زمان می‌دهد و lzma
+# کندتر است ولی فایل حدود چهار برابر کوچک‌تر می‌شود
+COMPRESSORS = {
+    "": ("", open),
+    "gzip": (".gz", functools.partial(gzip.open, compresslevel=6)),
+    "lzma": (".xz", lzma.open),
+}
+
+# اندازه تکه‌های خوانده شده هنگام فشرده‌سازی
+CHUNK_SIZE = 1024 * 1024
+
+# دو پشتیبان‌گیری همزمان (دستور ادمین و زمان‌بندی) پشت سر هم اجرا می‌شوند
+_backup_lock = threading.Lock()
+
+
+class _TooManyRestarts(Exception):
+    """کپی مرحله‌ای به خاطر نوشتن‌های همزمان بیش از حد از اول شروع شد"""
+
+
+def _remove(*paths):
+    for path in paths:
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def snapshot(db_path: str, target_path: str, pages: int = BACKUP_PAGES_PER_STEP,
+             sleep: float = BACKUP_STEP_SLEEP, max_restarts: int = BACKUP_MAX_RESTARTS,
+             verify: bool = True) -> int:
+    """
+    کپی سازگار دیتابیس در target_path با Connection.backup
+
+    هر مرحله pages صفحه کپی می‌کند و بین مراحل sleep ثانیه مکث می‌شود. اگر
+    اتصال دیگری وسط کار بنویسد، SQLite کپی را از اول شروع می‌کند؛ بعد از
+    max_restarts بار، بقیه کپی در یک مرحله انجام می‌شود که در حالت WAL فقط
+    یک تراکنش خواندن است و نوشتن‌ها را مسدود نمی‌کند. با verify کپی با
+    PRAGMA quick_check بررسی می‌شود.
+
+    خروجی: تعداد صفحه‌های دیتابیس
+    """
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] >= max_restarts:
+                raise _TooManyRestarts()
+        state["remaining"] = remaining
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _TooManyRestarts:
+            logger.info(f"🔁 کپی مرحله‌ای {state['restarts']} بار از اول شروع شد؛ ادامه در یک مرحله")
+            source.backup(target, pages=-1)
+
+        if verify:
+            problems = [row[0] for row in target.execute("PRAGMA quick_check") if row[0] != "ok"]
+            if problems:
+                raise sqlite3.DatabaseError(f"پشتیبان سالم نیست: {problems[:5]}")
+        return target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        source.close()
+        target.close()
+
+
+def compress(source_path: str, target_path: str, compression: str):
+    """فشرده‌سازی تکه به تکه فایل (بدون بارگذاری کامل در حافظه)"""
+    _, opener = COMPRESSORS[compression]
+    with open(source_path, "rb") as source, opener(target_path, "wb") as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+def list_backups(db_path: str = DATABASE_NAME, backup_dir: str = BACKUP_DIR):
+    """فایل‌های پشتیبان یک دیتابیس، از جدید به قدیم"""
+    # "" یعنی پوشه جاری (مثلاً os.path.dirname برای دیتابیس کنار اسکریپت)
+    backup_dir = backup_dir or "."
+    if not os.path.isdir(backup_dir):
+        return []
+    prefix = f"{os.path.splitext(os.path.basename(db_path))[0]}_backup_"
+    suffixes = tuple(f".db{ext}" for ext, _ in COMPRESSORS.values())
+    names = [name for name in os.listdir(backup_dir) if name.startswith(prefix) and name.endswith(suffixes)]
+    paths = [os.path.join(backup_dir, name) for name in names]
+
+    def age(path):
+        # زمان داخل نام فایل (%Y%m%d_%H%M%S_%f، یا بدون _%f در پشتیبان‌های
+        # قدیمی)؛ در صورت برابری زمان تغییر فایل
+        return os.path.basename(path)[len(prefix):].split(".")[0], os.path.getmtime(path)
+
+    return sorted(paths, key=age, reverse=True)
+
+
+def prune_backups(db_path: str = DATABASE_NAME, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> int:
+    """حذف پشتیبان‌های قدیمی‌تر از keep فایل آخر؛ خروجی: تعداد حذف شده"""
+    backup_dir = backup_dir or "."
+    removed = 0
+    for path in list_backups(db_path, backup_dir)[keep:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"⚠️ حذف پشتیبان قدیمی {path} ممکن نشد: {e}")
+    return removed
+
+
+def create_backup(db_path: str = DATABASE_NAME, backup_dir: str = BACKUP_DIR,
+                  compression: str = BACKUP_COMPRESSION, keep: int = BACKUP_KEEP,
+                  pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP,
+                  verify: bool = True):
+    """
+    ایجاد پشتیبان فشرده و اعمال سیاست نگهداری
+
+    compression یکی از "gzip"، "lzma" یا "" است و keep=None یعنی هیچ
+    پشتیبانی حذف نشود. verify=False برای پشتیبان از دیتابیس خراب (قبل از
+    تعمیر) است. فایل نهایی فقط بعد از کامل شدن با os.replace ساخته
+    می‌شود، پس فایل نیمه‌کاره هیچ‌وقت با نام پشتیبان دیده نمی‌شود.
+
+    خروجی: مسیر فایل پشتیبان یا None در صورت خطا
+    """
+    compression = (compression or "").lower()
+    if compression == "none":
+        compression = ""
+    if compression not in COMPRESSORS:
+        logger.error(f"❌ نوع فشرده‌سازی نامعتبر: {compression}")
+        return None
+    if not os.path.exists(db_path):
+        logger.error(f"❌ فایل دیتابیس {db_path} پیدا نشد")
+        return None
+
+    backup_dir = backup_dir or "."
+    with _backup_lock:
+        os.makedirs(backup_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        stem = os.path.splitext(os.path.basename(db_path))[0]
+        base_path = os.path.join(backup_dir, f"{stem}_backup_{timestamp}.db")
+        extension, _ = COMPRESSORS[compression]
+        final_path = base_path + extension
+        snapshot_path = f"{base_path}.snapshot"
+        partial_path = f"{final_path}.part"
+
+        # باقی‌مانده یک اجرای قطع شده
+        _remove(snapshot_path, partial_path)
+
+        started = time.perf_counter()
+        try:
+            page_count = snapshot(db_path, snapshot_path, pages, sleep, verify=verify)
+            copy_time = time.perf_counter() - started
+            raw_size = os.path.getsize(snapshot_path)
+
+            if compression:
+                compress(snapshot_path, partial_path, compression)
+                os.replace(partial_path, final_path)
+            else:
+                os.replace(snapshot_path, final_path)
+        except Exception as e:
+            logger.error(f"❌ خطا در ایجاد پشتیبان: {e}")
+            return None
+        finally:
+            _remove(snapshot_path, partial_path)
+
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(final_path)
+        logger.info(
+            f"💾 پشتیبان ایجاد شد: {final_path} ({page_count} صفحه، "
+            f"{raw_size / 1024 / 1024:.1f}MB → {size / 1024 / 1024:.1f}MB، "
+            f"کپی {copy_time:.2f} و کل {elapsed:.2f} ثانیه)"
+        )
+
+        if keep is not None:
+            removed = prune_backups(db_path, backup_dir, keep)
+            if removed:
+                logger.info(f"🗑️ {removed} پشتیبان قدیمی حذف شد")
+        return final_path
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="پشتیبان‌گیری آنلاین از دیتابیس")
+    parser.add_argument("db_path", nargs="?", default=DATABASE_NAME)
+    parser.add_argument("--dir", default=BACKUP_DIR, help="پوشه فایل‌های پشتیبان")
+    parser.add_argument("--compression", default=BACKUP_COMPRESSION, choices=["gzip", "lzma", "none", ""])
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="تعداد پشتیبان‌های نگه داشته شده")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    return 0 if create_backup(args.db_path, args.dir, args.compression, args.keep) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
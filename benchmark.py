@@ -0,0 +1,600 @@
+# benchmark.py
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import logging
+
+# ربات‌هایی که بنچمارک import می‌کند (main در webhook_delivery) دیتابیس را
+# هنگام import باز می‌کنند؛ باید قبل از import config مسیر موقت گرفته شود
+# تا league_bot.db در پوشه جاری ساخته یا تغییر داده نشود
+os.environ["DATABASE_NAME"] = os.path.join(tempfile.mkdtemp(prefix="league_bench_"), "league_bot.db")
+
+from database import Database, AsyncDatabase
+
+# لاگ‌های دیتابیس در بنچمارک فقط نویز هستند
+logging.disable(logging.CRITICAL)
+
+
+def percentile(values, pct):
+    """محاسبه صدک از لیست زمان‌ها"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def make_temp_database(**kwargs):
+    """ایجاد دیتابیس موقت روی دیسک (تا هزینه fsync واقعی اندازه‌گیری شود)"""
+    tmp_dir = tempfile.mkdtemp(prefix="league_bench_")
+    return Database(os.path.join(tmp_dir, "bench.db"), **kwargs)
+
+
+# ---------- تاخیر هندلرها زیر بار نوشتن ----------
+
+async def _measure_handlers(db, call, writers=20, readers=200, writes_per_writer=25):
+    """
+    اجرای همزمان هندلرهای نوشتنی (ثبت‌نام)، خواندنی (لیست لیگ‌ها) و
+    هندلرهای بدون دیتابیس (مثل راهنما) و برگرداندن زمان پاسخ آن‌ها
+    """
+    latencies = {"db_read": [], "no_db": []}
+    league_id = db.create_league("لیگ بنچمارک", writers * writes_per_writer)
+
+    async def writer(index):
+        for n in range(writes_per_writer):
+            await call("register_user", f"{index}-{n}", f"player{index}-{n}", league_id)
+
+    async def reader(start):
+        await call("get_active_leagues")
+        latencies["db_read"].append(time.perf_counter() - start)
+
+    async def no_db_handler(start):
+        await asyncio.sleep(0)
+        latencies["no_db"].append(time.perf_counter() - start)
+
+    async def spaced_readers():
+        tasks = []
+        for i in range(readers):
+            # زمان از لحظه رسیدن آپدیت حساب می‌شود، نه از شروع اجرای هندلر
+            handler = reader if i % 2 == 0 else no_db_handler
+            tasks.append(asyncio.create_task(handler(time.perf_counter())))
+            await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(spaced_readers(), *(writer(i) for i in range(writers)))
+    return latencies
+
+
+async def bench_handler_latency():
+    """مقایسه p99 تاخیر هندلرها: فراخوانی مستقیم Database در برابر AsyncDatabase"""
+    db = make_temp_database()
+
+    async def call_sync(name, *args):
+        # رفتار قبلی: اجرای کوئری مستقیم روی حلقه رویداد
+        await asyncio.sleep(0)
+        return getattr(db, name)(*args)
+
+    before = await _measure_handlers(db, call_sync)
+    db.close()
+
+    adb = AsyncDatabase(make_temp_database())
+
+    async def call_async(name, *args):
+        return await getattr(adb, name)(*args)
+
+    after = await _measure_handlers(adb.db, call_async)
+    await adb.close()
+
+    for title, result in (("sync (قبل)", before), ("async (بعد)", after)):
+        for kind, latencies in result.items():
+            print(
+                f"  {title:12} {kind:8} p50={percentile(latencies, 50) * 1000:7.2f}ms "
+                f"p99={percentile(latencies, 99) * 1000:7.2f}ms"
+            )
+
+
+# ---------- رقابت ثبت‌نام روی یک لیگ ----------
+
+def _legacy_register(db, user_id, username, league_id):
+    """مسیر قدیمی ثبت‌نام: چهار دستور جدا بدون تراکنش مشترک"""
+    league = db.get_league(league_id)
+    if not league or league[3] != 1:
+        return False
+    if db.get_league_user_count(league_id) >= league[2]:
+        return False
+    if db.is_user_in_league(user_id, league_id):
+        return False
+    db._execute_query(
+        "INSERT INTO users (user_id, username, league_id) VALUES (?, ?, ?)",
+        (str(user_id), username, league_id),
+        commit=True
+    )
+    return True
+
+
+def bench_registration_race(threads=32, attempts_per_thread=20, capacity=50):
+    """
+    حمله همزمان چند رشته به یک لیگ و بررسی اینکه ظرفیت هرگز رد نمی‌شود
+    """
+    db = make_temp_database()
+
+    def hammer(register):
+        league_id = db.create_league("لیگ پرطرفدار", capacity)
+        barrier = threading.Barrier(threads)
+
+        def worker(index):
+            barrier.wait()
+            for n in range(attempts_per_thread):
+                try:
+                    register(f"{index}-{n}", f"player{index}-{n}", league_id)
+                except Exception:
+                    pass
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return db.get_league_user_count(league_id), time.perf_counter() - start
+
+    legacy_count, legacy_time = hammer(lambda *args: _legacy_register(db, *args))
+    atomic_count, atomic_time = hammer(db.try_register_user)
+    db.close()
+
+    print(f"  legacy  {legacy_count}/{capacity} ثبت‌نام در {legacy_time:.2f}s")
+    print(f"  atomic  {atomic_count}/{capacity} ثبت‌نام در {atomic_time:.2f}s")
+    assert atomic_count <= capacity, "ظرفیت لیگ رد شد!"
+
+
+# ---------- group commit ----------
+
+def bench_group_commit(writer_counts=(1, 10, 100), duration=2.0):
+    """
+    ثبت‌نام در ثانیه با 1، 10 و 100 نویسنده همزمان: commit جدا برای هر
+    نوشتن در برابر group commit
+    """
+    for group_commit in (False, True):
+        title = "group" if group_commit else "single"
+        for writers in writer_counts:
+            db = make_temp_database(group_commit=group_commit)
+            league_id = db.create_league("لیگ بنچمارک", 10 ** 9)
+            stop_at = time.perf_counter() + duration
+            counts = [0] * writers
+            barrier = threading.Barrier(writers)
+
+            def worker(index):
+                barrier.wait()
+                n = 0
+                while time.perf_counter() < stop_at:
+                    db.register_user(f"{index}-{n}", f"player{index}-{n}", league_id)
+                    n += 1
+                counts[index] = n
+
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(writers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            registered = db.get_league_user_count(league_id)
+            batches = db.committer.batches if db.committer else registered
+            db.close()
+            assert registered == sum(counts), "ثبت‌نامی از دست رفت!"
+            print(
+                f"  {title:6} writers={writers:3} {registered / duration:8.0f} ثبت‌نام/ثانیه "
+                f"({registered / max(batches, 1):.1f} نوشتن در هر commit)"
+            )
+
+    # همان بار از طریق AsyncDatabase (مسیر ربات‌ها) با thread pool پیش‌فرض
+    for group_commit in (False, True):
+        title = "group" if group_commit else "single"
+        for writers in writer_counts:
+            db = make_temp_database(group_commit=group_commit)
+            adb = AsyncDatabase(db)
+            league_id = db.create_league("لیگ بنچمارک", 10 ** 9)
+            peak_threads = [threading.active_count()]
+
+            async def run():
+                stop_at = time.perf_counter() + duration
+
+                async def worker(index):
+                    n = 0
+                    while time.perf_counter() < stop_at:
+                        await adb.register_user(f"{index}-{n}", f"player{index}-{n}", league_id)
+                        peak_threads[0] = max(peak_threads[0], threading.active_count())
+                        n += 1
+
+                await asyncio.gather(*(worker(i) for i in range(writers)))
+
+            asyncio.run(run())
+            registered = db.get_league_user_count(league_id)
+            batches = db.committer.batches if db.committer else registered
+            asyncio.run(adb.close())
+            print(
+                f"  async {title:6} writers={writers:3} {registered / duration:8.0f} ثبت‌نام/ثانیه "
+                f"({registered / max(batches, 1):.1f} نوشتن در هر commit، {peak_threads[0]} رشته)"
+            )
+
+
+# ---------- لیست لیگ‌های فعال ----------
+
+def count_queries(db, func, repeat):
+    """اجرای تابع و برگرداندن (زمان هر اجرا، تعداد کوئری هر اجرا)"""
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+    db.conn.set_trace_callback(None)
+    return elapsed, len(statements) // repeat
+
+
+def bench_active_leagues(leagues=200, repeat=50):
+    """لیست لیگ‌های فعال کاربر با ۲۰۰ لیگ فعال: مسیر قدیمی 2N+2 کوئری در برابر یک کوئری"""
+    db = make_temp_database()
+    user_id = 42
+    for i in range(leagues):
+        league_id = db.create_league(f"لیگ {i}", 100)
+        if i % 10 == 0:
+            db.register_user(user_id, "player", league_id)
+
+    def legacy():
+        rows = []
+        user_league_ids = [league[0] for league in db.get_user_leagues(user_id)]
+        for league_id, name in db.get_active_leagues():
+            count = db.get_league_user_count(league_id)
+            capacity = db.get_league(league_id)[2]
+            rows.append((league_id, name, capacity, count, league_id in user_league_ids))
+        return rows
+
+    def single_query():
+        return db.get_active_leagues_for_user(user_id)
+
+    assert [tuple(r) for r in legacy()] == [(r[0], r[1], r[2], r[3], bool(r[4])) for r in single_query()]
+    for title, func in (("legacy", legacy), ("single", single_query)):
+        elapsed, queries = count_queries(db, func, repeat)
+        print(f"  {title:7} {queries:4} کوئری  {elapsed * 1000:7.2f}ms")
+    db.close()
+
+
+# ---------- نوع ستون user_id ----------
+
+def _users_storage(conn):
+    """حجم جدول users و هر ایندکس آن به مگابایت (ایندکس UNIQUE با نام "unique")"""
+    rows = conn.execute('''
+        SELECT m.type, m.name, SUM(s.pgsize)
+        FROM dbstat s JOIN sqlite_master m ON m.name = s.name
+        WHERE m.tbl_name = 'users'
+        GROUP BY m.name
+    ''').fetchall()
+    return {
+        "table" if kind == "table" else "unique" if name.startswith("sqlite_autoindex") else name: size / 2 ** 20
+        for kind, name, size in rows
+    }
+
+
+def _lookup_time(conn, keys, column_type, repeat=5):
+    """
+    زمان هر جستجوی (user_id, league_id) روی ایندکس UNIQUE به میکروثانیه
+
+    جستجوها داخل یک کوئری (join با جدول کلیدها) اجرا می‌شوند تا سربار
+    فراخوانی پایتون که چند برابر خود جستجوست در عدد دیده نشود؛ بهترین
+    زمان از چند تکرار گزارش می‌شود.
+    """
+    conn.execute(f"CREATE TEMP TABLE lookup_keys (user_id {column_type}, league_id INTEGER)")
+    conn.executemany("INSERT INTO lookup_keys VALUES (?, ?)", keys)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = conn.execute('''
+            SELECT COUNT(*) FROM lookup_keys k
+            CROSS JOIN users u ON u.user_id = k.user_id AND u.league_id = k.league_id
+        ''').fetchone()[0]
+        best = min(best, time.perf_counter() - start)
+    assert found == len(keys), "جستجو ردیف‌ها را پیدا نکرد"
+    return best / len(keys) * 1e6
+
+
+def bench_user_id_storage(rows=1_000_000, leagues=1000, lookups=50_000):
+    """
+    حجم ایندکس‌ها و سرعت جستجو روی یک میلیون ردیف: user_id متنی در برابر
+    INTEGER (بعد از مهاجرت خودکار هنگام ساخت Database)
+    """
+    import random
+    import sqlite3
+
+    tmp_dir = tempfile.mkdtemp(prefix="league_bench_")
+    path = os.path.join(tmp_dir, "bench.db")
+
+    # ساختار قدیمی با user_id متنی (user_version = 0)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE leagues (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, capacity INTEGER NOT NULL,
+            is_active INTEGER DEFAULT 1, created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            participant_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, username TEXT,
+            league_id INTEGER NOT NULL, joined_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (league_id) REFERENCES leagues(id) ON DELETE CASCADE,
+            UNIQUE(user_id, league_id)
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_users_league ON users(league_id, id, user_id, username)")
+    conn.executemany("INSERT INTO leagues (name, capacity) VALUES (?, ?)",
+                     [(f"لیگ {i}", rows) for i in range(leagues)])
+    base = 5_000_000_000
+    conn.executemany(
+        "INSERT INTO users (user_id, username, league_id) VALUES (?, ?, ?)",
+        ((str(base + i * 7919), f"player{i}", i % leagues + 1) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+    rng = random.Random(1)
+    keys = [(base + i * 7919, i % leagues + 1) for i in (rng.randrange(rows) for _ in range(lookups))]
+
+    def measure(column_type):
+        conn = sqlite3.connect(path)
+        conn.execute("VACUUM")
+        result = (column_type, _users_storage(conn), _lookup_time(conn, keys, column_type))
+        conn.close()
+        return result
+
+    results = [measure("TEXT")]
+    start = time.perf_counter()
+    Database(path).close()
+    migration_time = time.perf_counter() - start
+    results.append(measure("INTEGER"))
+
+    for column_type, sizes, lookup_us in results:
+        storage = "  ".join(f"{name}={size:5.1f}MB" for name, size in sorted(sizes.items()))
+        print(f"  {column_type:8} {storage}  جستجو={lookup_us:5.2f}µs")
+    print(f"  راه‌اندازی Database با مهاجرت: {migration_time:.1f}s")
+
+
+# ---------- تحویل آپدیت با وبهوک (سرتاسری با Bot API جعلی) ----------
+
+def _fake_api_result(method, payload, chat_id):
+    """پاسخ حداقلی Bot API برای متدهایی که ربات‌ها صدا می‌زنند"""
+    user = {"id": int(payload.get("user_id") or chat_id or 1), "is_bot": False, "first_name": "user"}
+    if method == "getchatmember":
+        return {"status": "member", "user": user}
+    if method in ("sendmessage", "editmessagetext"):
+        return {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": payload.get("text", ""),
+        }
+    return True
+
+
+def _fake_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "user"},
+            "text": text,
+        },
+    }
+
+
+async def bench_webhook_delivery(updates=500, secret="bench-secret"):
+    """
+    ارسال آپدیت به سرور وبهوک ربات اصلی و اندازه‌گیری زمان تا رسیدن
+    پاسخ (sendMessage) به سرور Bot API جعلی
+    """
+    from aiohttp import web, ClientSession
+    from aiogram import Bot
+    from bot_session import create_session
+    import main
+    import webhook
+
+    sent_at = {}
+    latencies = []
+    done = asyncio.Event()
+
+    async def fake_api(request):
+        method = request.match_info["method"].lower()
+        payload = dict(await request.post())
+        chat_id = payload.get("chat_id")
+        if method == "sendmessage" and int(chat_id) in sent_at:
+            latencies.append(time.perf_counter() - sent_at.pop(int(chat_id)))
+            if not sent_at:
+                done.set()
+        return web.json_response({"ok": True, "result": _fake_api_result(method, payload, chat_id)})
+
+    api_app = web.Application()
+    api_app.router.add_post("/bot{token}/{method}", fake_api)
+    api_runner = web.AppRunner(api_app)
+    await api_runner.setup()
+    await web.TCPSite(api_runner, "127.0.0.1", 8181).start()
+
+    bot = Bot(token="1:bench", session=create_session("http://127.0.0.1:8181"))
+    hook_app = webhook.build_app([(main.dp, bot, "/webhook/main")], secret_token=secret)
+    hook_runner = web.AppRunner(hook_app)
+    await hook_runner.setup()
+    await web.TCPSite(hook_runner, "127.0.0.1", 8182).start()
+
+    url = "http://127.0.0.1:8182/webhook/main"
+    async with ClientSession() as client:
+        async with client.post(url, json=_fake_update(0, 1, "ℹ️ راهنما")) as response:
+            rejected = response.status
+
+        start = time.perf_counter()
+        for i in range(1, updates + 1):
+            chat_id = 10_000 + i
+            sent_at[chat_id] = time.perf_counter()
+            text = "/start" if i % 2 else "ℹ️ راهنما"
+            await client.post(url, json=_fake_update(i, chat_id, text),
+                              headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+        await asyncio.wait_for(done.wait(), timeout=60)
+        elapsed = time.perf_counter() - start
+
+    await hook_runner.cleanup()
+    await api_runner.cleanup()
+    await bot.session.close()
+
+    print(f"  بدون توکن مخفی: HTTP {rejected}")
+    print(
+        f"  {updates} آپدیت در {elapsed:.2f}s ({updates / elapsed:.0f}/s) "
+        f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms"
+    )
+
+
+# ---------- تاخیر صف ارسال (outbox) ----------
+
+class _FakeBot:
+    id = 1
+
+
+class SendMessage:
+    """متد جعلی با نام و chat_id مثل متدهای aiogram"""
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+
+
+async def _fake_request(bot, method):
+    await asyncio.sleep(0.005)
+    return True
+
+
+async def bench_outbox_latency(broadcast_size=300, interactive=20):
+    """
+    تاخیر پاسخ هندلرها در صف ارسال:
+    - چند ارسال پشت سر هم به یک چت (callback + ویرایش، «وضعیت من» با ۶ لیگ)
+    - پاسخ هندلرها در حالی که یک پیام گروهی در حال ارسال است
+    "fixed" همان رفتار قبلی است: فاصله ثابت بین پیام‌های یک چت و بدون اولویت.
+    """
+    from outbox import OutboxMiddleware
+    from config import BROADCAST_CONCURRENCY
+
+    variants = {"fixed": dict(chat_burst=1, reserve=0), "bucket": {}}
+    for title, kwargs in variants.items():
+        for calls in (2, 6):
+            outbox = OutboxMiddleware(**kwargs)
+            start = time.perf_counter()
+            for _ in range(calls):
+                await outbox(_fake_request, _FakeBot, SendMessage(42))
+            print(f"  {title:6} {calls} ارسال به یک چت: {(time.perf_counter() - start) * 1000:7.0f}ms")
+
+    for title, kwargs in variants.items():
+        outbox = OutboxMiddleware(**kwargs)
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        latencies = []
+
+        async def broadcast_one(chat_id):
+            async with semaphore:
+                if title == "fixed":
+                    await outbox(_fake_request, _FakeBot, SendMessage(chat_id))
+                else:
+                    with outbox.bulk():
+                        await outbox(_fake_request, _FakeBot, SendMessage(chat_id))
+
+        async def handler(chat_id):
+            start = time.perf_counter()
+            await outbox(_fake_request, _FakeBot, SendMessage(chat_id))
+            latencies.append(time.perf_counter() - start)
+
+        broadcast = asyncio.gather(*(broadcast_one(100_000 + i) for i in range(broadcast_size)))
+        handlers = []
+        for i in range(interactive):
+            await asyncio.sleep(0.2)
+            handlers.append(asyncio.create_task(handler(i + 1)))
+        await asyncio.gather(*handlers)
+        await broadcast
+        print(
+            f"  {title:6} پاسخ هندلر حین پیام گروهی: p50={percentile(latencies, 50) * 1000:.0f}ms "
+            f"p99={percentile(latencies, 99) * 1000:.0f}ms"
+        )
+
+
+# ---------- مسیریابی callback‌های ربات ادمین ----------
+
+# فیلترهای قبلی ربات ادمین به ترتیب ثبت (aiogram آن‌ها را یکی‌یکی بررسی می‌کرد)
+LEGACY_CALLBACK_FILTERS = [
+    ("==", "list_leagues_persistent"), ("==", "hall_of_fame_persistent"),
+    ("==", "create_league_persistent"), ("==", "refresh_admin_panel"),
+    ("==", "back_to_admin_menu_persistent"), ("==", "refresh_hall_of_fame"),
+    ("==", "add_new_champion"), ("==", "show_stats_persistent"),
+    ("startswith", "list_leagues_page_"), ("startswith", "admin_league_"),
+    ("startswith", "toggle_"), ("startswith", "broadcast_"),
+    ("startswith", "confirm_broadcast_"), ("startswith", "view_users_"),
+    ("startswith", "edit_user_"), ("startswith", "change_username_"),
+    ("startswith", "delete_user_"), ("startswith", "confirm_delete_user_"),
+    ("startswith", "add_user_"), ("startswith", "set_champion_"),
+    ("startswith", "edit_champion_"), ("startswith", "remove_champion_"),
+    ("startswith", "confirm_remove_champion_"), ("startswith", "delete_league_"),
+    ("startswith", "confirm_delete_league_"),
+]
+
+
+def bench_callback_routing(repeat=20000):
+    """هزینه مسیریابی هر callback: زنجیره فیلترهای F.data در برابر جدول CallbackRouter"""
+    from types import SimpleNamespace
+    from aiogram import F
+    import admin_bot
+
+    legacy_chain = [
+        F.data == value if kind == "==" else F.data.startswith(value)
+        for kind, value in LEGACY_CALLBACK_FILTERS
+    ]
+
+    def legacy_route(callback):
+        for magic in legacy_chain:
+            if magic.resolve(callback):
+                # هر هندلر دوباره callback data را split می‌کرد
+                return int(callback.data.split('_')[-1]) if callback.data[-1].isdigit() else None
+        return None
+
+    def table_route(callback):
+        return admin_bot.callbacks.resolve(callback.data)
+
+    samples = {
+        "اول زنجیره": ("list_leagues_persistent", "list_leagues_persistent"),
+        "وسط زنجیره": ("edit_user_12_123456789", "edit_user:12:123456789"),
+        "آخر زنجیره": ("confirm_delete_league_12", "confirm_delete_league:12"),
+    }
+    for title, (legacy_data, table_data) in samples.items():
+        for name, route, data in (("legacy", legacy_route, legacy_data), ("table", table_route, table_data)):
+            callback = SimpleNamespace(data=data)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                route(callback)
+            per_call = (time.perf_counter() - start) / repeat
+            print(f"  {title:12} {name:7} {per_call * 1e6:7.2f}µs")
+
+
+BENCHMARKS = {
+    "handler_latency": bench_handler_latency,
+    "registration_race": bench_registration_race,
+    "group_commit": bench_group_commit,
+    "active_leagues": bench_active_leagues,
+    "user_id_storage": bench_user_id_storage,
+    "webhook_delivery": bench_webhook_delivery,
+    "outbox_latency": bench_outbox_latency,
+    "callback_routing": bench_callback_routing,
+}
+
+
+if __name__ == "__main__":
+    import sys
+
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"📈 {name}")
+        result = BENCHMARKS[name]()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
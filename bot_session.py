@@ -0,0 +1,39 @@
+# bot_session.py
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import TELEGRAM_API_SERVER
+from outbox import outbox
+
+
+def create_session(api_server: str = TELEGRAM_API_SERVER) -> AiohttpSession:
+    """
+    ساخت session برای Bot
+
+    اگر api_server داده شود درخواست‌ها به جای سرور رسمی تلگرام به آن
+    آدرس فرستاده می‌شوند (سرور محلی Bot API یا سرور fake برای تست).
+    تمام ارسال‌ها از زمان‌بند مشترک outbox عبور می‌کنند.
+    """
+    if api_server:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_server))
+    else:
+        session = AiohttpSession()
+    session.middleware(outbox)
+    return session
+
+
+_shared_session = None
+
+
+def get_shared_session() -> AiohttpSession:
+    """
+    session مشترک تمام ربات‌های این پروسه
+
+    یک connector و یک استخر اتصال HTTP برای هر دو ربات؛ توکن هر ربات در
+    آدرس درخواست است، پس اشتراک session مشکلی ندارد. بستن آن با اجراکننده
+    (run.py یا build_app در webhook.py) یا start_polling ربات است.
+    """
+    global _shared_session
+    if _shared_session is None:
+        _shared_session = create_session()
+    return _shared_session
@@ -0,0 +1,166 @@
+# broadcast.py
+import time
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from config import (
+    BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE, BROADCAST_PROGRESS_INTERVAL,
+    BROADCAST_RETRY_ATTEMPTS, BROADCAST_RETRY_BACKOFF
+)
+from outbox import outbox
+
+logger = logging.getLogger(__name__)
+
+# پیام‌های گروهی در حال اجرا: broadcast_id -> task
+running_broadcasts = {}
+
+
+def progress_text(league_name: str, total: int, sent: int, failed: int, finished: bool = False) -> str:
+    """متن گزارش پیشرفت پیام گروهی برای ادمین"""
+    header = "✅ ارسال پیام گروهی تمام شد" if finished else "📣 در حال ارسال پیام گروهی..."
+    return (
+        f"{header}\n\n"
+        f"🏆 لیگ: {league_name}\n"
+        f"📨 ارسال شده: {sent}/{total}\n"
+        f"⚠️ ناموفق: {failed}"
+    )
+
+
+async def _send_one(sender: Bot, user_id, text: str, semaphore: asyncio.Semaphore) -> bool:
+    """ارسال پیام به یک کاربر؛ خروجی: موفق بودن"""
+    async with semaphore:
+        try:
+            # کم‌اولویت تا پاسخ هندلرها پشت پیام گروهی صف نکشند
+            with outbox.bulk():
+                await sender.send_message(chat_id=int(user_id), text=text)
+            return True
+        except (ValueError, TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter) as e:
+            # کاربر ربات را بلاک کرده، آیدی نامعتبر است یا تلاش‌های صف ارسال تمام شد
+            logger.warning(f"⚠️ ارسال پیام گروهی به کاربر {user_id} ناموفق بود: {e}")
+            return False
+
+
+async def _report(reporter: Bot, broadcast, text: str):
+    """ویرایش پیام پیشرفت ادمین؛ خطاها فقط لاگ می‌شوند"""
+    _, _, _, admin_chat_id, progress_message_id = broadcast[:5]
+    if not progress_message_id:
+        return
+    try:
+        await reporter.edit_message_text(text, chat_id=admin_chat_id, message_id=progress_message_id)
+    except TelegramBadRequest as e:
+        # "message is not modified" و پیام‌های حذف شده مهم نیستند
+        logger.debug(f"ویرایش پیام پیشرفت ناموفق بود: {e}")
+
+
+async def _run(db, broadcast_id: int, sender: Bot, reporter: Bot):
+    """ارسال از آخرین cursor ذخیره شده تا پایان گیرندگان"""
+    broadcast = await db.get_broadcast(broadcast_id)
+    if not broadcast or broadcast[9] != 'running':
+        return
+
+    _, league_id, text, _, _, cursor, total, sent, failed, _ = broadcast
+    league = await db.get_league(league_id)
+    league_name = league[1] if league else str(league_id)
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    last_report = 0.0
+
+    try:
+        while True:
+            recipients = await db.get_broadcast_recipients(league_id, after_id=cursor, limit=BROADCAST_BATCH_SIZE)
+            if not recipients:
+                break
+
+            results = await asyncio.gather(
+                *(_send_one(sender, user_id, text, semaphore) for _, user_id in recipients)
+            )
+            batch_sent = sum(results)
+            batch_failed = len(results) - batch_sent
+            if not await db.advance_broadcast(broadcast_id, recipients[-1][0], batch_sent, batch_failed):
+                raise RuntimeError(f"ثبت پیشرفت در cursor={recipients[-1][0]} ناموفق بود")
+            cursor = recipients[-1][0]
+            sent += batch_sent
+            failed += batch_failed
+
+            if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await _report(reporter, broadcast, progress_text(league_name, total, sent, failed))
+
+        if not await db.finish_broadcast(broadcast_id):
+            raise RuntimeError("ثبت پایان پیام گروهی ناموفق بود")
+        await _report(reporter, broadcast, progress_text(league_name, total, sent, failed, finished=True))
+        logger.info(f"✅ پیام گروهی {broadcast_id} تمام شد: {sent} ارسال، {failed} ناموفق")
+    except asyncio.CancelledError:
+        # خاموش شدن ربات؛ وضعیت running می‌ماند تا در راه‌اندازی بعدی ادامه یابد
+        logger.info(f"⏸️ پیام گروهی {broadcast_id} در cursor={cursor} متوقف شد")
+        raise
+
+
+async def run_broadcast(db, broadcast_id: int, sender: Bot, reporter: Bot,
+                        attempts: int = BROADCAST_RETRY_ATTEMPTS, backoff: float = BROADCAST_RETRY_BACKOFF):
+    """
+    اجرای پیام گروهی از آخرین cursor ذخیره شده
+
+    گیرندگان دسته‌دسته خوانده می‌شوند و بعد از هر دسته cursor در دیتابیس
+    ثبت می‌شود؛ بعد از crash حداکثر یک دسته دوباره ارسال می‌شود.
+    محدودیت نرخ تلگرام توسط صف ارسال (outbox) رعایت می‌شود و ارسال‌ها در
+    آن بعد از پاسخ هندلرها قرار می‌گیرند.
+
+    بعد از خطای غیرمنتظره ارسال با تاخیر افزایشی از آخرین cursor ادامه
+    می‌یابد؛ اگر تلاش‌ها تمام شوند وضعیت failed ثبت و به ادمین اطلاع
+    داده می‌شود.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await _run(db, broadcast_id, sender, reporter)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ خطا در اجرای پیام گروهی {broadcast_id} (تلاش {attempt}/{attempts}): {e}")
+            if attempt < attempts:
+                await asyncio.sleep(backoff * 2 ** (attempt - 1))
+
+    await db.finish_broadcast(broadcast_id, 'failed')
+    broadcast = await db.get_broadcast(broadcast_id)
+    if broadcast:
+        league = await db.get_league(broadcast[1])
+        league_name = league[1] if league else str(broadcast[1])
+        await _report(
+            reporter, broadcast,
+            progress_text(league_name, broadcast[6], broadcast[7], broadcast[8])
+            + "\n\n❌ ارسال به دلیل خطا متوقف شد."
+        )
+
+
+def start_broadcast(db, broadcast_id: int, sender: Bot, reporter: Bot) -> asyncio.Task:
+    """اجرای پیام گروهی در پس‌زمینه بدون مسدود کردن هندلرها"""
+    task = asyncio.create_task(run_broadcast(db, broadcast_id, sender, reporter))
+    running_broadcasts[broadcast_id] = task
+    task.add_done_callback(lambda _: running_broadcasts.pop(broadcast_id, None))
+    return task
+
+
+async def resume_broadcasts(db, sender: Bot, reporter: Bot) -> int:
+    """ادامه پیام‌های گروهی نیمه‌تمام بعد از راه‌اندازی مجدد"""
+    broadcast_ids = await db.get_running_broadcasts()
+    for broadcast_id in broadcast_ids:
+        if broadcast_id not in running_broadcasts:
+            start_broadcast(db, broadcast_id, sender, reporter)
+    if broadcast_ids:
+        logger.info(f"▶️ {len(broadcast_ids)} پیام گروهی نیمه‌تمام ادامه یافت")
+    return len(broadcast_ids)
+
+
+async def cancel_broadcasts():
+    """
+    توقف تمام پیام‌های گروهی در حال اجرا (هنگام خاموش شدن)
+
+    تا تمام شدن taskها صبر می‌شود تا هیچ دسته‌ای بعد از بستن دیتابیس
+    چیزی ننویسد.
+    """
+    tasks = list(running_broadcasts.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
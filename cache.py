@@ -0,0 +1,93 @@
+# cache.py
+import time
+import threading
+import weakref
+from collections import OrderedDict
+
+# کش‌های نام‌دار برای گزارش آمار در پنل ادمین
+_registry = weakref.WeakValueDictionary()
+
+
+class LRUCache:
+    """
+    کش درون‌حافظه‌ای با اندازه محدود و حذف قدیمی‌ترین استفاده (LRU)
+
+    امن برای استفاده از چند رشته. هر مدخل می‌تواند TTL جداگانه داشته باشد.
+    شمارنده‌های hit/miss برای گزارش دارد و با enabled = False کاملاً
+    غیرفعال می‌شود (مثلاً در تست‌ها).
+    """
+
+    def __init__(self, maxsize: int = 1024, enabled: bool = True, ttl: float = None, name: str = None):
+        self.maxsize = maxsize
+        self.enabled = enabled and maxsize > 0
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        if name:
+            _registry[name] = self
+
+    def generation(self) -> int:
+        """
+        شماره نسل فعلی کش
+
+        قبل از خواندن از دیتابیس گرفته و به set داده می‌شود تا اگر در این
+        فاصله invalidate شده باشد، مقدار قدیمی در کش ننشیند.
+        """
+        return self._generation
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, generation: int = None, ttl: float = None):
+        if not self.enabled:
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """آمار کش: hits، misses، اندازه و نرخ hit"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+def all_cache_stats() -> dict:
+    """آمار تمام کش‌های نام‌دار فعال در این پروسه"""
+    return {name: cache.stats() for name, cache in list(_registry.items())}
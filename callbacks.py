@@ -0,0 +1,66 @@
+# callbacks.py
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# جداکننده بخش‌های callback data: "action:arg1:arg2"
+SEPARATOR = ":"
+
+
+class CallbackRouter:
+    """
+    مسیریابی callback query با جدول دیکشنری
+
+    به جای بررسی تک‌تک فیلترهای F.data.startswith، نام عملیات (بخش اول
+    callback data) مستقیماً در دیکشنری پیدا و آرگومان‌ها یک بار با
+    تبدیل‌کننده‌های ثبت شده (int، str، ...) تبدیل می‌شوند. آخرین
+    آرگومان می‌تواند خودش شامل جداکننده باشد.
+    """
+
+    def __init__(self):
+        self.routes = {}
+
+    def route(self, action: str, *converters):
+        """ثبت هندلر برای action؛ هندلر (callback, *args) و در صورت نیاز state می‌گیرد"""
+        def decorator(handler):
+            wants_state = "state" in inspect.signature(handler).parameters
+            self.routes[action] = (handler, converters, wants_state)
+            return handler
+        return decorator
+
+    def resolve(self, data: str):
+        """
+        پیدا کردن هندلر و تبدیل آرگومان‌ها
+
+        خروجی: (handler, args, wants_state) یا None اگر عملیات ناشناخته یا
+        آرگومان‌ها نامعتبر باشند
+        """
+        action, _, rest = data.partition(SEPARATOR)
+        route = self.routes.get(action)
+        if route is None:
+            return None
+
+        handler, converters, wants_state = route
+        raw_args = rest.split(SEPARATOR, len(converters) - 1) if converters else []
+        if len(raw_args) != len(converters):
+            return None
+        try:
+            args = tuple(convert(value) for convert, value in zip(converters, raw_args))
+        except ValueError:
+            return None
+        return handler, args, wants_state
+
+    async def dispatch(self, callback, state=None) -> bool:
+        """اجرای هندلر مربوط به callback؛ خروجی: False اگر هندلری پیدا نشد"""
+        resolved = self.resolve(callback.data or "")
+        if resolved is None:
+            logger.warning(f"⚠️ callback ناشناخته: {callback.data!r}")
+            return False
+
+        handler, args, wants_state = resolved
+        if wants_state:
+            await handler(callback, *args, state=state)
+        else:
+            await handler(callback, *args)
+        return True
@@ -5,11 +5,128 @@ import os
 MAIN_BOT_TOKEN = "8576067194:AAG5oDm36usAlejs7tmcz_l1Q0BO0wfKrsM"
 ADMIN_BOT_TOKEN = "8217262807:AAHo_yr29qCzk5T1sNIGTRHsio8_BZ_MTTQ"
 
+# آدرس سرور Bot API (خالی = سرور رسمی تلگرام؛ برای سرور محلی یا fake تست)
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "")
+
 # کانال عضویت
 CHANNEL_USERNAME = "@persin_OSM"
 
+# کش بررسی عضویت (TTL به ثانیه)
+MEMBERSHIP_CACHE_SIZE = 50000
+MEMBERSHIP_TTL_MEMBER = 10 * 60
+MEMBERSHIP_TTL_NON_MEMBER = 30
+
+# آینه عضویت کانال (پر کردن اولیه و بررسی سازگاری با API)
+MEMBERSHIP_API_RATE = 5
+MEMBERSHIP_BACKFILL_BATCH = 500
+MEMBERSHIP_VERIFY_INTERVAL = 60 * 60
+MEMBERSHIP_VERIFY_SAMPLE = 50
+# وضعیت آینه که قدیمی‌تر از این مدت بروزرسانی شده قابل اعتماد نیست و
+# دوباره از API پرسیده می‌شود (ثانیه)؛ آپدیت‌های chat_member ممکن است
+# هنگام قطعی ربات از دست رفته باشند
+MEMBERSHIP_MIRROR_MAX_AGE = 24 * 60 * 60
+
+# محدودیت نرخ درخواست‌های API تلگرام (درخواست در ثانیه)
+TELEGRAM_API_RATE = 25
+TELEGRAM_API_BURST = 30
+# تعداد تلاش پس از خطای RetryAfter و حداکثر زمان انتظار قابل قبول (ثانیه)
+TELEGRAM_RETRY_ATTEMPTS = 3
+TELEGRAM_RETRY_MAX_WAIT = 30
+
+# صف ارسال پیام‌ها: حداکثر پیام در ثانیه برای هر ربات
+OUTBOX_GLOBAL_RATE = 30
+# محدودیت هر چت با سطل توکن: به طور پیوسته یک پیام در هر INTERVAL ثانیه و
+# تا BURST پیام پشت سر هم بدون انتظار (چت خصوصی / گروه و کانال)
+OUTBOX_CHAT_INTERVAL = 1.0
+OUTBOX_CHAT_BURST = 5
+OUTBOX_GROUP_INTERVAL = 3.0
+OUTBOX_GROUP_BURST = 3
+# توکن‌هایی از سهم سراسری که پیام گروهی به لیگ مصرف نمی‌کند تا پاسخ
+# هندلرها پشت آن منتظر نمانند
+OUTBOX_INTERACTIVE_RESERVE = 5
+# تعداد تلاش پس از RetryAfter و پایه تاخیر افزایشی (ثانیه)
+OUTBOX_RETRY_ATTEMPTS = 5
+OUTBOX_RETRY_BACKOFF = 0.5
+
 # رمز عبور ادمین
 ADMIN_PASSWORD = "mamadi@1234"
 
 # تنظیمات دیتابیس
-DATABASE_NAME = "league_bot.db"
\ No newline at end of file
+DATABASE_NAME = os.getenv("DATABASE_NAME", "league_bot.db")
+# تعداد رشته‌های اجرای کوئری برای هندلرهای async
+DB_EXECUTOR_WORKERS = 4
+# حداکثر زمان انتظار برای قفل نوشتن (میلی‌ثانیه)
+DB_BUSY_TIMEOUT_MS = 5000
+# group commit: نوشتن‌های همزمان در یک تراکنش و با یک fsync ثبت می‌شوند
+DB_GROUP_COMMIT = False
+# انتظار اضافه برای جمع کردن نوشتن‌ها قبل از commit (میلی‌ثانیه)؛ با 0 دسته
+# شامل نوشتن‌هایی است که در مدت commit قبلی رسیده‌اند. روی دیسک‌های با fsync
+# کند مقدار چند میلی‌ثانیه دسته‌ها را بزرگ‌تر می‌کند
+DB_GROUP_COMMIT_WINDOW_MS = 0
+# حداکثر تعداد نوشتن در هر commit
+DB_GROUP_COMMIT_MAX_BATCH = 100
+# حداکثر تعداد لیگ‌های نگهداری شده در کش
+LEAGUE_CACHE_SIZE = 512
+# مهاجرت آنلاین: تعداد ردیف در هر تراکنش کپی و مکث بین دسته‌ها (ثانیه)
+MIGRATION_BATCH_SIZE = 5000
+MIGRATION_BATCH_PAUSE = 0.01
+
+# تعداد لیگ‌ها در هر صفحه پنل ادمین
+LEAGUES_PAGE_SIZE = 20
+
+# فاصله شمارش مجدد کامل آمار برای اصلاح انحراف (ثانیه)
+STATS_RECONCILE_INTERVAL = 6 * 60 * 60
+
+# ---------- پشتیبان‌گیری ----------
+# پوشه فایل‌های پشتیبان و فاصله پشتیبان‌گیری خودکار (ثانیه، 0 = غیرفعال)
+BACKUP_DIR = "backups"
+BACKUP_INTERVAL = 6 * 60 * 60
+# تعداد آخرین پشتیبان‌هایی که نگه داشته می‌شوند
+BACKUP_KEEP = 14
+# فشرده‌سازی: "gzip"، "lzma" یا "" (بدون فشرده‌سازی)
+BACKUP_COMPRESSION = "gzip"
+# تعداد صفحه‌های کپی شده در هر مرحله و مکث بین مراحل (ثانیه)
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.01
+# اگر نوشتن‌های ربات‌ها کپی مرحله‌ای را این تعداد بار از اول شروع کنند،
+# بقیه کپی در یک مرحله انجام می‌شود (در حالت WAL نوشتن‌ها را مسدود نمی‌کند)
+BACKUP_MAX_RESTARTS = 3
+# حداکثر حجم فایل قابل ارسال با سرور رسمی Bot API (مگابایت)
+BACKUP_SEND_LIMIT_MB = 50
+
+# ---------- حالت وبهوک ----------
+# آدرس عمومی سرور (مثلاً https://bot.example.com)؛ خالی = وبهوک تنظیم نمی‌شود
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAIN_PATH = "/webhook/main"
+WEBHOOK_ADMIN_PATH = "/webhook/admin"
+# توکن مخفی که تلگرام در هدر X-Telegram-Bot-Api-Secret-Token می‌فرستد
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# حداکثر تعداد آپدیت‌هایی که همزمان برای هر ربات پردازش می‌شوند
+UPDATE_CONCURRENCY = 64
+
+# ---------- پیام گروهی به لیگ ----------
+# تعداد ارسال همزمان، اندازه هر دسته (ثبت cursor بعد از هر دسته)
+# و فاصله بروزرسانی پیام پیشرفت ادمین (ثانیه)
+BROADCAST_CONCURRENCY = 10
+BROADCAST_BATCH_SIZE = 100
+BROADCAST_PROGRESS_INTERVAL = 3
+# تلاش مجدد بعد از خطای غیرمنتظره (از آخرین cursor) و پایه تاخیر افزایشی
+# (ثانیه)؛ بعد از آخرین تلاش وضعیت failed ثبت و به ادمین اطلاع داده می‌شود
+BROADCAST_RETRY_ATTEMPTS = 3
+BROADCAST_RETRY_BACKOFF = 5
+
+# ---------- ذخیره‌سازی FSM ----------
+# وضعیت‌های بیکار بعد از این مدت منقضی می‌شوند (ثانیه)
+FSM_STATE_TTL = 24 * 60 * 60
+# حداکثر وضعیت‌های نگهداری شده در حافظه
+FSM_CACHE_SIZE = 10000
+# نوشتن دسته‌ای: هر FSM_FLUSH_INTERVAL ثانیه یا با رسیدن به FSM_FLUSH_BATCH تغییر
+FSM_FLUSH_INTERVAL = 1.0
+FSM_FLUSH_BATCH = 200
+# فاصله اجرای پاک‌کننده وضعیت‌های منقضی (ثانیه)
+FSM_SWEEP_INTERVAL = 10 * 60
+
+# حداکثر زمان انتظار برای تمام شدن آپدیت‌های در حال پردازش هنگام خاموش شدن (ثانیه)
+SHUTDOWN_DRAIN_TIMEOUT = 30
@@ -1,29 +1,276 @@
 # database.py - نسخه کاملاً بازنویسی شده
 import sqlite3
 import logging
+import random
+import asyncio
+import functools
+import threading
+import time
+import queue
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
 from datetime import datetime
+from config import (
+    DATABASE_NAME, DB_BUSY_TIMEOUT_MS, DB_EXECUTOR_WORKERS, LEAGUE_CACHE_SIZE,
+    DB_GROUP_COMMIT, DB_GROUP_COMMIT_WINDOW_MS, DB_GROUP_COMMIT_MAX_BATCH
+)
+from cache import LRUCache
+from migrations import MigrationError, upgrade
 
 logger = logging.getLogger(__name__)
 
+
+class ConnectionPool:
+    """
+    استخر اتصال SQLite - هر رشته اتصال مخصوص خودش را دارد
+
+    اتصال‌ها در حالت WAL باز می‌شوند تا خواننده‌ها پشت نویسنده ربات دیگر
+    منتظر نمانند و نویسنده‌های همزمان تا busy_timeout برای قفل صبر کنند.
+    """
+
+    def __init__(self, db_path: str, busy_timeout: int = DB_BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """دریافت اتصال رشته فعلی (در صورت نیاز ساخته می‌شود)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        # check_same_thread=False فقط برای بستن اتصال‌ها از رشته اصلی لازم است
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        conn.execute('PRAGMA journal_mode = WAL')
+        # فعال کردن foreign keys
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def close_all(self):
+        """بستن تمام اتصال‌های استخر"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+class GroupCommitter:
+    """
+    group commit: ثبت نوشتن‌های همزمان در یک تراکنش
+
+    یک رشته نویسنده با اتصال مخصوص خودش نوشتن‌ها را تا window_ms میلی‌ثانیه
+    (یا تا max_batch نوشتن) جمع می‌کند و همه را با یک COMMIT (یک fsync)
+    ثبت می‌کند. هر نوشتن داخل SAVEPOINT خودش اجرا می‌شود تا خطای یکی فقط
+    همان را برگرداند. Future هر نوشتن بعد از commit پایدار کامل می‌شود.
+    """
+
+    def __init__(self, pool: ConnectionPool, window_ms: float = DB_GROUP_COMMIT_WINDOW_MS,
+                 max_batch: int = DB_GROUP_COMMIT_MAX_BATCH):
+        self.pool = pool
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="db-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, op, *args) -> Future:
+        """ثبت نوشتن op(conn, *args)؛ نتیجه op بعد از commit در Future قرار می‌گیرد"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("group commit بسته شده است")
+            self._queue.put((op, args, future))
+        return future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                # درخواست بستن؛ بعد از همین دسته
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = self.pool.get_connection()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = self._collect(item)
+            try:
+                self._commit(conn, batch)
+            except Exception as e:
+                # رشته نویسنده نباید از بین برود؛ فقط همین دسته خطا می‌گیرد
+                logger.error(f"❌ خطای غیرمنتظره در رشته group commit: {e}")
+                for _, _, future in batch:
+                    self._settle(future, error=e)
+
+    @staticmethod
+    def _settle(future, result=None, error=None):
+        """کامل کردن Future؛ اگر فراخواننده آن را لغو کرده باشد نادیده گرفته می‌شود"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, args, future in batch:
+                # نوشتنی که قبل از شروع لغو شده (مثلاً task آن cancel شده) اجرا
+                # نمی‌شود؛ بعد از این نقطه Future دیگر قابل لغو نیست
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT group_write")
+                try:
+                    results.append((future, op(conn, *args), None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO group_write")
+                    results.append((future, None, e))
+                conn.execute("RELEASE group_write")
+            conn.commit()
+        except Exception as e:
+            logger.error(f"❌ خطا در commit دسته‌ای {len(batch)} نوشتن: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            for _, _, future in batch:
+                self._settle(future, error=e)
+            return
+
+        self.batches += 1
+        self.writes += len(results)
+        for future, result, error in results:
+            self._settle(future, result, error)
+
+    def close(self):
+        """ثبت نوشتن‌های باقی‌مانده و توقف رشته نویسنده"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+
+def writer(method):
+    """
+    متد نوشتنی به شکل generator
+
+    متد هر نوشتن را با `yield op, *args` درخواست می‌کند و نتیجه op (یا
+    خطای آن) را در همان نقطه دریافت می‌کند. Database نوشتن‌ها را همگام با
+    _write اجرا می‌کند؛ AsyncDatabase در حالت group commit آن‌ها را مستقیم
+    به رشته نویسنده می‌دهد و await می‌کند، پس هیچ رشته‌ای از thread pool
+    منتظر commit نمی‌ماند. بخش‌های بین yield نباید به دیتابیس دسترسی داشته
+    باشند چون ممکن است روی حلقه رویداد اجرا شوند.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._drive(method(self, *args, **kwargs))
+
+    wrapper.steps = method
+    return wrapper
+
+
+def normalize_user_id(user_id):
+    """
+    آیدی کاربر به شکل ذخیره شده در users.user_id
+
+    آیدی‌های عددی تلگرام به int تبدیل می‌شوند (ستون affinity عددی دارد)؛
+    آیدی‌های غیرعددی که ادمین دستی اضافه کرده به صورت متن می‌مانند.
+    """
+    if isinstance(user_id, int):
+        return user_id
+    text = str(user_id).strip()
+    return int(text) if text.isascii() and text.isdigit() else text
+
+
+class RegistrationResult:
+    """نتیجه‌های ممکن ثبت‌نام کاربر در لیگ"""
+    REGISTERED = "registered"
+    FULL = "full"
+    INACTIVE = "inactive"
+    DUPLICATE = "duplicate"
+    NOT_FOUND = "not_found"
+    ERROR = "error"
+
+
 class Database:
-    def __init__(self, db_path="league_bot.db"):
+    def __init__(
+        self,
+        db_path=DATABASE_NAME,
+        busy_timeout: int = DB_BUSY_TIMEOUT_MS,
+        league_cache_size: int = LEAGUE_CACHE_SIZE,
+        cache_enabled: bool = True,
+        group_commit: bool = DB_GROUP_COMMIT
+    ):
         self.db_path = db_path
-        self.conn = None
+        self.pool = ConnectionPool(db_path, busy_timeout)
+        # نویسنده مشترک در حالت group commit؛ None یعنی commit جدا برای هر نوشتن
+        self.committer = None
+        # کش اطلاعات لیگ‌ها؛ فقط create/toggle/delete آن را باطل می‌کنند
+        self.league_cache = LRUCache(league_cache_size, enabled=cache_enabled, name="league")
+        # متن آماده تالار افتخارات؛ با تغییر قهرمانان باطل می‌شود
+        self.hall_of_fame_cache = LRUCache(1, enabled=cache_enabled, name="hall_of_fame")
+        self._refs = 1
+        self._refs_lock = threading.Lock()
         self.connect()
         self.create_tables()
+        if group_commit:
+            self.committer = GroupCommitter(self.pool)
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """اتصال مخصوص رشته فعلی"""
+        return self.pool.get_connection()
     
     def connect(self):
         """اتصال به دیتابیس"""
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            # فعال کردن foreign keys
-            self.conn.execute('PRAGMA foreign_keys = ON')
-            logger.info(f"✅ اتصال به دیتابیس {self.db_path} برقرار شد")
+            self.pool.get_connection()
+            logger.info(f"✅ اتصال به دیتابیس {self.db_path} برقرار شد (WAL)")
             return True
         except Exception as e:
             logger.error(f"❌ خطا در اتصال به دیتابیس: {e}")
             return False
     
+    def acquire(self):
+        """ثبت یک استفاده‌کننده جدید از همین آبجکت (برای اشتراک بین ربات‌ها)"""
+        with self._refs_lock:
+            self._refs += 1
+        return self
+    
     def create_tables(self):
         """ایجاد جداول مورد نیاز - ساختار ساده‌تر"""
         try:
@@ -36,7 +283,8 @@ class Database:
                 name TEXT NOT NULL,
                 capacity INTEGER NOT NULL,
                 is_active INTEGER DEFAULT 1,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                participant_count INTEGER NOT NULL DEFAULT 0
             )
             ''')
             
@@ -44,7 +292,7 @@ class Database:
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
                 username TEXT,
                 league_id INTEGER NOT NULL,
                 joined_at TEXT DEFAULT CURRENT_TIMESTAMP,
@@ -66,9 +314,59 @@ class Database:
             )
             ''')
             
+            # آینه عضویت کانال - از آپدیت‌های chat_member پر می‌شود
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_members (
+                user_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            
+            # پیام‌های گروهی ادمین؛ cursor آخرین users.id ارسال شده است
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                league_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                admin_chat_id INTEGER NOT NULL,
+                progress_message_id INTEGER,
+                cursor INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'running',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT,
+                FOREIGN KEY (league_id) REFERENCES leagues(id) ON DELETE CASCADE
+            )
+            ''')
+            
+            # وضعیت‌های FSM هر دو ربات (fsm_storage.SQLiteStorage)
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+            ''')
+            
             self.conn.commit()
             logger.info("✅ جداول دیتابیس ایجاد/بررسی شدند")
             
+            # شمارنده شرکت‌کنندگان لیگ‌ها
+            self._ensure_participant_counter()
+            
+            # ایندکس‌ها
+            self._ensure_indexes()
+            
+            # آمار کلی سیستم
+            self._ensure_stats()
+            
+            # مهاجرت‌های نسخه‌دار (migrations.py)
+            self._run_migrations()
+            
             # بررسی ساختار جداول
             self._verify_table_structures()
             
@@ -76,6 +374,265 @@ class Database:
             logger.error(f"❌ خطا در ایجاد جداول: {e}")
             raise
     
+    def _ensure_participant_counter(self):
+        """
+        ستون participant_count و تریگرهای نگهدارنده آن
+
+        تریگرها شمارنده را در هر INSERT/DELETE/UPDATE روی users دقیق نگه
+        می‌دارند (ثبت‌نام، حذف کاربر، حذف لیگ و اسکریپت‌های تعمیر). برای
+        دیتابیس‌های قدیمی ستون اضافه و مقدار آن از روی users پر می‌شود.
+        """
+        conn = self.conn
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_users_count_%'"
+        )
+        if cursor.fetchone()[0] == 3:
+            return
+        
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("PRAGMA table_info(leagues)")
+            if 'participant_count' not in {col[1] for col in cursor.fetchall()}:
+                cursor.execute(
+                    "ALTER TABLE leagues ADD COLUMN participant_count INTEGER NOT NULL DEFAULT 0"
+                )
+            
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_count_insert
+            AFTER INSERT ON users
+            BEGIN
+                UPDATE leagues SET participant_count = participant_count + 1
+                WHERE id = NEW.league_id;
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_count_delete
+            AFTER DELETE ON users
+            BEGIN
+                UPDATE leagues SET participant_count = participant_count - 1
+                WHERE id = OLD.league_id;
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_count_move
+            AFTER UPDATE OF league_id ON users
+            WHEN OLD.league_id != NEW.league_id
+            BEGIN
+                UPDATE leagues SET participant_count = participant_count - 1
+                WHERE id = OLD.league_id;
+                UPDATE leagues SET participant_count = participant_count + 1
+                WHERE id = NEW.league_id;
+            END
+            ''')
+            
+            # پر کردن شمارنده در همان تراکنش تا نوشتن همزمان از دست نرود
+            cursor.execute('''
+                UPDATE leagues
+                SET participant_count = (SELECT COUNT(*) FROM users WHERE league_id = leagues.id)
+            ''')
+            conn.commit()
+            logger.info("✅ شمارنده participant_count ایجاد و مقداردهی شد")
+        except Exception:
+            conn.rollback()
+            raise
+    
+    def _ensure_indexes(self):
+        """
+        ایندکس‌های مورد نیاز کوئری‌ها
+
+        با اجرای query_plans.py مطمئن شوید هیچ کوئری‌ای به اسکن کامل جدول
+        برنمی‌گردد.
+        """
+        cursor = self.conn.cursor()
+        
+        # کاربران یک لیگ به ترتیب ثبت‌نام (covering: بدون مراجعه به جدول)
+        # برای get_league_users، delete_league و تریگرهای شمارنده
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_league
+        ON users(league_id, id, user_id, username)
+        ''')
+        
+        # لیگ‌های فعال/غیرفعال به ترتیب id
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leagues_active
+        ON leagues(is_active)
+        ''')
+        
+        # تالار افتخارات به ترتیب تاریخ ثبت
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_champions_set_at
+        ON champions(set_at)
+        ''')
+        
+        # پیام‌های گروهی نیمه‌تمام و حذف آبشاری با حذف لیگ
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_broadcasts_status
+        ON broadcasts(status)
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_broadcasts_league
+        ON broadcasts(league_id)
+        ''')
+        
+        # حداکثر یک پیام گروهی در حال اجرا برای هر لیگ تا دو بار زدن دکمه
+        # تأیید پیام را دو بار نفرستد؛ تکراری‌های قدیمی قبل از ساخت لغو می‌شوند
+        cursor.execute('''
+        UPDATE broadcasts SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+        WHERE status = 'running' AND id NOT IN (
+            SELECT MIN(id) FROM broadcasts WHERE status = 'running' GROUP BY league_id
+        )
+        ''')
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_broadcasts_running
+        ON broadcasts(league_id) WHERE status = 'running'
+        ''')
+        
+        # حذف وضعیت‌های FSM منقضی شده
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fsm_states_updated
+        ON fsm_states(updated_at)
+        ''')
+        
+        self.conn.commit()
+    
+    def _ensure_stats(self):
+        """
+        جدول system_stats و تریگرهای نگهدارنده آن
+
+        آمار کلی (لیگ‌ها، ظرفیت، ثبت‌نام‌ها، کاربران یکتا و قهرمانان) در یک
+        ردیف نگه داشته و در هر نوشتن با تریگر به‌روز می‌شود تا خواندن آن
+        فقط یک جستجوی کلید اصلی باشد. اگر تریگرها وجود نداشته باشند (دیتابیس
+        قدیمی یا بازسازی جدول) ایجاد و آمار از ابتدا شمرده می‌شود.
+        """
+        conn = self.conn
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_leagues INTEGER NOT NULL DEFAULT 0,
+            active_leagues INTEGER NOT NULL DEFAULT 0,
+            total_users INTEGER NOT NULL DEFAULT 0,
+            total_champions INTEGER NOT NULL DEFAULT 0,
+            total_capacity INTEGER NOT NULL DEFAULT 0,
+            total_registrations INTEGER NOT NULL DEFAULT 0,
+            reconciled_at TEXT
+        )
+        ''')
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_stats_%'"
+        )
+        if cursor.fetchone()[0] == 7:
+            return
+        
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("INSERT OR IGNORE INTO system_stats (id) VALUES (1)")
+            
+            # لیگ‌ها
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_league_insert
+            AFTER INSERT ON leagues
+            BEGIN
+                UPDATE system_stats SET
+                    total_leagues = total_leagues + 1,
+                    active_leagues = active_leagues + (NEW.is_active = 1),
+                    total_capacity = total_capacity + (CASE WHEN NEW.is_active = 1 THEN NEW.capacity ELSE 0 END)
+                WHERE id = 1;
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_league_delete
+            AFTER DELETE ON leagues
+            BEGIN
+                UPDATE system_stats SET
+                    total_leagues = total_leagues - 1,
+                    active_leagues = active_leagues - (OLD.is_active = 1),
+                    total_capacity = total_capacity - (CASE WHEN OLD.is_active = 1 THEN OLD.capacity ELSE 0 END)
+                WHERE id = 1;
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_league_update
+            AFTER UPDATE OF is_active, capacity ON leagues
+            BEGIN
+                UPDATE system_stats SET
+                    active_leagues = active_leagues + (NEW.is_active = 1) - (OLD.is_active = 1),
+                    total_capacity = total_capacity
+                        + (CASE WHEN NEW.is_active = 1 THEN NEW.capacity ELSE 0 END)
+                        - (CASE WHEN OLD.is_active = 1 THEN OLD.capacity ELSE 0 END)
+                WHERE id = 1;
+            END
+            ''')
+            
+            # ثبت‌نام‌ها و کاربران یکتا (با ایندکس user_id)
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_user_insert
+            AFTER INSERT ON users
+            BEGIN
+                UPDATE system_stats SET
+                    total_registrations = total_registrations + 1,
+                    total_users = total_users + NOT EXISTS(
+                        SELECT 1 FROM users WHERE user_id = NEW.user_id AND id != NEW.id
+                    )
+                WHERE id = 1;
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_user_delete
+            AFTER DELETE ON users
+            BEGIN
+                UPDATE system_stats SET
+                    total_registrations = total_registrations - 1,
+                    total_users = total_users - NOT EXISTS(
+                        SELECT 1 FROM users WHERE user_id = OLD.user_id
+                    )
+                WHERE id = 1;
+            END
+            ''')
+            
+            # قهرمانان
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_champion_insert
+            AFTER INSERT ON champions
+            BEGIN
+                UPDATE system_stats SET total_champions = total_champions + 1 WHERE id = 1;
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_stats_champion_delete
+            AFTER DELETE ON champions
+            BEGIN
+                UPDATE system_stats SET total_champions = total_champions - 1 WHERE id = 1;
+            END
+            ''')
+            
+            # شمارش اولیه در همان تراکنش
+            stats = self._count_stats(cursor)
+            assignments = ', '.join(f"{column} = ?" for column in self.STATS_COLUMNS)
+            cursor.execute(
+                f"UPDATE system_stats SET {assignments}, reconciled_at = CURRENT_TIMESTAMP WHERE id = 1",
+                tuple(stats[column] for column in self.STATS_COLUMNS)
+            )
+            conn.commit()
+            logger.info(f"✅ جدول آمار ایجاد و مقداردهی شد: {stats}")
+        except Exception:
+            conn.rollback()
+            raise
+    
+    def _run_migrations(self):
+        """
+        اجرای مهاجرت‌های باقی‌مانده ساختار (بر اساس PRAGMA user_version)
+
+        مهاجرتی که رفع دستی می‌خواهد (MigrationError) فقط لاگ می‌شود و ربات
+        با ساختار فعلی ادامه می‌دهد؛ بقیه خطاها راه‌اندازی را متوقف می‌کنند.
+        """
+        try:
+            for version, description, seconds in upgrade(self.conn):
+                logger.info(f"✅ مهاجرت {version} ({description}) در {seconds:.2f} ثانیه انجام شد")
+        except MigrationError as e:
+            logger.error(f"❌ مهاجرت دیتابیس نیاز به رفع دستی دارد: {e}")
+    
     def _verify_table_structures(self):
         """بررسی ساختار جداول"""
         try:
@@ -90,6 +647,8 @@ class Database:
             cursor.execute("PRAGMA table_info(users)")
             users_cols = {col[1]: col[2] for col in cursor.fetchall()}
             logger.info(f"📊 جدول users: {users_cols}")
+            if users_cols.get('user_id') != 'INTEGER':
+                logger.warning("⚠️ ستون users.user_id هنوز TEXT است؛ برای تبدیل migrate.py را اجرا کنید")
             
             # بررسی جدول champions
             cursor.execute("PRAGMA table_info(champions)")
@@ -108,21 +667,61 @@ class Database:
         except Exception as e:
             logger.error(f"❌ خطا در بررسی ساختار جداول: {e}")
     
+    def _write(self, op, *args):
+        """
+        اجرای op(conn, *args) در یک تراکنش نوشتنی و برگرداندن نتیجه آن
+
+        در حالت group commit نوشتن به رشته نویسنده سپرده می‌شود و این تابع
+        تا commit پایدار دسته منتظر می‌ماند؛ در غیر این صورت op در تراکنش
+        BEGIN IMMEDIATE خودش روی اتصال همین رشته اجرا می‌شود.
+
+        تمام نوشتن‌های بعد از راه‌اندازی از این مسیر می‌گذرند؛ فقط ساخت
+        جداول، تریگرها و مهاجرت‌ها در create_tables (قبل از ساخته شدن
+        نویسنده و روی یک رشته) مستقیم commit می‌کنند.
+        """
+        if self.committer is not None:
+            return self.committer.submit(op, *args).result()
+
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = op(conn, *args)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return result
+
+    def _drive(self, steps):
+        """اجرای همگام یک متد writer: هر نوشتن درخواستی با _write اجرا می‌شود"""
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    result = self._write(*request)
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+    @staticmethod
+    def _run_query(conn, query, params=(), fetchone=False, fetchall=False):
+        cursor = conn.execute(query, params)
+        if fetchone:
+            return cursor.fetchone()
+        elif fetchall:
+            return cursor.fetchall()
+        else:
+            return cursor.rowcount
+    
     def _execute_query(self, query, params=(), fetchone=False, fetchall=False, commit=False):
-        """تابع کمکی برای اجرای کوئری‌ها"""
+        """تابع کمکی برای اجرای کوئری‌ها (commit=True: اجرا به عنوان یک نوشتن)"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(query, params)
-            
             if commit:
-                self.conn.commit()
-            
-            if fetchone:
-                return cursor.fetchone()
-            elif fetchall:
-                return cursor.fetchall()
-            else:
-                return cursor.rowcount
+                return self._write(self._run_query, query, params, fetchone, fetchall)
+            return self._run_query(self.conn, query, params, fetchone, fetchall)
             
         except Exception as e:
             logger.error(f"❌ خطا در اجرای کوئری: {query} | پارامترها: {params} | خطا: {e}")
@@ -130,15 +729,12 @@ class Database:
     
     # ---------- توابع لیگ‌ها ----------
     
+    @writer
     def create_league(self, name: str, capacity: int) -> int:
         """ایجاد لیگ جدید"""
         try:
-            query = "INSERT INTO leagues (name, capacity) VALUES (?, ?)"
-            cursor = self.conn.cursor()
-            cursor.execute(query, (name, capacity))
-            self.conn.commit()
-            
-            league_id = cursor.lastrowid
+            league_id = yield self._insert_league, name, capacity
+            self.league_cache.invalidate(league_id)
             logger.info(f"✅ لیگ '{name}' با ظرفیت {capacity} ایجاد شد (ID: {league_id})")
             return league_id
             
@@ -146,6 +742,10 @@ class Database:
             logger.error(f"❌ خطا در ایجاد لیگ '{name}': {e}")
             return -1
     
+    @staticmethod
+    def _insert_league(conn, name: str, capacity: int) -> int:
+        return conn.execute("INSERT INTO leagues (name, capacity) VALUES (?, ?)", (name, capacity)).lastrowid
+    
     def get_all_leagues(self):
         """دریافت تمام لیگ‌ها"""
         try:
@@ -155,6 +755,83 @@ class Database:
             logger.error(f"❌ خطا در دریافت لیگ‌ها: {e}")
             return []
     
+    def get_leagues_overview(self, limit: int = None, offset: int = 0):
+        """
+        نمای کلی لیگ‌ها برای پنل ادمین در یک کوئری
+
+        خروجی: لیست (id, name, capacity, is_active, created_at,
+        participant_count, has_champion)
+        """
+        try:
+            query = '''
+                SELECT l.id, l.name, l.capacity, l.is_active, l.created_at,
+                       l.participant_count, c.id IS NOT NULL AS has_champion
+                FROM leagues l
+                LEFT JOIN champions c ON c.league_id = l.id
+                ORDER BY l.id DESC
+                LIMIT ? OFFSET ?
+            '''
+            return self._execute_query(
+                query,
+                (limit if limit is not None else -1, offset),
+                fetchall=True
+            )
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت نمای کلی لیگ‌ها: {e}")
+            return []
+    
+    def get_league_count(self) -> int:
+        """تعداد کل لیگ‌ها"""
+        try:
+            result = self._execute_query("SELECT COUNT(*) FROM leagues", fetchone=True)
+            return result[0] if result else 0
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت تعداد لیگ‌ها: {e}")
+            return 0
+    
+    def get_league_detail(self, league_id: int, users_limit: int = 10):
+        """
+        جزئیات یک لیگ برای پنل ادمین: اطلاعات لیگ، قهرمان و صفحه اول کاربران
+
+        هر دو کوئری در یک تراکنش خواندنی اجرا می‌شوند تا تصویر یکسانی
+        از دیتابیس ببینند. خروجی: dict یا None اگر لیگ وجود نداشته باشد.
+        """
+        conn = self.conn
+        try:
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute(
+                    '''
+                    SELECT l.id, l.name, l.capacity, l.is_active, l.created_at,
+                           l.participant_count, c.game_id, c.display_name, c.set_at
+                    FROM leagues l
+                    LEFT JOIN champions c ON c.league_id = l.id
+                    WHERE l.id = ?
+                    ''',
+                    (league_id,)
+                ).fetchone()
+                users = []
+                if row:
+                    users = conn.execute(
+                        "SELECT user_id, username FROM users WHERE league_id = ? ORDER BY id LIMIT ?",
+                        (league_id, users_limit)
+                    ).fetchall()
+            finally:
+                conn.commit()
+            
+            if not row:
+                return None
+            
+            return {
+                'league': row[:5],
+                'user_count': row[5],
+                'champion': row[6:9] if row[6] is not None else None,
+                'users': users,
+            }
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت جزئیات لیگ {league_id}: {e}")
+            return None
+    
     def get_active_leagues(self):
         """دریافت لیگ‌های فعال"""
         try:
@@ -164,35 +841,54 @@ class Database:
             logger.error(f"❌ خطا در دریافت لیگ‌های فعال: {e}")
             return []
     
+    def get_active_leagues_for_user(self, user_id):
+        """
+        لیگ‌های فعال به همراه ظرفیت، تعداد فعلی و وضعیت ثبت‌نام کاربر در یک کوئری
+
+        خروجی: لیست (id, name, capacity, participant_count, is_registered)
+        """
+        try:
+            query = '''
+                SELECT l.id, l.name, l.capacity, l.participant_count,
+                       EXISTS(
+                           SELECT 1 FROM users u
+                           WHERE u.user_id = ? AND u.league_id = l.id
+                       ) AS is_registered
+                FROM leagues l
+                WHERE l.is_active = 1
+                ORDER BY l.id DESC
+            '''
+            return self._execute_query(query, (normalize_user_id(user_id),), fetchall=True)
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت لیگ‌های فعال برای کاربر {user_id}: {e}")
+            return []
+    
     def get_league(self, league_id: int):
-        """دریافت اطلاعات یک لیگ"""
+        """دریافت اطلاعات یک لیگ (از کش در صورت وجود)"""
         try:
+            league = self.league_cache.get(league_id)
+            if league is not None:
+                return league
+            
+            generation = self.league_cache.generation()
             query = "SELECT id, name, capacity, is_active, created_at FROM leagues WHERE id = ?"
-            return self._execute_query(query, (league_id,), fetchone=True)
+            league = self._execute_query(query, (league_id,), fetchone=True)
+            if league:
+                self.league_cache.set(league_id, league, generation)
+            return league
         except Exception as e:
             logger.error(f"❌ خطا در دریافت لیگ {league_id}: {e}")
             return None
     
+    @writer
     def toggle_league_status(self, league_id: int):
         """تغییر وضعیت فعال/غیرفعال لیگ"""
         try:
-            # دریافت وضعیت فعلی
-            current = self._execute_query(
-                "SELECT is_active FROM leagues WHERE id = ?", 
-                (league_id,), 
-                fetchone=True
-            )
-            
-            if not current:
+            new_status = yield self._toggle_league, league_id
+            if new_status is None:
                 logger.error(f"❌ لیگ {league_id} پیدا نشد")
                 return None
-            
-            new_status = 0 if current[0] == 1 else 1
-            self._execute_query(
-                "UPDATE leagues SET is_active = ? WHERE id = ?",
-                (new_status, league_id),
-                commit=True
-            )
+            self.league_cache.invalidate(league_id)
             
             status_text = "غیرفعال" if new_status == 0 else "فعال"
             logger.info(f"✅ وضعیت لیگ {league_id} به '{status_text}' تغییر یافت")
@@ -202,42 +898,42 @@ class Database:
             logger.error(f"❌ خطا در تغییر وضعیت لیگ {league_id}: {e}")
             return None
     
+    @staticmethod
+    def _toggle_league(conn, league_id: int):
+        # خواندن و نوشتن در یک تراکنش تا دو تغییر همزمان یکدیگر را خنثی نکنند
+        current = conn.execute("SELECT is_active FROM leagues WHERE id = ?", (league_id,)).fetchone()
+        if not current:
+            return None
+        new_status = 0 if current[0] == 1 else 1
+        conn.execute("UPDATE leagues SET is_active = ? WHERE id = ?", (new_status, league_id))
+        return new_status
+    
+    @writer
     def delete_league(self, league_id: int) -> bool:
         """حذف لیگ و تمام داده‌های مرتبط"""
         try:
-            # غیرفعال کردن موقت foreign keys
-            cursor = self.conn.cursor()
-            cursor.execute('PRAGMA foreign_keys = OFF')
-            
-            try:
-                # ابتدا قهرمانان مرتبط را حذف کن
-                cursor.execute("DELETE FROM champions WHERE league_id = ?", (league_id,))
-                
-                # سپس کاربران مرتبط را حذف کن
-                cursor.execute("DELETE FROM users WHERE league_id = ?", (league_id,))
-                
-                # در نهایت لیگ را حذف کن
-                cursor.execute("DELETE FROM leagues WHERE id = ?", (league_id,))
-                
-                self.conn.commit()
-                
-                success = cursor.rowcount > 0
-                if success:
-                    logger.info(f"✅ لیگ {league_id} با موفقیت حذف شد")
-                else:
-                    logger.warning(f"⚠️ لیگ {league_id} پیدا نشد")
-                    
-            finally:
-                # فعال کردن مجدد foreign keys
-                cursor.execute('PRAGMA foreign_keys = ON')
+            success = yield self._delete_league, league_id
+            self.league_cache.invalidate(league_id)
+            self.hall_of_fame_cache.clear()
             
+            if success:
+                logger.info(f"✅ لیگ {league_id} با موفقیت حذف شد")
+            else:
+                logger.warning(f"⚠️ لیگ {league_id} پیدا نشد")
             return success
             
         except Exception as e:
             logger.error(f"❌ خطا در حذف لیگ {league_id}: {e}")
-            self.conn.rollback()
             return False
     
+    @staticmethod
+    def _delete_league(conn, league_id: int) -> bool:
+        # foreign keys روشن می‌ماند (PRAGMA foreign_keys داخل تراکنش اثری ندارد)؛
+        # فرزندها اول حذف می‌شوند و پیام‌های گروهی لیگ با ON DELETE CASCADE
+        conn.execute("DELETE FROM champions WHERE league_id = ?", (league_id,))
+        conn.execute("DELETE FROM users WHERE league_id = ?", (league_id,))
+        return conn.execute("DELETE FROM leagues WHERE id = ?", (league_id,)).rowcount > 0
+    
     def get_leagues_without_champion(self):
         """دریافت لیگ‌های غیرفعال بدون قهرمان"""
         try:
@@ -256,7 +952,7 @@ class Database:
     def get_league_user_count(self, league_id: int) -> int:
         """دریافت تعداد کاربران یک لیگ"""
         try:
-            query = "SELECT COUNT(*) FROM users WHERE league_id = ?"
+            query = "SELECT participant_count FROM leagues WHERE id = ?"
             result = self._execute_query(query, (league_id,), fetchone=True)
             return result[0] if result else 0
         except Exception as e:
@@ -265,49 +961,76 @@ class Database:
     
     # ---------- توابع کاربران ----------
     
+    @writer
     def register_user(self, user_id, username: str, league_id: int) -> bool:
         """ثبت نام کاربر در یک لیگ خاص"""
+        result = yield from self.try_register_user.steps(self, user_id, username, league_id)
+        return result == RegistrationResult.REGISTERED
+    
+    @writer
+    def try_register_user(self, user_id, username: str, league_id: int) -> str:
+        """
+        ثبت‌نام اتمیک کاربر با بررسی ظرفیت
+
+        بررسی فعال بودن، ظرفیت و تکراری نبودن در همان دستور INSERT و زیر
+        BEGIN IMMEDIATE انجام می‌شود، پس ثبت‌نام‌های همزمان هرگز ظرفیت لیگ
+        را رد نمی‌کنند. خروجی یکی از مقادیر RegistrationResult است.
+        """
         try:
-            # بررسی لیگ
-            league = self.get_league(league_id)
-            if not league:
-                logger.error(f"❌ لیگ {league_id} پیدا نشد")
-                return False
-            
-            # بررسی فعال بودن لیگ
-            if league[3] != 1:  # is_active
-                logger.error(f"❌ لیگ {league_id} غیرفعال است")
-                return False
+            result = yield self._insert_registration, user_id, username, league_id
             
-            # بررسی ظرفیت
-            user_count = self.get_league_user_count(league_id)
-            if user_count >= league[2]:  # capacity
-                logger.error(f"❌ لیگ {league_id} ظرفیت تکمیل دارد")
-                return False
-            
-            # بررسی ثبت‌نام تکراری
-            if self.is_user_in_league(user_id, league_id):
-                logger.error(f"❌ کاربر {user_id} قبلاً در لیگ {league_id} ثبت‌نام کرده")
-                return False
-            
-            # ثبت نام
-            query = "INSERT INTO users (user_id, username, league_id) VALUES (?, ?, ?)"
-            self._execute_query(query, (str(user_id), username, league_id), commit=True)
-            
-            logger.info(f"✅ کاربر {user_id} در لیگ {league_id} ثبت‌نام کرد")
-            return True
+            if result == RegistrationResult.REGISTERED:
+                logger.info(f"✅ کاربر {user_id} در لیگ {league_id} ثبت‌نام کرد")
+            else:
+                logger.error(f"❌ ثبت‌نام کاربر {user_id} در لیگ {league_id} انجام نشد: {result}")
+            return result
             
-        except sqlite3.IntegrityError as e:
-            logger.error(f"❌ خطای یکتایی در ثبت‌نام کاربر {user_id}: {e}")
-            return False
         except Exception as e:
             logger.error(f"❌ خطا در ثبت‌نام کاربر {user_id} در لیگ {league_id}: {e}")
-            return False
+            return RegistrationResult.ERROR
+    
+    def _insert_registration(self, conn, user_id, username: str, league_id: int) -> str:
+        cursor = conn.execute(
+            '''
+            INSERT OR IGNORE INTO users (user_id, username, league_id)
+            SELECT ?, ?, l.id
+            FROM leagues l
+            WHERE l.id = ? AND l.is_active = 1
+              AND l.participant_count < l.capacity
+            ''',
+            (normalize_user_id(user_id), username, league_id)
+        )
+        if cursor.rowcount == 1:
+            return RegistrationResult.REGISTERED
+        return self._registration_failure_reason(conn, user_id, league_id)
+    
+    def _registration_failure_reason(self, conn, user_id, league_id: int) -> str:
+        """تشخیص دلیل رد شدن ثبت‌نام (فقط در مسیر ناموفق اجرا می‌شود)"""
+        row = conn.execute(
+            '''
+            SELECT l.is_active, l.capacity, l.participant_count,
+                   EXISTS(SELECT 1 FROM users WHERE league_id = l.id AND user_id = ?)
+            FROM leagues l
+            WHERE l.id = ?
+            ''',
+            (normalize_user_id(user_id), league_id)
+        ).fetchone()
+        
+        if not row:
+            return RegistrationResult.NOT_FOUND
+        is_active, capacity, user_count, already_registered = row
+        if already_registered:
+            return RegistrationResult.DUPLICATE
+        if is_active != 1:
+            return RegistrationResult.INACTIVE
+        if user_count >= capacity:
+            return RegistrationResult.FULL
+        return RegistrationResult.ERROR
     
     def get_league_users(self, league_id: int):
         """دریافت کاربران یک لیگ"""
         try:
-            query = "SELECT user_id, username FROM users WHERE league_id = ?"
+            query = "SELECT user_id, username FROM users WHERE league_id = ? ORDER BY id"
             return self._execute_query(query, (league_id,), fetchall=True)
         except Exception as e:
             logger.error(f"❌ خطا در دریافت کاربران لیگ {league_id}: {e}")
@@ -317,16 +1040,17 @@ class Database:
         """دریافت اطلاعات کاربر در لیگ"""
         try:
             query = "SELECT user_id, username FROM users WHERE league_id = ? AND user_id = ?"
-            return self._execute_query(query, (league_id, str(user_id)), fetchone=True)
+            return self._execute_query(query, (league_id, normalize_user_id(user_id)), fetchone=True)
         except Exception as e:
             logger.error(f"❌ خطا در دریافت اطلاعات کاربر {user_id} در لیگ {league_id}: {e}")
             return None
     
+    @writer
     def remove_user_from_league(self, league_id: int, user_id) -> bool:
         """حذف کاربر از لیگ"""
         try:
             query = "DELETE FROM users WHERE league_id = ? AND user_id = ?"
-            result = self._execute_query(query, (league_id, str(user_id)), commit=True)
+            result = yield self._run_query, query, (league_id, normalize_user_id(user_id))
             
             success = result > 0
             if success:
@@ -338,11 +1062,12 @@ class Database:
             logger.error(f"❌ خطا در حذف کاربر {user_id} از لیگ {league_id}: {e}")
             return False
     
+    @writer
     def update_user_username(self, league_id: int, user_id, new_username: str) -> bool:
         """بروزرسانی نام کاربر در لیگ"""
         try:
             query = "UPDATE users SET username = ? WHERE league_id = ? AND user_id = ?"
-            result = self._execute_query(query, (new_username, league_id, str(user_id)), commit=True)
+            result = yield self._run_query, query, (new_username, league_id, normalize_user_id(user_id))
             
             success = result > 0
             if success:
@@ -358,7 +1083,7 @@ class Database:
         """بررسی آیا کاربر در یک لیگ خاص ثبت نام کرده"""
         try:
             query = "SELECT COUNT(*) FROM users WHERE user_id = ? AND league_id = ?"
-            result = self._execute_query(query, (str(user_id), league_id), fetchone=True)
+            result = self._execute_query(query, (normalize_user_id(user_id), league_id), fetchone=True)
             return result[0] > 0 if result else False
         except Exception as e:
             logger.error(f"❌ خطا در بررسی حضور کاربر {user_id} در لیگ {league_id}: {e}")
@@ -374,40 +1099,42 @@ class Database:
                 WHERE u.user_id = ? AND l.is_active = 1
                 ORDER BY l.id DESC
             '''
-            return self._execute_query(query, (str(user_id),), fetchall=True)
+            return self._execute_query(query, (normalize_user_id(user_id),), fetchall=True)
         except Exception as e:
             logger.error(f"❌ خطا در دریافت لیگ‌های کاربر {user_id}: {e}")
             return []
     
+    def get_user_dashboard(self, user_id):
+        """
+        داشبورد «وضعیت من» در یک کوئری
+
+        برای هر ثبت‌نام کاربر در لیگ‌های فعال: (league_id, league_name,
+        capacity, participant_count, username, champion_game_id,
+        champion_display_name)
+        """
+        try:
+            query = '''
+                SELECT l.id, l.name, l.capacity, l.participant_count, u.username,
+                       c.game_id, c.display_name
+                FROM users u
+                JOIN leagues l ON l.id = u.league_id
+                LEFT JOIN champions c ON c.league_id = l.id
+                WHERE u.user_id = ? AND l.is_active = 1
+                ORDER BY u.league_id DESC
+            '''
+            return self._execute_query(query, (normalize_user_id(user_id),), fetchall=True)
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت داشبورد کاربر {user_id}: {e}")
+            return []
+    
     # ---------- توابع قهرمانان ----------
     
+    @writer
     def set_champion(self, league_id: int, game_id: str, display_name: str, admin_id: int) -> bool:
         """ذخیره قهرمان جدید"""
         try:
-            # بررسی وجود قهرمان قبلی
-            existing = self._execute_query(
-                "SELECT id FROM champions WHERE league_id = ?", 
-                (league_id,), 
-                fetchone=True
-            )
-            
-            if existing:
-                # بروزرسانی
-                query = '''
-                    UPDATE champions 
-                    SET game_id = ?, display_name = ?, set_by_admin = ?, set_at = CURRENT_TIMESTAMP
-                    WHERE league_id = ?
-                '''
-                params = (game_id, display_name, admin_id, league_id)
-            else:
-                # ایجاد جدید
-                query = '''
-                    INSERT INTO champions (league_id, game_id, display_name, set_by_admin)
-                    VALUES (?, ?, ?, ?)
-                '''
-                params = (league_id, game_id, display_name, admin_id)
-            
-            self._execute_query(query, params, commit=True)
+            yield self._upsert_champion, league_id, game_id, display_name, admin_id
+            self.hall_of_fame_cache.clear()
             logger.info(f"✅ قهرمان لیگ {league_id} ذخیره شد: {game_id}")
             return True
             
@@ -415,6 +1142,31 @@ class Database:
             logger.error(f"❌ خطا در ذخیره قهرمان لیگ {league_id}: {e}")
             return False
     
+    @staticmethod
+    def _upsert_champion(conn, league_id: int, game_id: str, display_name: str, admin_id: int):
+        # بررسی وجود قهرمان قبلی
+        existing = conn.execute(
+            "SELECT id FROM champions WHERE league_id = ?",
+            (league_id,)
+        ).fetchone()
+        
+        if existing:
+            # بروزرسانی
+            query = '''
+                UPDATE champions 
+                SET game_id = ?, display_name = ?, set_by_admin = ?, set_at = CURRENT_TIMESTAMP
+                WHERE league_id = ?
+            '''
+            params = (game_id, display_name, admin_id, league_id)
+        else:
+            # ایجاد جدید
+            query = '''
+                INSERT INTO champions (league_id, game_id, display_name, set_by_admin)
+                VALUES (?, ?, ?, ?)
+            '''
+            params = (league_id, game_id, display_name, admin_id)
+        conn.execute(query, params)
+    
     def get_champion(self, league_id: int):
         """دریافت قهرمان یک لیگ"""
         try:
@@ -464,11 +1216,41 @@ class Database:
                 logger.error(f"❌ خطا در دریافت قهرمانان: {e2}")
                 return []
     
+    def get_hall_of_fame(self):
+        """
+        متن آماده تالار افتخارات (مشترک بین هر دو ربات)
+
+        خروجی: (has_champions, text) که text برای حالت بدون قهرمان None است
+        و هر ربات پیام مخصوص خودش را نشان می‌دهد. نتیجه تا set_champion،
+        remove_champion یا delete_league بعدی در کش می‌ماند.
+        """
+        cached = self.hall_of_fame_cache.get('hall_of_fame')
+        if cached is not None:
+            return cached
+        
+        generation = self.hall_of_fame_cache.generation()
+        champions = self.get_all_champions()
+        
+        if champions:
+            header = " قهرمان های تورنومنت ولیگ های\nPERSIAN FORMATION🏆\n\n"
+            lines = []
+            for league_name, champ_game_id, champ_display, set_date in champions:
+                display = champ_display if champ_display else champ_game_id
+                lines.append(f"{league_name}: {champ_game_id}({display})🏆\n")
+            result = (True, header + "".join(lines))
+        else:
+            result = (False, None)
+        
+        self.hall_of_fame_cache.set('hall_of_fame', result, generation)
+        return result
+    
+    @writer
     def remove_champion(self, league_id: int) -> bool:
         """حذف قهرمان یک لیگ"""
         try:
             query = "DELETE FROM champions WHERE league_id = ?"
-            result = self._execute_query(query, (league_id,), commit=True)
+            result = yield self._run_query, query, (league_id,)
+            self.hall_of_fame_cache.clear()
             
             success = result > 0
             if success:
@@ -480,36 +1262,253 @@ class Database:
             logger.error(f"❌ خطا در حذف قهرمان لیگ {league_id}: {e}")
             return False
     
+    # ---------- توابع آینه عضویت کانال ----------
+    
+    @writer
+    def set_channel_member_status(self, user_id: int, status: str) -> bool:
+        """ثبت/بروزرسانی وضعیت عضویت کاربر در کانال"""
+        try:
+            query = '''
+                INSERT INTO channel_members (user_id, status) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    status = excluded.status,
+                    updated_at = CURRENT_TIMESTAMP
+            '''
+            yield self._run_query, query, (int(user_id), status)
+            return True
+        except Exception as e:
+            logger.error(f"❌ خطا در ثبت وضعیت عضویت کاربر {user_id}: {e}")
+            return False
+    
+    def get_channel_member_status(self, user_id: int, max_age: float = None):
+        """
+        وضعیت عضویت ذخیره شده کاربر یا None اگر کاربر هنوز دیده نشده
+
+        با max_age (ثانیه) وضعیتی که قدیمی‌تر از این مدت بروزرسانی شده هم
+        None برگردانده می‌شود تا دوباره از API پرسیده شود.
+        """
+        try:
+            query = "SELECT status FROM channel_members WHERE user_id = ?"
+            params = (int(user_id),)
+            if max_age is not None:
+                query += " AND updated_at >= datetime('now', ?)"
+                params += (f"-{int(max_age)} seconds",)
+            result = self._execute_query(query, params, fetchone=True)
+            return result[0] if result else None
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت وضعیت عضویت کاربر {user_id}: {e}")
+            return None
+    
+    def get_unmirrored_user_ids(self, after_user_id: int = 0, limit: int = 500):
+        """
+        کاربران ثبت‌نام کرده‌ای که هنوز وضعیت عضویت‌شان در آینه نیست
+
+        برای پر کردن اولیه آینه استفاده می‌شود؛ آیدی‌های غیرعددی (کاربرانی
+        که ادمین دستی اضافه کرده) کنار گذاشته می‌شوند. خروجی به ترتیب
+        user_id و فقط بعد از after_user_id است؛ فراخواننده آخرین آیدی هر
+        دسته را به عنوان cursor دسته بعد می‌دهد تا هر کاربر در کل پر کردن
+        آینه فقط یک بار از ایندکس UNIQUE(user_id, league_id) خوانده شود.
+        """
+        try:
+            query = '''
+                SELECT DISTINCT u.user_id
+                FROM users u
+                WHERE u.user_id > ?
+                  AND u.user_id NOT GLOB '*[^0-9]*'
+                  AND NOT EXISTS (SELECT 1 FROM channel_members m WHERE m.user_id = u.user_id)
+                ORDER BY u.user_id
+                LIMIT ?
+            '''
+            rows = self._execute_query(query, (after_user_id, limit), fetchall=True)
+            return [int(row[0]) for row in rows]
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت کاربران بدون وضعیت عضویت: {e}")
+            return []
+    
+    def sample_channel_members(self, sample_size: int = 50):
+        """
+        نمونه تصادفی از آینه عضویت برای مقایسه با API
+
+        به جای ORDER BY RANDOM() از یک نقطه شروع تصادفی روی کلید اصلی
+        استفاده می‌شود تا کل جدول خوانده نشود.
+        """
+        try:
+            # دو کوئری جدا تا هر کدام فقط یک سر کلید اصلی را بخوانند
+            low = self._execute_query("SELECT MIN(user_id) FROM channel_members", fetchone=True)[0]
+            high = self._execute_query("SELECT MAX(user_id) FROM channel_members", fetchone=True)[0]
+            if low is None:
+                return []
+            start = random.randint(low, high)
+            query = '''
+                SELECT user_id, status FROM channel_members
+                WHERE user_id >= ?
+                ORDER BY user_id
+                LIMIT ?
+            '''
+            return self._execute_query(query, (start, sample_size), fetchall=True)
+        except Exception as e:
+            logger.error(f"❌ خطا در نمونه‌گیری از آینه عضویت: {e}")
+            return []
+    
+    # ---------- توابع ارسال پیام گروهی ----------
+    
+    @writer
+    def create_broadcast(self, league_id: int, text: str, admin_chat_id: int, progress_message_id: int = None):
+        """
+        ثبت یک پیام گروهی جدید برای لیگ؛ خروجی: آیدی پیام گروهی
+
+        اگر پیام گروهی دیگری برای همین لیگ در حال اجرا باشد (ایندکس یکتای
+        idx_broadcasts_running) چیزی ثبت نمی‌شود و خروجی None است.
+        """
+        try:
+            return (yield self._insert_broadcast, league_id, text, admin_chat_id, progress_message_id)
+        except sqlite3.IntegrityError:
+            logger.warning(f"⚠️ پیام گروهی دیگری برای لیگ {league_id} در حال ارسال است")
+            return None
+        except Exception as e:
+            logger.error(f"❌ خطا در ثبت پیام گروهی برای لیگ {league_id}: {e}")
+            return None
+    
+    @staticmethod
+    def _insert_broadcast(conn, league_id: int, text: str, admin_chat_id: int, progress_message_id: int):
+        cursor = conn.execute(
+            '''
+            INSERT INTO broadcasts (league_id, text, admin_chat_id, progress_message_id, total)
+            SELECT id, ?, ?, ?, participant_count FROM leagues WHERE id = ?
+            ''',
+            (text, admin_chat_id, progress_message_id, league_id)
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+    
+    def get_broadcast(self, broadcast_id: int):
+        """
+        دریافت پیام گروهی: (id, league_id, text, admin_chat_id,
+        progress_message_id, cursor, total, sent, failed, status)
+        """
+        try:
+            query = '''
+                SELECT id, league_id, text, admin_chat_id, progress_message_id,
+                       cursor, total, sent, failed, status
+                FROM broadcasts WHERE id = ?
+            '''
+            return self._execute_query(query, (broadcast_id,), fetchone=True)
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت پیام گروهی {broadcast_id}: {e}")
+            return None
+    
+    def get_running_broadcasts(self):
+        """آیدی پیام‌های گروهی نیمه‌تمام (برای ادامه بعد از راه‌اندازی مجدد)"""
+        try:
+            query = "SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id"
+            return [row[0] for row in self._execute_query(query, fetchall=True)]
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت پیام‌های گروهی نیمه‌تمام: {e}")
+            return []
+    
+    def get_broadcast_recipients(self, league_id: int, after_id: int = 0, limit: int = 100):
+        """گیرندگان بعدی پیام گروهی: [(users.id, user_id), ...] به ترتیب id"""
+        try:
+            query = '''
+                SELECT id, user_id FROM users
+                WHERE league_id = ? AND id > ?
+                ORDER BY id
+                LIMIT ?
+            '''
+            return self._execute_query(query, (league_id, after_id, limit), fetchall=True)
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت گیرندگان پیام گروهی لیگ {league_id}: {e}")
+            return []
+    
+    @writer
+    def advance_broadcast(self, broadcast_id: int, cursor: int, sent: int, failed: int) -> bool:
+        """ثبت پیشرفت یک دسته: جابجایی cursor و افزودن به شمارنده‌ها"""
+        try:
+            query = '''
+                UPDATE broadcasts
+                SET cursor = ?, sent = sent + ?, failed = failed + ?
+                WHERE id = ?
+            '''
+            yield self._run_query, query, (cursor, sent, failed, broadcast_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ خطا در ثبت پیشرفت پیام گروهی {broadcast_id}: {e}")
+            return False
+    
+    @writer
+    def finish_broadcast(self, broadcast_id: int, status: str = 'done') -> bool:
+        """پایان پیام گروهی با وضعیت done، cancelled یا failed"""
+        try:
+            query = "UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?"
+            yield self._run_query, query, (status, broadcast_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ خطا در پایان پیام گروهی {broadcast_id}: {e}")
+            return False
+    
+    # ---------- توابع ذخیره‌سازی FSM ----------
+    
+    def get_fsm_record(self, key: str):
+        """دریافت وضعیت FSM: (state, data_json, updated_at) یا None"""
+        try:
+            query = "SELECT state, data, updated_at FROM fsm_states WHERE key = ?"
+            return self._execute_query(query, (key,), fetchone=True)
+        except Exception as e:
+            logger.error(f"❌ خطا در دریافت وضعیت FSM {key}: {e}")
+            return None
+    
+    @writer
+    def save_fsm_records(self, upserts, deletes=()) -> bool:
+        """
+        ذخیره دسته‌ای وضعیت‌های FSM در یک تراکنش
+
+        upserts: [(key, state, data_json, updated_at), ...]
+        deletes: [key, ...] (وضعیت‌های خالی که نیازی به نگهداری ندارند)
+        """
+        try:
+            yield self._save_fsm_records, upserts, deletes
+            return True
+        except Exception as e:
+            logger.error(f"❌ خطا در ذخیره وضعیت‌های FSM: {e}")
+            return False
+    
+    @staticmethod
+    def _save_fsm_records(conn, upserts, deletes):
+        conn.executemany('''
+            INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = excluded.state,
+                data = excluded.data,
+                updated_at = excluded.updated_at
+        ''', upserts)
+        conn.executemany("DELETE FROM fsm_states WHERE key = ?", [(key,) for key in deletes])
+    
+    @writer
+    def delete_expired_fsm_records(self, before: float) -> int:
+        """حذف وضعیت‌های FSM که از زمان before بروزرسانی نشده‌اند؛ خروجی: تعداد حذف شده"""
+        try:
+            query = "DELETE FROM fsm_states WHERE updated_at < ?"
+            return (yield self._run_query, query, (before,))
+        except Exception as e:
+            logger.error(f"❌ خطا در حذف وضعیت‌های منقضی FSM: {e}")
+            return 0
+    
     # ---------- توابع کمکی ----------
     
+    STATS_COLUMNS = (
+        'total_leagues',
+        'active_leagues',
+        'total_users',
+        'total_champions',
+        'total_capacity',
+        'total_registrations',
+    )
+    
     def get_total_stats(self):
-        """دریافت آمار کلی سیستم"""
+        """دریافت آمار کلی سیستم (یک ردیف از جدول system_stats)"""
         try:
-            stats = {}
-            
-            # تعداد کل لیگ‌ها
-            result = self._execute_query("SELECT COUNT(*) FROM leagues", fetchone=True)
-            stats['total_leagues'] = result[0] if result else 0
-            
-            # لیگ‌های فعال
-            result = self._execute_query("SELECT COUNT(*) FROM leagues WHERE is_active = 1", fetchone=True)
-            stats['active_leagues'] = result[0] if result else 0
-            
-            # کاربران منحصر به فرد
-            result = self._execute_query("SELECT COUNT(DISTINCT user_id) FROM users", fetchone=True)
-            stats['total_users'] = result[0] if result else 0
-            
-            # تعداد قهرمانان
-            result = self._execute_query("SELECT COUNT(*) FROM champions", fetchone=True)
-            stats['total_champions'] = result[0] if result else 0
-            
-            # ظرفیت کل فعال
-            result = self._execute_query("SELECT SUM(capacity) FROM leagues WHERE is_active = 1", fetchone=True)
-            stats['total_capacity'] = result[0] if result else 0
-            
-            # تعداد کل ثبت‌نام‌ها
-            result = self._execute_query("SELECT COUNT(*) FROM users", fetchone=True)
-            stats['total_registrations'] = result[0] if result else 0
+            query = f"SELECT {', '.join(self.STATS_COLUMNS)} FROM system_stats WHERE id = 1"
+            result = self._execute_query(query, fetchone=True)
+            stats = dict(zip(self.STATS_COLUMNS, result)) if result else {}
             
             logger.info(f"📊 آمار سیستم: {stats}")
             return stats
@@ -518,6 +1517,67 @@ class Database:
             logger.error(f"❌ خطا در دریافت آمار: {e}")
             return {}
     
+    def _count_stats(self, cursor):
+        """شمارش کامل آمار از روی جداول اصلی"""
+        cursor.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM leagues),
+                (SELECT COUNT(*) FROM leagues WHERE is_active = 1),
+                (SELECT COUNT(DISTINCT user_id) FROM users),
+                (SELECT COUNT(*) FROM champions),
+                (SELECT COALESCE(SUM(capacity), 0) FROM leagues WHERE is_active = 1),
+                (SELECT COUNT(*) FROM users)
+        ''')
+        return dict(zip(self.STATS_COLUMNS, cursor.fetchone()))
+    
+    @writer
+    def reconcile_stats(self):
+        """
+        شمارش مجدد کامل آمار و شمارنده participant_count و اصلاح انحراف
+
+        شمارنده‌ها با تریگرها به‌روز می‌مانند؛ این تابع به صورت دوره‌ای
+        اجرا می‌شود تا هر انحرافی (مثلاً از تغییر دستی دیتابیس) اصلاح شود.
+        خروجی: dict ستون‌هایی که انحراف داشتند {ستون: (قبلی، صحیح)}
+        """
+        try:
+            drift = yield self._reconcile_stats,
+            
+            if drift:
+                logger.warning(f"⚠️ انحراف آمار اصلاح شد: {drift}")
+            else:
+                logger.info("✅ آمار سیستم با شمارش کامل مطابقت دارد")
+            return drift
+            
+        except Exception as e:
+            logger.error(f"❌ خطا در شمارش مجدد آمار: {e}")
+            return None
+    
+    def _reconcile_stats(self, conn):
+        cursor = conn.cursor()
+        expected = self._count_stats(cursor)
+        cursor.execute(f"SELECT {', '.join(self.STATS_COLUMNS)} FROM system_stats WHERE id = 1")
+        current = dict(zip(self.STATS_COLUMNS, cursor.fetchone()))
+        drift = {
+            column: (current[column], value)
+            for column, value in expected.items()
+            if current[column] != value
+        }
+        
+        assignments = ', '.join(f"{column} = ?" for column in self.STATS_COLUMNS)
+        cursor.execute(
+            f"UPDATE system_stats SET {assignments}, reconciled_at = CURRENT_TIMESTAMP WHERE id = 1",
+            tuple(expected[column] for column in self.STATS_COLUMNS)
+        )
+        
+        cursor.execute('''
+            UPDATE leagues
+            SET participant_count = (SELECT COUNT(*) FROM users WHERE league_id = leagues.id)
+            WHERE participant_count != (SELECT COUNT(*) FROM users WHERE league_id = leagues.id)
+        ''')
+        if cursor.rowcount > 0:
+            drift['participant_count'] = cursor.rowcount
+        return drift
+    
     def check_and_fix_database(self):
         """بررسی و رفع مشکلات دیتابیس"""
         try:
@@ -560,17 +1620,146 @@ class Database:
             return False
     
     def close(self):
-        """بستن اتصال دیتابیس"""
-        if self.conn:
-            try:
-                self.conn.close()
-                logger.info("✅ اتصال دیتابیس بسته شد")
-            except:
-                pass
+        """بستن اتصال دیتابیس (اگر استفاده‌کننده دیگری نمانده باشد)"""
+        with self._refs_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        if self.committer is not None:
+            self.committer.close()
+        self.pool.close_all()
+        logger.info("✅ اتصال دیتابیس بسته شد")
     
     def __del__(self):
         """بستن اتصال دیتابیس در صورت نابودی آبجکت"""
-        self.close()
+        pool = getattr(self, 'pool', None)
+        if pool:
+            pool.close_all()
+
+
+class AsyncDatabase:
+    """
+    رابط async برای Database
+
+    متدهای Database روی یک thread pool محدود اجرا می‌شوند تا نوشتن‌های کند
+    SQLite حلقه رویداد ربات‌ها را مسدود نکنند؛ در حالت group commit
+    نوشتن‌های متدهای writer بدون اشغال رشته مستقیم await می‌شوند. امضای
+    متدها همان امضای Database است و فقط باید await شوند؛ اسکریپت‌ها
+    همچنان از Database به صورت همگام استفاده می‌کنند.
+    """
+
+    def __init__(self, db: Database, max_workers: int = DB_EXECUTOR_WORKERS):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._refs = 1
+        self._refs_lock = threading.Lock()
+    
+    def acquire(self):
+        """ثبت یک استفاده‌کننده جدید از همین آبجکت (برای اشتراک بین ربات‌ها)"""
+        with self._refs_lock:
+            self._refs += 1
+        return self
+
+    async def run(self, func, *args, **kwargs):
+        """اجرای یک تابع همگام روی thread pool دیتابیس"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _drive(self, steps):
+        """
+        اجرای یک متد writer در حالت group commit
+
+        هر نوشتن مستقیم به رشته نویسنده سپرده و Future آن await می‌شود؛
+        بخش‌های بین نوشتن‌ها (لاگ و باطل کردن کش) روی حلقه رویداد اجرا می‌شوند.
+        """
+        committer = self.db.committer
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    result = await asyncio.wrap_future(committer.submit(*request))
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            raise AttributeError(name)
+
+        steps = getattr(attr, 'steps', None)
+        if steps is not None and self.db.committer is not None:
+            @functools.wraps(attr)
+            async def write(*args, **kwargs):
+                return await self._drive(steps(self.db, *args, **kwargs))
+
+            return write
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return wrapper
+
+    def _close(self):
+        self._executor.shutdown(wait=True)
+        self.db.close()
+
+    async def close(self):
+        """
+        منتظر ماندن برای کوئری‌های در حال اجرا و بستن اتصال (با آخرین close)
+
+        خاموش کردن thread pool و رشته group commit منتظر کارهای باقی‌مانده
+        می‌ماند، پس روی یک رشته جدا اجرا می‌شود تا حلقه رویداد (و هندلرهای
+        ربات دیگر در همان پروسه) مسدود نشود.
+        """
+        with self._refs_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        await asyncio.to_thread(self._close)
+
+
+# ---------- دیتابیس مشترک بین ربات‌ها ----------
+
+_shared_databases = {}
+_shared_async_databases = {}
+_shared_lock = threading.RLock()
+
+
+def get_shared_database(db_path=DATABASE_NAME) -> Database:
+    """
+    دریافت Database مشترک برای یک فایل
+
+    هر دو ربات از یک استخر اتصال استفاده می‌کنند؛ هر فراخوانی باید با یک
+    close() متناظر شود و اتصال‌ها با آخرین close() بسته می‌شوند.
+    """
+    with _shared_lock:
+        db = _shared_databases.get(db_path)
+        if db is None or db._refs <= 0:
+            db = Database(db_path)
+            _shared_databases[db_path] = db
+            return db
+        return db.acquire()
+
+
+def get_shared_async_database(db_path=DATABASE_NAME, max_workers: int = DB_EXECUTOR_WORKERS) -> AsyncDatabase:
+    """
+    دریافت AsyncDatabase مشترک برای یک فایل
+
+    ربات‌هایی که در یک پروسه اجرا می‌شوند یک thread pool و یک استخر اتصال
+    مشترک دارند؛ مثل get_shared_database هر فراخوانی یک close() می‌خواهد.
+    """
+    with _shared_lock:
+        adb = _shared_async_databases.get(db_path)
+        if adb is None or adb._refs <= 0:
+            adb = AsyncDatabase(get_shared_database(db_path), max_workers=max_workers)
+            _shared_async_databases[db_path] = adb
+            return adb
+        return adb.acquire()
 
 
 # تابع کمکی برای بازنشانی دیتابیس
@@ -578,11 +1767,15 @@ def reset_database():
     """بازنشانی کامل دیتابیس"""
     import os
     
-    db_file = "league_bot.db"
+    db_file = DATABASE_NAME
     
     if os.path.exists(db_file):
         try:
             os.remove(db_file)
+            # فایل‌های جانبی حالت WAL
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(db_file + suffix):
+                    os.remove(db_file + suffix)
             print(f"✅ فایل دیتابیس قدیمی حذف شد: {db_file}")
         except Exception as e:
             print(f"❌ خطا در حذف دیتابیس قدیمی: {e}")
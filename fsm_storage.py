@@ -0,0 +1,163 @@
+# fsm_storage.py
+import copy
+import json
+import time
+import asyncio
+import logging
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey
+
+from config import (
+    FSM_STATE_TTL, FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL, FSM_FLUSH_BATCH, FSM_SWEEP_INTERVAL
+)
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    ذخیره‌سازی FSM در جدول fsm_states دیتابیس اصلی
+
+    - تغییرات در حافظه جمع و دسته‌ای در یک تراکنش نوشته می‌شوند
+      (هر FSM_FLUSH_INTERVAL ثانیه یا با رسیدن به FSM_FLUSH_BATCH تغییر)
+    - خواندن‌ها از یک کش LRU محدود انجام می‌شود
+    - وضعیت‌هایی که FSM_STATE_TTL ثانیه دست نخورده‌اند منقضی و توسط
+      پاک‌کننده دوره‌ای از دیتابیس حذف می‌شوند
+
+    بعد از راه‌اندازی مجدد، کاربران از همان مرحله‌ای که بودند ادامه می‌دهند.
+    رشته پس‌زمینه (نوشتن دسته‌ای و پاک‌کننده) با start() در startup ربات یا
+    با اولین خواندن/نوشتن شروع و در close() متوقف می‌شود.
+    """
+
+    def __init__(self, db, name: str = "fsm", ttl: float = FSM_STATE_TTL,
+                 cache_size: int = FSM_CACHE_SIZE, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 flush_batch: int = FSM_FLUSH_BATCH, sweep_interval: float = FSM_SWEEP_INTERVAL):
+        self.db = db
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.sweep_interval = sweep_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # key -> (state, data, updated_at)
+        self._cache = LRUCache(cache_size, ttl=ttl, name=name)
+        # تغییرات نوشته نشده؛ state=None و data خالی یعنی حذف
+        self._dirty = {}
+        self._worker = None
+        self._stopping = asyncio.Event()
+
+    # ---------- خواندن و نوشتن ----------
+
+    def _cached(self, key: str):
+        record = self._dirty.get(key)
+        return record if record is not None else self._cache.get(key)
+
+    async def _load(self, key: str):
+        self.start()
+        record = self._cached(key)
+        if record is None:
+            row = await self.db.get_fsm_record(key)
+            # اگر در زمان خواندن از دیتابیس مقدار جدیدتری نوشته شده، همان معتبر است
+            record = self._cached(key)
+            if record is None:
+                record = (row[0], json.loads(row[1]), row[2]) if row else (None, {}, None)
+                self._cache.set(key, record)
+
+        if record[2] is not None and record[2] < time.time() - self.ttl:
+            return None, {}
+        return record[0], record[1]
+
+    async def _store(self, key: str, state, data):
+        record = (state, data, time.time())
+        self._cache.set(key, record)
+        self._dirty[key] = record
+
+        if len(self._dirty) >= self.flush_batch:
+            await self.flush()
+        else:
+            self.start()
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        key = self.key_builder.build(key)
+        _, data = await self._load(key)
+        await self._store(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey):
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        key = self.key_builder.build(key)
+        state, _ = await self._load(key)
+        await self._store(key, state, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict:
+        _, data = await self._load(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    # ---------- نوشتن دسته‌ای و پاک‌سازی ----------
+
+    async def flush(self) -> int:
+        """نوشتن تمام تغییرات در یک تراکنش؛ خروجی: تعداد وضعیت‌های نوشته شده"""
+        if not self._dirty:
+            return 0
+
+        pending, self._dirty = self._dirty, {}
+        upserts = []
+        deletes = []
+        for key, (state, data, updated_at) in pending.items():
+            if state is None and not data:
+                deletes.append(key)
+            else:
+                upserts.append((key, state, json.dumps(data, ensure_ascii=False), updated_at))
+
+        try:
+            saved = await self.db.save_fsm_records(upserts, deletes)
+        except asyncio.CancelledError:
+            saved = None
+        if not saved:
+            # تغییرات جدیدتر را بازنویسی نکن؛ بقیه در نوبت بعد (یا در flush
+            # پایانی close اگر task لغو شده) دوباره نوشته می‌شوند
+            for key, record in pending.items():
+                self._dirty.setdefault(key, record)
+            if saved is None:
+                raise asyncio.CancelledError()
+            return 0
+        return len(pending)
+
+    async def sweep(self) -> int:
+        """حذف وضعیت‌های منقضی از دیتابیس؛ خروجی: تعداد حذف شده"""
+        removed = await self.db.delete_expired_fsm_records(time.time() - self.ttl)
+        if removed:
+            logger.info(f"🧹 {removed} وضعیت FSM منقضی حذف شد")
+        return removed
+
+    def start(self) -> None:
+        """شروع رشته پس‌زمینه (اگر در حال اجرا نباشد)"""
+        if self._worker is None or self._worker.done():
+            self._stopping.clear()
+            self._worker = asyncio.create_task(self._background())
+
+    async def _background(self):
+        # اولین پاک‌سازی بلافاصله بعد از شروع، تا وضعیت‌های منقضی مانده از
+        # اجرای قبلی بدون نیاز به ترافیک جدید حذف شوند
+        last_sweep = None
+        while not self._stopping.is_set():
+            if last_sweep is None or time.monotonic() - last_sweep >= self.sweep_interval:
+                last_sweep = time.monotonic()
+                await self.sweep()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def close(self) -> None:
+        # رشته پس‌زمینه لغو نمی‌شود تا flush در حال اجرای آن نیمه‌کاره نماند؛
+        # فقط خبر می‌گیرد که بعد از flush فعلی تمام شود
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            self._stopping.set()
+            await asyncio.gather(worker, return_exceptions=True)
+        await self.flush()
@@ -0,0 +1,51 @@
+# inflight.py
+import asyncio
+import logging
+
+from aiogram import BaseMiddleware
+
+from config import SHUTDOWN_DRAIN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightUpdates(BaseMiddleware):
+    """شمارش آپدیت‌های در حال پردازش تا هنگام خاموش شدن منتظر تمام شدنشان بمانیم"""
+
+    def __init__(self):
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self, handler, event, data):
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if self.count == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        """منتظر ماندن برای تمام شدن آپدیت‌های در حال پردازش"""
+        if self.count:
+            logger.info(f"⏳ منتظر {self.count} آپدیت در حال پردازش...")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ {self.count} آپدیت پس از {timeout} ثانیه هنوز تمام نشده بود")
+
+
+def track_updates(dp) -> InFlightUpdates:
+    """
+    ثبت شمارنده آپدیت‌ها روی dispatcher
+
+    تخلیه باید اولین هندلر shutdown باشد تا قبل از بستن FSM و دیتابیس
+    اجرا شود.
+    """
+    tracker = InFlightUpdates()
+    dp.update.outer_middleware(tracker)
+    dp.shutdown.register(tracker.drain)
+    dp.shutdown.handlers.insert(0, dp.shutdown.handlers.pop())
+    return tracker
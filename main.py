@@ -5,10 +5,20 @@ from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder, ReplyKeyboardMarkup
-from config import MAIN_BOT_TOKEN, CHANNEL_USERNAME
-from database import Database
+from config import (
+    MAIN_BOT_TOKEN, CHANNEL_USERNAME, DATABASE_NAME,
+    MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_TTL_MEMBER, MEMBERSHIP_TTL_NON_MEMBER,
+    MEMBERSHIP_API_RATE, MEMBERSHIP_BACKFILL_BATCH, MEMBERSHIP_VERIFY_INTERVAL,
+    MEMBERSHIP_VERIFY_SAMPLE, MEMBERSHIP_MIRROR_MAX_AGE, TELEGRAM_API_RATE, TELEGRAM_API_BURST,
+    TELEGRAM_RETRY_ATTEMPTS, TELEGRAM_RETRY_MAX_WAIT
+)
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from database import RegistrationResult, get_shared_async_database
+from cache import LRUCache
+from ratelimit import TokenBucket, SingleFlight, call_with_retry
+from bot_session import get_shared_session
+from fsm_storage import SQLiteStorage
 
 # تنظیمات لاگ
 logging.basicConfig(
@@ -21,12 +31,21 @@ logger = logging.getLogger(__name__)
 class UserStates(StatesGroup):
     waiting_username = State()
 
+# ---------- پیام‌های خطای ثبت‌نام ----------
+REGISTRATION_FAILURE_MESSAGES = {
+    RegistrationResult.DUPLICATE: "⚠️ شما قبلاً در این لیگ ثبت‌نام کرده‌اید!",
+    RegistrationResult.FULL: "🚫 متأسفانه ظرفیت این لیگ تکمیل شد.",
+    RegistrationResult.INACTIVE: "⚠️ این لیگ دیگر فعال نیست.",
+    RegistrationResult.NOT_FOUND: "⚠️ این لیگ دیگر وجود ندارد.",
+}
+
 # ---------- متغیرهای سراسری ----------
-db = Database()
+db = get_shared_async_database(DATABASE_NAME)
 
 # ---------- اینیشیالایز ----------
-bot = Bot(token=MAIN_BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+bot = Bot(token=MAIN_BOT_TOKEN, session=get_shared_session())
+# وضعیت‌های FSM در دیتابیس ذخیره می‌شوند تا با راه‌اندازی مجدد از بین نروند
+dp = Dispatcher(storage=SQLiteStorage(db, name="fsm_main"))
 
 # ---------- ایجاد دکمه‌های پایین صفحه ----------
 def get_main_keyboard() -> ReplyKeyboardMarkup:
@@ -47,25 +66,77 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
     )
 
 # ---------- تابع بررسی عضویت در کانال ----------
-async def check_membership(user_id: int) -> bool:
+# نتیجه بررسی عضویت برای مدتی کش می‌شود؛ غیرعضوها TTL کوتاه‌تری دارند
+# تا بعد از عضو شدن زود بتوانند از ربات استفاده کنند
+membership_cache = LRUCache(MEMBERSHIP_CACHE_SIZE, name="membership")
+
+# وضعیت‌های مجاز
+ALLOWED_STATUSES = ('member', 'administrator', 'creator')
+
+def status_value(status) -> str:
+    """وضعیت عضویت به صورت رشته ساده"""
+    return getattr(status, 'value', status)
+
+def remember_membership(user_id: int, status: str) -> bool:
+    """ثبت نتیجه در کش و برگرداندن عضو بودن"""
+    is_member = status in ALLOWED_STATUSES
+    membership_cache.set(
+        user_id,
+        is_member,
+        ttl=MEMBERSHIP_TTL_MEMBER if is_member else MEMBERSHIP_TTL_NON_MEMBER
+    )
+    return is_member
+
+# تمام درخواست‌های get_chat_member از یک محدودکننده نرخ عبور می‌کنند و
+# درخواست‌های همزمان برای یک کاربر (مثلاً دوبار زدن دکمه) یکی می‌شوند
+membership_api_bucket = TokenBucket(TELEGRAM_API_RATE, TELEGRAM_API_BURST)
+membership_lookups = SingleFlight()
+
+async def fetch_membership_status(user_id: int) -> str:
+    """دریافت وضعیت عضویت از API تلگرام و ثبت آن در آینه عضویت"""
+    # حذف @ از اول USERNAME اگر وجود دارد
+    channel = CHANNEL_USERNAME.lstrip('@')
+    
+    async def lookup():
+        chat_member = await call_with_retry(
+            lambda: bot.get_chat_member(chat_id=f"@{channel}", user_id=user_id),
+            membership_api_bucket,
+            attempts=TELEGRAM_RETRY_ATTEMPTS,
+            max_wait=TELEGRAM_RETRY_MAX_WAIT
+        )
+        status = status_value(chat_member.status)
+        await db.set_channel_member_status(user_id, status)
+        return status
+    
+    return await membership_lookups.do(user_id, lookup)
+
+async def check_membership(user_id: int, force_refresh: bool = False):
     """
     بررسی می‌کند کاربر در کانال عضو است یا نه
+
+    ترتیب: کش، آینه عضویت (جدول channel_members که از آپدیت‌های
+    chat_member پر می‌شود) و در نهایت API تلگرام برای کاربرانی که هنوز
+    دیده نشده‌اند یا وضعیت‌شان بیش از MEMBERSHIP_MIRROR_MAX_AGE ثانیه
+    بروزرسانی نشده. با force_refresh مستقیماً از API پرسیده می‌شود.
+
+    خروجی: True/False، یا None اگر API در دسترس نبود (محدودیت نرخ یا
+    خطای شبکه) و وضعیتی در آینه وجود نداشت
     """
-    try:
-        # حذف @ از اول USERNAME اگر وجود دارد
-        channel = CHANNEL_USERNAME.lstrip('@')
-        
-        # بررسی عضویت
-        chat_member = await bot.get_chat_member(
-            chat_id=f"@{channel}",
-            user_id=user_id
-        )
+    mirrored_status = None
+    if not force_refresh:
+        cached = membership_cache.get(user_id)
+        if cached is not None:
+            return cached
         
-        # وضعیت‌های مجاز
-        allowed_statuses = ['member', 'administrator', 'creator']
-        return chat_member.status in allowed_statuses
+        mirrored_status = await db.get_channel_member_status(user_id, max_age=MEMBERSHIP_MIRROR_MAX_AGE)
+        if mirrored_status is not None:
+            return remember_membership(user_id, mirrored_status)
+    
+    try:
+        status = await fetch_membership_status(user_id)
+        return remember_membership(user_id, status)
         
-    except Exception as e:
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
         logger.error(f"خطا در بررسی عضویت برای کاربر {user_id}: {e}")
         
         # اگر خطای "chat not found" بود، یعنی ربات ادمین نیست
@@ -73,34 +144,130 @@ async def check_membership(user_id: int) -> bool:
             logger.error("ربات در کانال ادمین نیست یا کانال وجود ندارد!")
         
         return False
+    
+    except Exception as e:
+        # محدودیت نرخ یا خطای موقت؛ نباید به عضو واقعی گفته شود عضو نیست
+        logger.warning(f"⚠️ بررسی عضویت کاربر {user_id} فعلاً ممکن نیست: {e}")
+        
+        # در این حالت وضعیت قدیمی آینه هم بهتر از هیچ است
+        if mirrored_status is None:
+            mirrored_status = await db.get_channel_member_status(user_id)
+        if mirrored_status is not None:
+            return mirrored_status in ALLOWED_STATUSES
+        return None
+
+MEMBERSHIP_UNAVAILABLE_TEXT = (
+    "⏳ در حال حاضر امکان بررسی عضویت وجود ندارد.\n"
+    "لطفاً چند لحظه دیگر دوباره تلاش کنید."
+)
+
+async def ensure_member(message: types.Message, user_id: int) -> bool:
+    """بررسی عضویت پیش از هندلرهای اعضا؛ در صورت عدم عضویت پیام مناسب می‌دهد"""
+    is_member = await check_membership(user_id)
+    
+    if is_member is None:
+        await message.answer(MEMBERSHIP_UNAVAILABLE_TEXT)
+        return False
+    
+    if not is_member:
+        await message.answer(
+            "❌ ابتدا باید در کانال عضو شوید.\n"
+            "از دکمه '🔄 بررسی عضویت' استفاده کنید."
+        )
+        return False
+    
+    return True
+
+# ---------- آینه عضویت کانال ----------
+@dp.chat_member()
+async def channel_member_update(update: types.ChatMemberUpdated):
+    """بروزرسانی آینه عضویت از آپدیت‌های chat_member کانال"""
+    if (update.chat.username or '').lower() != CHANNEL_USERNAME.lstrip('@').lower():
+        return
+    
+    user_id = update.new_chat_member.user.id
+    status = status_value(update.new_chat_member.status)
+    await db.set_channel_member_status(user_id, status)
+    membership_cache.invalidate(user_id)
+
+async def backfill_membership_mirror() -> int:
+    """
+    پر کردن آینه عضویت برای کاربران ثبت‌نام کرده‌ای که هنوز دیده نشده‌اند
+
+    با سرعت MEMBERSHIP_API_RATE درخواست در ثانیه تا سهمیه API برای
+    کاربران واقعی باقی بماند. خروجی: تعداد کاربران ثبت شده
+    """
+    filled = 0
+    after_user_id = 0
+    while True:
+        user_ids = await db.get_unmirrored_user_ids(after_user_id, limit=MEMBERSHIP_BACKFILL_BATCH)
+        if user_ids:
+            after_user_id = user_ids[-1]
+        progress = 0
+        for user_id in user_ids:
+            try:
+                await fetch_membership_status(user_id)
+                progress += 1
+            except Exception as e:
+                logger.warning(f"بررسی عضویت کاربر {user_id} در پر کردن آینه ناموفق بود: {e}")
+            await asyncio.sleep(1 / MEMBERSHIP_API_RATE)
+        
+        filled += progress
+        # اگر دسته‌ای هیچ پیشرفتی نداشت (مثلاً همه خطا دادند) ادامه نده
+        if len(user_ids) < MEMBERSHIP_BACKFILL_BATCH or progress == 0:
+            break
+    
+    logger.info(f"✅ آینه عضویت برای {filled} کاربر پر شد")
+    return filled
+
+async def verify_membership_mirror(sample_size: int = MEMBERSHIP_VERIFY_SAMPLE) -> dict:
+    """
+    مقایسه نمونه‌ای از آینه عضویت با API تلگرام
+
+    موارد ناسازگار در همان لحظه اصلاح می‌شوند. خروجی: تعداد بررسی شده
+    و تعداد ناسازگاری‌ها
+    """
+    checked = 0
+    mismatches = 0
+    for user_id, mirrored_status in await db.sample_channel_members(sample_size):
+        try:
+            actual_status = await fetch_membership_status(user_id)
+        except Exception as e:
+            logger.warning(f"بررسی سازگاری عضویت کاربر {user_id} ناموفق بود: {e}")
+            continue
+        
+        checked += 1
+        if (mirrored_status in ALLOWED_STATUSES) != (actual_status in ALLOWED_STATUSES):
+            mismatches += 1
+            membership_cache.invalidate(user_id)
+        await asyncio.sleep(1 / MEMBERSHIP_API_RATE)
+    
+    if mismatches:
+        logger.warning(f"⚠️ آینه عضویت: {mismatches} ناسازگاری از {checked} نمونه اصلاح شد")
+    else:
+        logger.info(f"✅ آینه عضویت با API سازگار است ({checked} نمونه)")
+    return {'checked': checked, 'mismatches': mismatches}
+
+async def membership_mirror_loop():
+    """پر کردن اولیه آینه و بررسی دوره‌ای سازگاری آن"""
+    await backfill_membership_mirror()
+    while True:
+        await asyncio.sleep(MEMBERSHIP_VERIFY_INTERVAL)
+        await verify_membership_mirror()
 
 # ---------- تالار افتخارات برای کاربران ----------
 async def show_hall_of_fame_to_user(message_or_callback):
     """نمایش تالار افتخارات برای کاربران عادی"""
     
-    champions = db.get_all_champions()
+    has_champions, text = await db.get_hall_of_fame()
     
-    if not champions:
+    if not has_champions:
         text = (
             "🏆 تالار افتخارات\n\n"
             "PERSIAN FORMATION🏆\n\n"
             "هنوز هیچ قهرمانی ثبت نشده است.\n"
             "به زودی قهرمانان لیگ‌ها مشخص می‌شوند."
         )
-    else:
-        # ایجاد متن ساده بدون Markdown
-        header = " قهرمان های تورنومنت ولیگ های\nPERSIAN FORMATION🏆\n\n"
-        
-        champions_text = ""
-        for league_name, champ_game_id, champ_display, set_date in champions:
-            if champ_display:
-                display = f"{champ_display}"
-            else:
-                display = f"{champ_game_id}"
-            
-            champions_text += f"{league_name}: {champ_game_id}({display})🏆\n"
-        
-        text = header + champions_text
     
     # کیبورد برای بازگشت
     builder = ReplyKeyboardBuilder()
@@ -119,14 +286,14 @@ async def show_hall_of_fame_to_user(message_or_callback):
         )
 
 # ---------- هندلر بررسی عضویت ----------
-async def handle_membership_check(message: types.Message):
-    """بررسی عضویت و نمایش نتیجه"""
-    user_id = message.from_user.id
-    
+async def handle_membership_check(message: types.Message, user_id: int):
+    """بررسی عضویت (بدون کش) و نمایش نتیجه"""
     # چک کردن عضویت
-    is_member = await check_membership(user_id)
+    is_member = await check_membership(user_id, force_refresh=True)
     
-    if is_member:
+    if is_member is None:
+        await message.answer(MEMBERSHIP_UNAVAILABLE_TEXT)
+    elif is_member:
         await message.answer(
             "✅ شما در کانال عضو هستید!\n"
             "اکنون می‌توانید از امکانات ربات استفاده کنید.",
@@ -156,7 +323,7 @@ async def handle_membership_check(message: types.Message):
 @dp.message(F.text == "🔄 بررسی عضویت")
 async def check_membership_button(message: types.Message):
     """هندلر دکمه بررسی عضویت"""
-    await handle_membership_check(message)
+    await handle_membership_check(message, message.from_user.id)
 
 # ---------- هندلر برای دکمه "🔙 بازگشت به منو" ----------
 @dp.message(F.text == "🔙 بازگشت به منو")
@@ -172,7 +339,8 @@ async def back_to_menu(message: types.Message):
 async def check_again_callback(callback: types.CallbackQuery):
     """بررسی مجدد عضویت پس از کلیک کاربر"""
     await callback.answer()
-    await handle_membership_check(callback.message)
+    # callback.message از طرف ربات است؛ آیدی کاربر را از خود callback بگیر
+    await handle_membership_check(callback.message, callback.from_user.id)
 
 # ---------- دستور /start ----------
 @dp.message(Command("start"))
@@ -188,7 +356,9 @@ async def start_command(message: types.Message, state: FSMContext):
     # بررسی عضویت
     is_member = await check_membership(user_id)
     
-    if is_member:
+    if is_member is None:
+        await message.answer(MEMBERSHIP_UNAVAILABLE_TEXT)
+    elif is_member:
         await message.answer(
             "✅ تأیید عضویت انجام شد!\n\n"
             "اکنون می‌توانید از دکمه‌های زیر استفاده کنید:",
@@ -196,7 +366,7 @@ async def start_command(message: types.Message, state: FSMContext):
         )
         
         # اگر کاربر قبلاً در لیگی ثبت‌نام کرده، پیام اضافه
-        user_leagues = db.get_user_leagues(user_id)
+        user_leagues = await db.get_user_leagues(user_id)
         if user_leagues:
             leagues_text = "\n".join([f"🏆 {league_name}" for league_id, league_name, capacity, username in user_leagues])
             await message.answer(
@@ -231,31 +401,19 @@ async def show_active_leagues(message: types.Message):
     user_id = message.from_user.id
     
     # بررسی عضویت
-    if not await check_membership(user_id):
-        await message.answer(
-            "❌ ابتدا باید در کانال عضو شوید.\n"
-            "از دکمه '🔄 بررسی عضویت' استفاده کنید."
-        )
+    if not await ensure_member(message, user_id):
         return
     
-    # نمایش لیگ‌های فعال
-    leagues = db.get_active_leagues()
+    # لیگ‌های فعال همراه با ظرفیت و وضعیت ثبت‌نام کاربر در یک کوئری
+    leagues = await db.get_active_leagues_for_user(user_id)
     if not leagues:
         await message.answer("⚠️ در حال حاضر هیچ لیگ فعالی وجود ندارد.")
         return
     
-    # دریافت لیگ‌هایی که کاربر در آن‌ها ثبت‌نام کرده
-    user_leagues = db.get_user_leagues(user_id)
-    user_league_ids = [league[0] for league in user_leagues] if user_leagues else []
-    
     # ایجاد دکمه‌های اینلاین
     builder = InlineKeyboardBuilder()
-    for league_id, league_name in leagues:
-        user_count = db.get_league_user_count(league_id)
-        league_data = db.get_league(league_id)
-        capacity = league_data[2] if league_data else 0
-        
-        if league_id in user_league_ids:
+    for league_id, league_name, capacity, user_count, is_registered in leagues:
+        if is_registered:
             # کاربر در این لیگ ثبت‌نام کرده
             text = f"✅ {league_name} (ثبت‌نام کرده‌اید)"
             builder.button(text=text, callback_data=f"already_registered_{league_id}")
@@ -282,17 +440,13 @@ async def show_my_status(message: types.Message):
     user_id = message.from_user.id
     
     # بررسی عضویت
-    if not await check_membership(user_id):
-        await message.answer(
-            "❌ ابتدا باید در کانال عضو شوید.\n"
-            "از دکمه '🔄 بررسی عضویت' استفاده کنید."
-        )
+    if not await ensure_member(message, user_id):
         return
     
-    # بررسی آیا کاربر ثبت‌نام کرده
-    user_leagues = db.get_user_leagues(user_id)
+    # تمام ثبت‌نام‌های کاربر با وضعیت لیگ و قهرمان در یک کوئری
+    dashboard = await db.get_user_dashboard(user_id)
     
-    if not user_leagues:
+    if not dashboard:
         await message.answer(
             "📝 شما هنوز در هیچ لیگی ثبت‌نام نکرده‌اید.\n"
             "برای ثبت‌نام از دکمه '🏆 لیگ‌های فعال' استفاده کنید."
@@ -301,14 +455,10 @@ async def show_my_status(message: types.Message):
     
     # نمایش اطلاعات هر لیگ
     response_texts = []
-    for league_id, league_name, capacity, username in user_leagues:
-        user_count = db.get_league_user_count(league_id)
-        
+    for league_id, league_name, capacity, user_count, username, champ_game_id, champ_display in dashboard:
         # بررسی آیا لیگ قهرمان دارد
         champion_info = ""
-        champion = db.get_champion(league_id)
-        if champion:
-            champ_game_id, champ_display, set_at, champ_league_name = champion
+        if champ_game_id is not None:
             champion_info = f"\n👑 قهرمان لیگ: {champ_game_id} ({champ_display})"
         
         response_texts.append(
@@ -333,11 +483,7 @@ async def hall_of_fame_button(message: types.Message):
     user_id = message.from_user.id
     
     # بررسی عضویت
-    if not await check_membership(user_id):
-        await message.answer(
-            "❌ ابتدا باید در کانال عضو شوید.\n"
-            "از دکمه '🔄 بررسی عضویت' استفاده کنید."
-        )
+    if not await ensure_member(message, user_id):
         return
     
     await show_hall_of_fame_to_user(message)
@@ -366,7 +512,7 @@ async def select_league(callback: types.CallbackQuery, state: FSMContext):
     
     try:
         league_id = int(callback.data.split('_')[1])
-        league = db.get_league(league_id)
+        league = await db.get_league(league_id)
         
         if not league or league[3] == 0:  # is_active = 0
             await callback.message.edit_text("⚠️ این لیگ دیگر فعال نیست.")
@@ -375,11 +521,11 @@ async def select_league(callback: types.CallbackQuery, state: FSMContext):
         user_id = callback.from_user.id
         
         # بررسی آیا کاربر قبلاً در این لیگ ثبت‌نام کرده
-        if db.is_user_in_league(user_id, league_id):
+        if await db.is_user_in_league(user_id, league_id):
             await callback.message.edit_text("🚫 شما قبلاً در این لیگ ثبت‌نام کرده‌اید!")
             return
         
-        user_count = db.get_league_user_count(league_id)
+        user_count = await db.get_league_user_count(league_id)
         if user_count >= league[2]:  # capacity
             await callback.message.edit_text("🚫 این لیگ تکمیل شده است.")
             return
@@ -427,20 +573,11 @@ async def get_username(message: types.Message, state: FSMContext):
         await state.clear()
         return
     
-    # بررسی نهایی قبل از ثبت‌نام
-    if db.is_user_in_league(user_id, league_id):
-        await message.answer(
-            "⚠️ شما قبلاً در این لیگ ثبت‌نام کرده‌اید!",
-            reply_markup=get_main_keyboard()
-        )
-        await state.clear()
-        return
-    
-    # ثبت‌نام کاربر
-    success = db.register_user(user_id, username, league_id)
+    # ثبت‌نام اتمیک (تکراری بودن، ظرفیت و فعال بودن در همان تراکنش بررسی می‌شود)
+    result = await db.try_register_user(user_id, username, league_id)
     
-    if success:
-        league = db.get_league(league_id)
+    if result == RegistrationResult.REGISTERED:
+        league = await db.get_league(league_id)
         league_name = league[1] if league else "لیگ"
         
         await message.answer(
@@ -452,18 +589,18 @@ async def get_username(message: types.Message, state: FSMContext):
         )
         
         # نمایش تالار افتخارات همزمان
-        champions = db.get_all_champions()
-        if champions:
+        has_champions, _ = await db.get_hall_of_fame()
+        if has_champions:
             await message.answer(
                 "🏆 حتماً تالار افتخارات را بررسی کنید تا قهرمانان قبلی را ببینید!",
                 reply_markup=get_main_keyboard()
             )
     else:
         await message.answer(
-            "❌ خطا در ثبت‌نام. ممکن است:\n"
-            "1. قبلاً در این لیگ ثبت‌نام کرده باشید\n"
-            "2. لیگ غیرفعال شده باشد\n"
-            "3. ظرفیت لیگ تکمیل شده باشد",
+            REGISTRATION_FAILURE_MESSAGES.get(
+                result,
+                "❌ خطا در ثبت‌نام. لطفاً دوباره تلاش کنید."
+            ),
             reply_markup=get_main_keyboard()
         )
     
@@ -486,6 +623,23 @@ async def handle_unexpected_messages(message: types.Message):
     )
 
 # ---------- تابع اصلی اجرا ----------
+# ---------- شروع و پایان (مشترک بین polling و وبهوک) ----------
+background_tasks = []
+
+@dp.startup()
+async def on_startup():
+    # پاک‌کننده وضعیت‌های منقضی FSM حتی بدون ترافیک جدید
+    dp.storage.start()
+    background_tasks.append(asyncio.create_task(membership_mirror_loop()))
+
+@dp.shutdown()
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await db.close()
+
 async def main():
     print("🤖 ربات اصلی با aiogram در حال راه‌اندازی...")
     print(f"📢 کانال مورد بررسی: {CHANNEL_USERNAME}")
@@ -495,11 +649,10 @@ async def main():
     print("⚠️ نکته: مطمئن شوید ربات در کانال ادمین است!")
     
     try:
+        # آپدیت‌های chat_member به خاطر هندلر آینه عضویت خودکار درخواست می‌شوند
         await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"خطا در اجرای ربات: {e}")
-    finally:
-        db.close()
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
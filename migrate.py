@@ -1,97 +1,69 @@
-# migrate_database.py
+# migrate.py
+"""
+اجرای مهاجرت‌های ساختار دیتابیس (migrations.py) از خط فرمان
+
+    python migrate.py [--dry-run] [--batch-size N] [--pause S] [db_path]
+
+ربات‌ها هنگام راه‌اندازی خودشان مهاجرت‌ها را اجرا می‌کنند؛ این اسکریپت
+برای اجرای جداگانه روی دیتابیس بزرگ (در حالی که ربات‌ها روشن هستند) و
+اندازه‌گیری زمان با --dry-run روی یک کپی است.
+"""
+import sys
 import sqlite3
-import os
+import logging
+import argparse
+
+from config import DATABASE_NAME, DB_BUSY_TIMEOUT_MS, MIGRATION_BATCH_SIZE, MIGRATION_BATCH_PAUSE
+from migrations import MigrationError, pending_migrations, schema_version, upgrade, dry_run
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """اتصال با مدیریت دستی تراکنش‌ها و همان busy_timeout ربات‌ها"""
+    conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.execute(f'PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    return conn
+
 
-def migrate_database():
-    """مهاجرت دیتابیس برای تغییر نوع فیلد user_id از INTEGER به TEXT"""
-    
-    if not os.path.exists("football_league.db"):
-        print("⚠️ فایل دیتابیس پیدا نشد!")
-        return
-    
-    print("🔄 در حال مهاجرت دیتابیس...")
-    
-    # اتصال به دیتابیس
-    conn = sqlite3.connect("football_league.db")
-    cursor = conn.cursor()
-    
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="مهاجرت ساختار دیتابیس")
+    parser.add_argument("db_path", nargs="?", default=DATABASE_NAME)
+    parser.add_argument("--dry-run", action="store_true", help="اجرا روی کپی و گزارش زمان هر مرحله")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=MIGRATION_BATCH_PAUSE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    conn = connect(args.db_path)
     try:
-        # 1. بررسی ساختار فعلی
-        cursor.execute("PRAGMA table_info(users)")
-        columns = cursor.fetchall()
-        print(f"📊 ساختار فعلی جدول users: {columns}")
-        
-        # 2. ایجاد جدول موقت با ساختار جدید
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users_new (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            username TEXT,
-            league_id INTEGER NOT NULL,
-            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (league_id) REFERENCES leagues (id),
-            UNIQUE(user_id, league_id)
-        )
-        ''')
-        
-        # 3. کپی داده‌ها با تبدیل user_id به TEXT
-        cursor.execute('''
-        INSERT INTO users_new (id, user_id, username, league_id, joined_at)
-        SELECT id, CAST(user_id AS TEXT), username, league_id, joined_at 
-        FROM users
-        ''')
-        
-        # 4. حذف جدول قدیمی
-        cursor.execute("DROP TABLE users")
-        
-        # 5. تغییر نام جدول جدید
-        cursor.execute("ALTER TABLE users_new RENAME TO users")
-        
-        conn.commit()
-        print("✅ مهاجرت دیتابیس با موفقیت انجام شد!")
-        
+        pending = pending_migrations(conn)
+        print(f"📊 نسخه فعلی ساختار: {schema_version(conn)}")
+        if not pending:
+            print("✅ مهاجرتی باقی نمانده است")
+            return 0
+        for step in pending:
+            print(f"   • {step.version}: {step.description}")
+
+        if args.dry_run:
+            timings = dry_run(args.db_path, args.batch_size)
+        else:
+            timings = upgrade(conn, args.batch_size, args.pause)
+    except MigrationError as e:
+        print(f"❌ مهاجرت نیاز به رفع دستی دارد: {e}")
+        return 1
     except Exception as e:
         print(f"❌ خطا در مهاجرت دیتابیس: {e}")
-        conn.rollback()
-        
-        # تلاش روش جایگزین
-        print("🔄 تلاش روش جایگزین...")
-        try:
-            # روش جایگزین: ایجاد جدول جدید و کپی داده‌ها
-            cursor.execute("SELECT * FROM users")
-            users_data = cursor.fetchall()
-            print(f"📊 تعداد کاربران: {len(users_data)}")
-            
-            # حذف و ایجاد مجدد جدول
-            cursor.execute("DROP TABLE IF EXISTS users")
-            cursor.execute('''
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                username TEXT,
-                league_id INTEGER NOT NULL,
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (league_id) REFERENCES leagues (id),
-                UNIQUE(user_id, league_id)
-            )
-            ''')
-            
-            # وارد کردن داده‌ها
-            for user in users_data:
-                cursor.execute(
-                    "INSERT INTO users (id, user_id, username, league_id, joined_at) VALUES (?, ?, ?, ?, ?)",
-                    (user[0], str(user[1]), user[2], user[3], user[4])
-                )
-            
-            conn.commit()
-            print("✅ مهاجرت با روش جایگزین موفق بود!")
-            
-        except Exception as e2:
-            print(f"❌ خطا در روش جایگزین: {e2}")
-            conn.rollback()
-            
+        return 1
     finally:
         conn.close()
 
+    title = "⏱️ زمان اجرا روی کپی" if args.dry_run else "✅ مهاجرت‌ها انجام شدند"
+    print(f"{title}:")
+    for version, description, seconds in timings:
+        print(f"   • {version}: {description} - {seconds:.2f} ثانیه")
+    return 0
+
+
 if __name__ == "__main__":
-    migrate_database()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,291 @@
+# migrations.py
+"""
+مهاجرت‌های نسخه‌دار ساختار دیتابیس
+
+نسخه ساختار در PRAGMA user_version نگه داشته می‌شود. هر مهاجرت یک شماره
+نسخه دارد و مهاجرت‌های بالاتر از نسخه فعلی به ترتیب اجرا می‌شوند؛ بعد
+از هر مهاجرت موفق user_version به‌روز می‌شود. مهاجرت‌ها باید تکرارپذیر
+باشند (اگر کار قبلاً انجام شده، کاری نکنند) تا قطع شدن وسط اجرا مشکلی
+نسازد.
+
+جدول‌های بزرگ با copy_and_swap دسته‌دسته کپی می‌شوند تا ربات‌ها فقط در
+تراکنش کوتاه جابه‌جایی منتظر بمانند.
+"""
+import os
+import time
+import shutil
+import logging
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+from config import MIGRATION_BATCH_SIZE, MIGRATION_BATCH_PAUSE
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(Exception):
+    """مهاجرتی که بدون دخالت دستی قابل اجرا نیست"""
+
+
+class Migration:
+    """یک مرحله مهاجرت: apply(conn, batch_size, pause)"""
+
+    __slots__ = ("version", "description", "apply")
+
+    def __init__(self, version: int, description: str, apply):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+
+# مهاجرت‌ها به ترتیب نسخه
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    """ثبت یک تابع به عنوان مهاجرت نسخه version"""
+    def decorator(func):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"مهاجرت نسخه {version} تکراری است")
+        MIGRATIONS.append(Migration(version, description, func))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return decorator
+
+
+# ---------- ابزارهای کمکی ----------
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """تراکنش BEGIN IMMEDIATE با ROLLBACK در صورت خطا"""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """نسخه فعلی ساختار دیتابیس"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def column_type(conn: sqlite3.Connection, table: str, column: str) -> str:
+    """نوع تعریف شده یک ستون ('' اگر وجود نداشته باشد)"""
+    for row in conn.execute(f"PRAGMA table_info({table})"):
+        if row[1] == column:
+            return row[2].upper()
+    return ''
+
+
+def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def _drop_migration_objects(conn: sqlite3.Connection, new_table: str, triggers):
+    """حذف تریگرها و جدول موقت یک copy_and_swap ناموفق"""
+    try:
+        with transaction(conn):
+            for trigger in triggers:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+        logger.info(f"🧹 تریگرهای مهاجرت و جدول {new_table} حذف شدند")
+    except sqlite3.Error as e:
+        logger.error(f"❌ حذف تریگرهای مهاجرت و جدول {new_table} ممکن نشد: {e}")
+
+
+def copy_and_swap(conn: sqlite3.Connection, table: str, create_sql: str,
+                  batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE) -> float:
+    """
+    بازسازی آنلاین یک جدول با ساختار جدید
+
+    create_sql ساختار جدید با {table} به جای نام جدول است و جدول باید ستون
+    id از نوع INTEGER PRIMARY KEY داشته باشد. مراحل:
+    1. ساخت {table}_new و تریگرهایی که هر نوشتن روی جدول را در آن تکرار می‌کنند
+    2. کپی ردیف‌های موجود به ترتیب id، هر دسته در یک تراکنش کوتاه
+    3. جابه‌جایی در یک تراکنش و ساخت دوباره ایندکس‌ها و تریگرهای جدول
+
+    ستون‌های مشترک دو ساختار کپی می‌شوند. اگر کپی یا بررسی تعداد ردیف‌ها
+    خطا بدهد، تریگرها و {table}_new حذف و خطا دوباره raise می‌شود.
+    خروجی: مدت قفل نوشتن جابه‌جایی (ثانیه).
+    """
+    new_table = f"{table}_new"
+    triggers = {event: f"trg_{table}_migrate_{event.lower()}" for event in ("INSERT", "UPDATE", "DELETE")}
+
+    with transaction(conn):
+        conn.execute(create_sql.format(table=new_table).replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+        old_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        new_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({new_table})")}
+        columns = ", ".join(column for column in old_columns if column in new_columns)
+        values = ", ".join(f"NEW.{column}" for column in old_columns if column in new_columns)
+        upsert = f"INSERT OR REPLACE INTO {new_table} ({columns}) VALUES ({values});"
+
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {triggers["INSERT"]} AFTER INSERT ON {table}
+            BEGIN {upsert} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {triggers["UPDATE"]} AFTER UPDATE ON {table}
+            BEGIN DELETE FROM {new_table} WHERE id = OLD.id; {upsert} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {triggers["DELETE"]} AFTER DELETE ON {table}
+            BEGIN DELETE FROM {new_table} WHERE id = OLD.id; END
+        ''')
+        # ردیف‌های بعد از این لحظه را تریگرها کپی می‌کنند
+        total, max_id = conn.execute(f"SELECT COUNT(*), MAX(id) FROM {table}").fetchone()
+
+    try:
+        copied = 0
+        last_id = 0
+        started = reported = time.perf_counter()
+        while max_id is not None and last_id < max_id:
+            with transaction(conn):
+                upper = conn.execute(
+                    f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+                    (last_id, max_id, batch_size)
+                ).fetchone()[0]
+                if upper is None:
+                    break
+                # ردیف‌هایی که تریگرها قبلاً نوشته‌اند جدیدترند و دست نمی‌خورند
+                cursor = conn.execute(
+                    f"INSERT OR IGNORE INTO {new_table} ({columns}) "
+                    f"SELECT {columns} FROM {table} WHERE id > ? AND id <= ?",
+                    (last_id, upper)
+                )
+            copied += cursor.rowcount
+            last_id = upper
+            now = time.perf_counter()
+            if now - reported >= 1:
+                reported = now
+                logger.info(f"📦 {table}: {copied}/{total} ردیف ({copied / (now - started):.0f} ردیف/ثانیه)")
+            if pause:
+                time.sleep(pause)
+        logger.info(f"📦 {table}: کپی {copied} ردیف در {time.perf_counter() - started:.1f} ثانیه")
+
+        started = time.perf_counter()
+        with transaction(conn):
+            if not table_exists(conn, new_table):
+                # اجرای همزمان دیگری جابه‌جایی را انجام داده است
+                return 0.0
+            old_count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            new_count = conn.execute(f"SELECT COUNT(*) FROM {new_table}").fetchone()[0]
+            if old_count != new_count:
+                raise MigrationError(f"تعداد ردیف‌ها برابر نیست: {table}={old_count}، {new_table}={new_count}")
+
+            # ایندکس‌ها و تریگرهای جدول (به جز تریگرهای مهاجرت) دوباره ساخته می‌شوند
+            placeholders = ", ".join("?" * len(triggers))
+            schema = conn.execute(f'''
+                SELECT sql FROM sqlite_master
+                WHERE tbl_name = ? AND type IN ('index', 'trigger')
+                  AND sql IS NOT NULL AND name NOT IN ({placeholders})
+                ORDER BY type
+            ''', (table, *triggers.values())).fetchall()
+
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+            for (sql,) in schema:
+                conn.execute(sql)
+    except Exception:
+        # تریگرها و جدول نیمه‌کاره نباید بمانند؛ وگرنه هر نوشتن روی جدول
+        # همچنان در {table}_new تکرار می‌شود
+        _drop_migration_objects(conn, new_table, triggers.values())
+        raise
+    lock_time = time.perf_counter() - started
+    logger.info(f"🔁 {table} جابه‌جا شد (قفل نوشتن: {lock_time * 1000:.0f}ms)")
+    return lock_time
+
+
+# ---------- مهاجرت‌ها ----------
+
+USERS_SQL = '''
+CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    league_id INTEGER NOT NULL,
+    joined_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (league_id) REFERENCES leagues(id) ON DELETE CASCADE,
+    UNIQUE(user_id, league_id)
+)
+'''
+
+
+@migration(1, "ستون users.user_id از TEXT به INTEGER")
+def _users_user_id_integer(conn, batch_size, pause):
+    if column_type(conn, 'users', 'user_id') == 'INTEGER':
+        return
+
+    # آیدی‌هایی مثل '012' و '12' در یک لیگ بعد از تبدیل تکراری می‌شوند
+    collisions = conn.execute('''
+        SELECT CAST(user_id AS INTEGER), league_id, COUNT(*)
+        FROM users
+        WHERE user_id NOT GLOB '*[^0-9]*' AND user_id != ''
+        GROUP BY CAST(user_id AS INTEGER), league_id
+        HAVING COUNT(*) > 1
+        LIMIT 10
+    ''').fetchall()
+    if collisions:
+        details = "، ".join(f"کاربر {user_id} در لیگ {league_id}" for user_id, league_id, _ in collisions)
+        raise MigrationError(f"آیدی‌های تکراری بعد از تبدیل به عدد: {details}")
+
+    copy_and_swap(conn, 'users', USERS_SQL, batch_size, pause)
+
+
+# ---------- اجرا ----------
+
+def pending_migrations(conn: sqlite3.Connection):
+    """مهاجرت‌هایی که هنوز روی این دیتابیس اجرا نشده‌اند"""
+    version = schema_version(conn)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def upgrade(conn: sqlite3.Connection, batch_size: int = MIGRATION_BATCH_SIZE,
+            pause: float = MIGRATION_BATCH_PAUSE):
+    """
+    اجرای مهاجرت‌های باقی‌مانده به ترتیب نسخه
+
+    خروجی: [(version, description, seconds), ...]. با اولین خطا متوقف
+    می‌شود و user_version روی آخرین مهاجرت موفق می‌ماند.
+    """
+    timings = []
+    for step in pending_migrations(conn):
+        logger.info(f"🔄 مهاجرت {step.version}: {step.description}")
+        started = time.perf_counter()
+        step.apply(conn, batch_size, pause)
+        with transaction(conn):
+            conn.execute(f"PRAGMA user_version = {int(step.version)}")
+        elapsed = time.perf_counter() - started
+        timings.append((step.version, step.description, elapsed))
+        logger.info(f"✅ مهاجرت {step.version} در {elapsed:.2f} ثانیه انجام شد")
+    return timings
+
+
+def dry_run(db_path: str, batch_size: int = MIGRATION_BATCH_SIZE):
+    """
+    اجرای مهاجرت‌ها روی یک کپی از دیتابیس برای اندازه‌گیری زمان
+
+    کپی با backup API گرفته می‌شود (ربات‌ها می‌توانند روشن بمانند) و بعد
+    از اندازه‌گیری حذف می‌شود. خروجی مثل upgrade است.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="league_migrate_")
+    copy_path = os.path.join(tmp_dir, os.path.basename(db_path))
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(copy_path, isolation_level=None)
+    try:
+        source.backup(target)
+        source.close()
+        target.execute("PRAGMA journal_mode = WAL")
+        # روی کپی کسی منتظر قفل نیست؛ مکث بین دسته‌ها فقط زمان را زیاد می‌کند
+        return upgrade(target, batch_size, pause=0)
+    finally:
+        source.close()
+        target.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,175 @@
+# outbox.py
+import time
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_INTERVAL, OUTBOX_CHAT_BURST,
+    OUTBOX_GROUP_INTERVAL, OUTBOX_GROUP_BURST, OUTBOX_INTERACTIVE_RESERVE,
+    OUTBOX_RETRY_ATTEMPTS, OUTBOX_RETRY_BACKOFF
+)
+from ratelimit import TokenBucket, PriorityTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# متدهایی که پیام به یک چت می‌فرستند یا پیام آن را تغییر می‌دهند
+OUTBOUND_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+
+# تعداد چت‌هایی که بعد از آن وضعیت چت‌های بیکار پاک می‌شود
+PRUNE_THRESHOLD = 1000
+
+# ارسال‌های کم‌اولویت (پیام گروهی به لیگ)؛ با outbox.bulk() فعال می‌شود
+_bulk = contextvars.ContextVar("outbox_bulk", default=False)
+
+
+class _ChatQueue:
+    """صف یک چت: قفل FIFO و سطل توکن همان چت"""
+
+    __slots__ = ("lock", "bucket", "waiters")
+
+    def __init__(self, rate: float, burst: float):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(rate, burst)
+        self.waiters = 0
+
+
+class OutboxMiddleware(BaseRequestMiddleware):
+    """
+    زمان‌بند ارسال پیام‌ها روی session ربات
+
+    - پیام‌های هر چت به ترتیب ارسال می‌شوند؛ سطل توکن هر چت چند پیام پشت
+      سر هم را بدون انتظار می‌فرستد و فقط ارسال پیوسته را کند می‌کند
+    - مجموع ارسال‌های هر ربات از محدودیت سراسری عبور نمی‌کند و ارسال‌های
+      داخل bulk() (پیام گروهی) در سهم سراسری بعد از پاسخ هندلرها قرار می‌گیرند
+    - بعد از RetryAfter همان چت صبر می‌کند و پیام دوباره ارسال می‌شود؛
+      محدودیت flood تلگرام برای کل ربات است، پس سهم سراسری ربات هم به همان
+      مدت متوقف می‌شود تا چت‌های دیگر 429 بیشتری نگیرند
+
+    بقیه متدها (get_chat_member، answer_callback_query و ...) بدون تغییر
+    عبور می‌کنند.
+    """
+
+    def __init__(self, global_rate: float = OUTBOX_GLOBAL_RATE,
+                 chat_interval: float = OUTBOX_CHAT_INTERVAL,
+                 group_interval: float = OUTBOX_GROUP_INTERVAL,
+                 attempts: int = OUTBOX_RETRY_ATTEMPTS,
+                 backoff: float = OUTBOX_RETRY_BACKOFF,
+                 chat_burst: float = OUTBOX_CHAT_BURST,
+                 group_burst: float = OUTBOX_GROUP_BURST,
+                 reserve: float = OUTBOX_INTERACTIVE_RESERVE):
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.chat_burst = chat_burst
+        self.group_burst = group_burst
+        self.reserve = reserve
+        self.attempts = attempts
+        self.backoff = backoff
+        self._buckets = {}
+        self._chats = {}
+        self.pending = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=1000)
+
+    def _chat_queue(self, chat_id) -> _ChatQueue:
+        # شناسه منفی یا @username یعنی گروه یا کانال
+        if isinstance(chat_id, str) or chat_id < 0:
+            return _ChatQueue(1 / self.group_interval, self.group_burst)
+        return _ChatQueue(1 / self.chat_interval, self.chat_burst)
+
+    def _bucket(self, bot) -> PriorityTokenBucket:
+        bucket = self._buckets.get(bot.id)
+        if bucket is None:
+            bucket = self._buckets[bot.id] = PriorityTokenBucket(self.global_rate, reserve=self.reserve)
+        return bucket
+
+    def _prune(self):
+        # فقط چت‌هایی که سطلشان دوباره پر شده حذف می‌شوند تا محدودیت دور زده نشود
+        idle = [key for key, queue in self._chats.items() if queue.waiters == 0 and queue.bucket.is_full()]
+        for key in idle:
+            del self._chats[key]
+
+    @contextmanager
+    def bulk(self):
+        """ارسال‌های داخل این بلوک (و taskهای ساخته شده در آن) کم‌اولویت هستند"""
+        token = _bulk.set(True)
+        try:
+            yield
+        finally:
+            _bulk.reset(token)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not type(method).__name__.startswith(OUTBOUND_PREFIXES):
+            return await make_request(bot, method)
+
+        key = (bot.id, chat_id)
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = self._chat_queue(chat_id)
+
+        queued_at = time.monotonic()
+        queue.waiters += 1
+        self.pending += 1
+        try:
+            async with queue.lock:
+                result = await self._send(make_request, bot, method, queue, chat_id)
+            self._latencies.append(time.monotonic() - queued_at)
+            return result
+        finally:
+            queue.waiters -= 1
+            self.pending -= 1
+            if len(self._chats) > PRUNE_THRESHOLD:
+                self._prune()
+
+    async def _send(self, make_request, bot, method, queue: _ChatQueue, chat_id):
+        for attempt in range(1, self.attempts + 1):
+            await queue.bucket.acquire()
+            await self._bucket(bot).acquire(bulk=_bulk.get())
+
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                queue.bucket.pause(e.retry_after + self.backoff * 2 ** (attempt - 1))
+                self._bucket(bot).pause(e.retry_after)
+                if attempt == self.attempts:
+                    self.failed += 1
+                    logger.error(f"❌ ارسال به چت {chat_id} پس از {attempt} تلاش ناموفق بود: {e}")
+                    raise
+                self.retried += 1
+                logger.warning(f"⏳ محدودیت ارسال برای چت {chat_id}؛ تلاش مجدد پس از {e.retry_after} ثانیه")
+                continue
+
+            self.sent += 1
+            return result
+
+    def stats(self) -> dict:
+        """آمار صف ارسال: طول صف، تعداد ارسال/تلاش مجدد/خطا و تاخیر (میلی‌ثانیه)"""
+        latencies = sorted(self._latencies)
+
+        def percentile(pct):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] * 1000, 1)
+
+        return {
+            'pending': self.pending,
+            'chats': len(self._chats),
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'latency_p50_ms': percentile(50),
+            'latency_p99_ms': percentile(99),
+        }
+
+
+# یک زمان‌بند برای تمام ربات‌های این پروسه؛ محدودیت‌ها برای هر ربات جدا حساب می‌شوند
+outbox = OutboxMiddleware()
@@ -0,0 +1,210 @@
+# query_plans.py
+import os
+import sys
+import logging
+import tempfile
+from contextlib import contextmanager
+
+from database import Database
+
+# لاگ‌های دیتابیس در این بررسی فقط نویز هستند
+logging.disable(logging.CRITICAL)
+
+# متدهایی که ذاتاً کل جدول را برمی‌گردانند؛ اسکن برایشان مجاز است
+# ولی مرتب‌سازی بدون ایندکس (TEMP B-TREE) همچنان خطا حساب می‌شود
+FULL_SCAN_ALLOWED = {
+    "get_all_leagues",
+    "get_leagues_overview",
+    "get_league_count",
+    "get_all_champions",
+    "get_hall_of_fame",
+    "get_unmirrored_user_ids",
+    "reconcile_stats",
+}
+
+# متدهایی که کوئری داده اجرا نمی‌کنند
+NOT_QUERIES = {
+    "acquire",
+    "check_and_fix_database",
+    "close",
+    "connect",
+    "create_tables",
+}
+
+SQL_PREFIXES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class PlanRecorder:
+    """ثبت کوئری‌های اجرا شده توسط هر متد Database"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.current = None
+        self.statements = {}
+        db.conn.set_trace_callback(self._trace)
+
+    def _trace(self, sql):
+        if self.current is None:
+            return
+        statement = sql.strip()
+        if statement.upper().startswith(SQL_PREFIXES):
+            self.statements.setdefault(self.current, [])
+            if statement not in self.statements[self.current]:
+                self.statements[self.current].append(statement)
+
+    @contextmanager
+    def capture(self, method_name):
+        self.current = method_name
+        try:
+            yield
+        finally:
+            self.current = None
+
+
+def run_scenario(db: Database, recorder: PlanRecorder):
+    """فراخوانی تمام متدهای Database با داده نمونه"""
+    capture = recorder.capture
+
+    with capture("create_league"):
+        league_id = db.create_league("لیگ نمونه", 10)
+        other_id = db.create_league("لیگ دوم", 10)
+    with capture("register_user"):
+        db.register_user(1001, "player1", league_id)
+    with capture("try_register_user"):
+        db.try_register_user(1002, "player2", league_id)
+        db.try_register_user(1002, "player2", league_id)
+        db.try_register_user(1003, "player3", other_id)
+    with capture("get_all_leagues"):
+        db.get_all_leagues()
+    with capture("get_leagues_overview"):
+        db.get_leagues_overview()
+        db.get_leagues_overview(limit=20, offset=20)
+    with capture("get_league_count"):
+        db.get_league_count()
+    with capture("get_league_detail"):
+        db.get_league_detail(league_id)
+    with capture("get_active_leagues"):
+        db.get_active_leagues()
+    with capture("get_active_leagues_for_user"):
+        db.get_active_leagues_for_user(1001)
+    with capture("get_league"):
+        db.get_league(league_id)
+    with capture("get_league_user_count"):
+        db.get_league_user_count(league_id)
+    with capture("get_league_users"):
+        db.get_league_users(league_id)
+    with capture("get_user_info"):
+        db.get_user_info(league_id, 1001)
+    with capture("is_user_in_league"):
+        db.is_user_in_league(1001, league_id)
+    with capture("get_user_leagues"):
+        db.get_user_leagues(1001)
+    with capture("get_user_dashboard"):
+        db.get_user_dashboard(1001)
+    with capture("update_user_username"):
+        db.update_user_username(league_id, 1001, "player1-renamed")
+    with capture("toggle_league_status"):
+        db.toggle_league_status(other_id)
+    with capture("get_leagues_without_champion"):
+        db.get_leagues_without_champion()
+    with capture("set_champion"):
+        db.set_champion(other_id, "game-1", "قهرمان", 1)
+        db.set_champion(other_id, "game-2", "قهرمان", 1)
+    with capture("get_champion"):
+        db.get_champion(other_id)
+    with capture("get_all_champions"):
+        db.get_all_champions()
+    with capture("get_hall_of_fame"):
+        db.get_hall_of_fame()
+    with capture("get_total_stats"):
+        db.get_total_stats()
+    with capture("reconcile_stats"):
+        db.reconcile_stats()
+    with capture("set_channel_member_status"):
+        db.set_channel_member_status(1001, "member")
+        db.set_channel_member_status(1001, "left")
+    with capture("get_channel_member_status"):
+        db.get_channel_member_status(1001)
+        db.get_channel_member_status(1001, max_age=3600)
+    with capture("get_unmirrored_user_ids"):
+        db.get_unmirrored_user_ids()
+        db.get_unmirrored_user_ids(1000)
+    with capture("sample_channel_members"):
+        db.sample_channel_members()
+    with capture("create_broadcast"):
+        broadcast_id = db.create_broadcast(league_id, "اطلاعیه", 1, 10)
+    with capture("get_broadcast"):
+        db.get_broadcast(broadcast_id)
+    with capture("get_running_broadcasts"):
+        db.get_running_broadcasts()
+    with capture("get_broadcast_recipients"):
+        db.get_broadcast_recipients(league_id, after_id=0, limit=100)
+    with capture("advance_broadcast"):
+        db.advance_broadcast(broadcast_id, 1, 1, 0)
+    with capture("finish_broadcast"):
+        db.finish_broadcast(broadcast_id)
+    with capture("save_fsm_records"):
+        db.save_fsm_records([("1:1:1", "UserStates:waiting_username", "{}", 100.0)], ["1:2:2"])
+    with capture("get_fsm_record"):
+        db.get_fsm_record("1:1:1")
+    with capture("delete_expired_fsm_records"):
+        db.delete_expired_fsm_records(50.0)
+    with capture("remove_champion"):
+        db.remove_champion(other_id)
+    with capture("remove_user_from_league"):
+        db.remove_user_from_league(league_id, 1001)
+    with capture("delete_league"):
+        db.delete_league(other_id)
+
+
+def find_problems(db: Database, statements):
+    """اجرای EXPLAIN QUERY PLAN و برگرداندن کوئری‌های بدون ایندکس مناسب"""
+    problems = []
+    for method, queries in statements.items():
+        for sql in queries:
+            plan = [row[3] for row in db.conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            for detail in plan:
+                full_scan = detail.startswith("SCAN ") and method not in FULL_SCAN_ALLOWED
+                if full_scan or "TEMP B-TREE" in detail:
+                    problems.append((method, sql, detail))
+    return problems
+
+
+def check_query_plans(verbose=False):
+    """بررسی پلن تمام کوئری‌های database.py؛ خروجی: لیست مشکلات"""
+    tmp_dir = tempfile.mkdtemp(prefix="league_plans_")
+    # کش خاموش است تا هر فراخوانی واقعاً به دیتابیس برسد
+    db = Database(os.path.join(tmp_dir, "plans.db"), cache_enabled=False)
+    try:
+        recorder = PlanRecorder(db)
+        run_scenario(db, recorder)
+        db.conn.set_trace_callback(None)
+
+        public_methods = {
+            name for name in dir(Database)
+            if not name.startswith('_') and callable(getattr(Database, name))
+        }
+        untested = public_methods - NOT_QUERIES - set(recorder.statements)
+        problems = [(method, None, "متد در سناریوی بررسی پوشش داده نشده") for method in sorted(untested)]
+        problems += find_problems(db, recorder.statements)
+
+        if verbose:
+            for method, queries in sorted(recorder.statements.items()):
+                print(f"🔎 {method}")
+                for sql in queries:
+                    for row in db.conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+                        print(f"    {row[3]}")
+        return problems
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    problems = check_query_plans(verbose="-v" in sys.argv)
+    for method, sql, detail in problems:
+        print(f"❌ {method}: {detail}")
+        if sql:
+            print(f"    {' '.join(sql.split())}")
+    if problems:
+        sys.exit(1)
+    print("✅ تمام کوئری‌ها از ایندکس استفاده می‌کنند")
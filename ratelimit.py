@@ -0,0 +1,133 @@
+# ratelimit.py
+import time
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    محدودکننده نرخ با الگوریتم سطل توکن
+
+    هر فراخوانی acquire یک توکن مصرف می‌کند و اگر توکنی نباشد صبر
+    می‌کند. با pause تمام فراخوانی‌ها تا زمان مشخص متوقف می‌شوند
+    (مثلاً بعد از خطای RetryAfter تلگرام).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """توقف تمام درخواست‌ها به مدت seconds ثانیه"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        # پر شدن دوباره سطل از پایان توقف شروع می‌شود
+        self._updated_at = self._paused_until
+
+    def _delay(self, now: float, needed: float = 1) -> float:
+        """زمان لازم تا در دسترس بودن needed توکن (0 یعنی همین حالا)"""
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        return max(0.0, (needed - self._tokens) / self.rate)
+
+    def is_full(self) -> bool:
+        """سطل پر است (حذف سطل تفاوتی در محدودیت ایجاد نمی‌کند)"""
+        return self._delay(time.monotonic(), self.capacity) == 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                delay = self._delay(time.monotonic())
+                if delay <= 0:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(delay)
+
+
+class PriorityTokenBucket(TokenBucket):
+    """
+    سطل توکن با اولویت درخواست‌های عادی
+
+    acquire(bulk=True) (مثلاً پیام گروهی) فقط وقتی توکن می‌گیرد که
+    درخواست عادی منتظر نباشد و بعد از آن reserve توکن در سطل بماند؛
+    ارسال‌های انبوه با همان نرخ کل ادامه می‌یابند ولی درخواست‌های عادی
+    پشت آن‌ها صف نمی‌کشند.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, reserve: float = 0):
+        super().__init__(rate, capacity)
+        self.reserve = max(0, min(reserve, self.capacity - 1))
+        self._waiting = 0
+        self._bulk_lock = asyncio.Lock()
+
+    async def acquire(self, bulk: bool = False):
+        if not bulk:
+            self._waiting += 1
+            try:
+                return await super().acquire()
+            finally:
+                self._waiting -= 1
+
+        async with self._bulk_lock:
+            while True:
+                delay = self._delay(time.monotonic(), 1 + self.reserve)
+                if delay <= 0 and not self._waiting:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(max(delay, 1 / self.rate))
+
+
+class SingleFlight:
+    """
+    یکی کردن درخواست‌های همزمان با کلید یکسان
+
+    اگر برای یک کلید درخواستی در جریان باشد، فراخوانی‌های بعدی منتظر
+    همان درخواست می‌مانند و نتیجه (یا خطای) آن را می‌گیرند.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, func):
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # لغو شدن یکی از منتظرها نباید درخواست مشترک را لغو کند
+        return await asyncio.shield(future)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+async def call_with_retry(func, bucket: TokenBucket, attempts: int = 3, max_wait: float = 30):
+    """
+    اجرای درخواست API پشت محدودکننده نرخ با مدیریت RetryAfter
+
+    بعد از RetryAfter کل سطل متوقف می‌شود تا بقیه درخواست‌ها هم به
+    محدودیت احترام بگذارند. اگر تلاش‌ها تمام شود یا زمان انتظار بیش از
+    max_wait باشد، همان خطای RetryAfter بالا داده می‌شود.
+    """
+    for attempt in range(1, attempts + 1):
+        await bucket.acquire()
+        try:
+            return await func()
+        except TelegramRetryAfter as e:
+            bucket.pause(e.retry_after)
+            if attempt == attempts or e.retry_after > max_wait:
+                raise
+            logger.warning(f"⏳ محدودیت نرخ تلگرام؛ تلاش مجدد پس از {e.retry_after} ثانیه")
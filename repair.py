@@ -1,125 +1,236 @@
 # repair_database.py
-import sqlite3
+"""
+بررسی و بازسازی دیتابیس
+
+    python repair.py [--force] [db_path]
+
+ابتدا PRAGMA integrity_check و foreign_key_check اجرا می‌شوند؛ دیتابیس سالم
+بازسازی نمی‌شود (مگر با --force). در بازسازی، ردیف‌ها از فایل قدیمی خوانده
+و با executemany در یک تراکنش در فایل جدید نوشته می‌شوند و فایل جدید در
+آخر به صورت اتمیک جایگزین فایل قدیمی می‌شود؛ تا آن لحظه فایل اصلی دست
+نمی‌خورد. ربات‌ها باید هنگام بازسازی خاموش باشند.
+"""
 import os
-from datetime import datetime
-
-def backup_database():
-    """ایجاد پشتیبان از دیتابیس"""
-    if os.path.exists("league_bot.db"):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"league_bot_backup_{timestamp}.db"
-        
-        import shutil
-        shutil.copy2("league_bot.db", backup_name)
+import sys
+import time
+import logging
+import sqlite3
+
+from config import DATABASE_NAME
+from backup import create_backup
+
+# ترتیب کپی: جدول‌های والد قبل از فرزندها
+REBUILD_TABLES = ("leagues", "users", "champions", "channel_members", "broadcasts", "fsm_states")
+
+# تعداد ردیف خوانده شده از فایل قدیمی در هر executemany
+FETCH_SIZE = 10000
+
+
+def backup_database(db_path=DATABASE_NAME):
+    """
+    ایجاد پشتیبان از دیتابیس کنار فایل اصلی
+
+    با backup API گرفته می‌شود (backup.create_backup) تا فایل -wal هم در
+    پشتیبان باشد؛ فشرده نمی‌شود تا در صورت نیاز مستقیم جایگزین شود و
+    سلامتش بررسی نمی‌شود چون همین دیتابیس خراب قرار است تعمیر شود.
+    """
+    if not os.path.exists(db_path):
+        return None
+    backup_name = create_backup(db_path, os.path.dirname(db_path), compression="", keep=None, verify=False)
+    if backup_name:
         print(f"✅ پشتیبان ایجاد شد: {backup_name}")
-        return backup_name
-    return None
-
-def repair_database():
-    """تعمیر کامل دیتابیس"""
-    
-    print("🔧 شروع تعمیر دیتابیس...")
-    
-    # 1. ایجاد پشتیبان
-    backup_file = backup_database()
-    
-    # 2. خواندن داده‌های فعلی
-    old_conn = sqlite3.connect("league_bot.db")
-    old_cursor = old_conn.cursor()
-    
+    return backup_name
+
+
+def check_database(db_path=DATABASE_NAME):
+    """
+    بررسی سلامت دیتابیس با integrity_check و foreign_key_check
+
+    خروجی: لیست مشکلات (خالی یعنی سالم)
+    """
     try:
-        # خواندن لیگ‌ها
-        old_cursor.execute("SELECT id, name, capacity, is_active, created_at FROM leagues")
-        leagues_data = old_cursor.fetchall()
-        print(f"📊 خواندن {len(leagues_data)} لیگ")
-        
-        # خواندن کاربران
-        old_cursor.execute("SELECT id, user_id, username, league_id, joined_at FROM users")
-        users_data = old_cursor.fetchall()
-        print(f"📊 خواندن {len(users_data)} کاربر")
-        
-        # خواندن قهرمانان
-        old_cursor.execute("SELECT id, league_id, game_id, display_name, set_by_admin, set_at FROM champions")
-        champions_data = old_cursor.fetchall()
-        print(f"📊 خواندن {len(champions_data)} قهرمان")
-        
-        old_conn.close()
-        
-        # 3. حذف فایل قدیمی
-        os.remove("league_bot.db")
-        print("🗑️ فایل دیتابیس قدیمی حذف شد")
-        
-        # 4. ایجاد دیتابیس جدید
-        from database import Database
-        db = Database()
-        
-        # 5. بازگردانی لیگ‌ها
-        print("🔄 بازگردانی لیگ‌ها...")
-        for league in leagues_data:
-            try:
-                db._execute_query(
-                    "INSERT INTO leagues (id, name, capacity, is_active, created_at) VALUES (?, ?, ?, ?, ?)",
-                    league,
-                    commit=True
-                )
-            except:
-                # اگر مشکل با ID داشت، بدون ID وارد کن
-                db._execute_query(
-                    "INSERT INTO leagues (name, capacity, is_active, created_at) VALUES (?, ?, ?, ?)",
-                    league[1:],
-                    commit=True
-                )
-        
-        # 6. بازگردانی کاربران
-        print("🔄 بازگردانی کاربران...")
-        for user in users_data:
-            try:
-                db._execute_query(
-                    "INSERT INTO users (id, user_id, username, league_id, joined_at) VALUES (?, ?, ?, ?, ?)",
-                    user,
-                    commit=True
-                )
-            except:
-                db._execute_query(
-                    "INSERT INTO users (user_id, username, league_id, joined_at) VALUES (?, ?, ?, ?)",
-                    user[1:],
-                    commit=True
-                )
-        
-        # 7. بازگردانی قهرمانان
-        print("🔄 بازگردانی قهرمانان...")
-        for champ in champions_data:
+        conn = sqlite3.connect(db_path)
+        try:
+            problems = [row[0] for row in conn.execute("PRAGMA integrity_check") if row[0] != "ok"]
+            for table, rowid, parent, _ in conn.execute("PRAGMA foreign_key_check"):
+                problems.append(f"ردیف {rowid} از {table} به {parent} ناموجود اشاره می‌کند")
+            return problems
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _copy_table(old, new, table):
+    """
+    کپی ستون‌های مشترک یک جدول؛ خروجی: (خوانده شده، نوشته شده)
+
+    ردیف‌های تکراری (مثلاً آیدی '012' و '12' بعد از تبدیل به عدد) با
+    INSERT OR IGNORE کنار گذاشته می‌شوند.
+    """
+    new_columns = set(_columns(new, table))
+    columns = [column for column in _columns(old, table) if column in new_columns]
+    if not columns:
+        return 0, 0
+
+    names = ", ".join(columns)
+    placeholders = ", ".join("?" * len(columns))
+    source = old.execute(f"SELECT {names} FROM {table}")
+    read = written = 0
+    while True:
+        rows = source.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        cursor = new.executemany(f"INSERT OR IGNORE INTO {table} ({names}) VALUES ({placeholders})", rows)
+        read += len(rows)
+        written += cursor.rowcount
+    return read, written
+
+
+def _drop_orphans(new, table):
+    """حذف ردیف‌هایی که به والد ناموجود اشاره می‌کنند؛ خروجی: تعداد حذف شده"""
+    removed = 0
+    for fk in new.execute(f"PRAGMA foreign_key_list({table})").fetchall():
+        parent, column, parent_column = fk[2], fk[3], fk[4] or "id"
+        removed += new.execute(
+            f"DELETE FROM {table} WHERE {column} NOT IN (SELECT {parent_column} FROM {parent})"
+        ).rowcount
+    return removed
+
+
+def rebuild_database(db_path=DATABASE_NAME) -> bool:
+    """
+    بازسازی دیتابیس در یک فایل جدید و جایگزینی اتمیک
+
+    1. ساختار کامل با Database در فایل موقت ساخته می‌شود
+    2. تریگرها و ایندکس‌های غیر UNIQUE حذف می‌شوند تا بارگذاری سریع باشد
+    3. در یک تراکنش ردیف‌ها با executemany کپی، ردیف‌های یتیم حذف و
+       ایندکس‌ها یکجا ساخته می‌شوند
+    4. Database دوباره باز می‌شود و تریگرها و شمارنده‌ها را از نو می‌سازد
+    5. فایل جدید با os.replace جایگزین فایل قدیمی می‌شود
+    """
+    from database import Database
+
+    tmp_path = f"{db_path}.rebuild"
+    for path in (tmp_path, f"{tmp_path}-wal", f"{tmp_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # لاگ‌های ساخت ساختار در خروجی تعمیر فقط نویز هستند
+    logging.disable(logging.INFO)
+    try:
+        Database(tmp_path).close()
+
+        old = sqlite3.connect(db_path)
+        new = sqlite3.connect(tmp_path, isolation_level=None)
+        try:
+            started = time.perf_counter()
+            new.execute("BEGIN IMMEDIATE")
             try:
-                db._execute_query(
-                    "INSERT INTO champions (id, league_id, game_id, display_name, set_by_admin, set_at) VALUES (?, ?, ?, ?, ?, ?)",
-                    champ,
-                    commit=True
-                )
-            except:
-                db._execute_query(
-                    "INSERT INTO champions (league_id, game_id, display_name, set_by_admin, set_at) VALUES (?, ?, ?, ?, ?)",
-                    champ[1:],
-                    commit=True
-                )
-        
-        print("✅ دیتابیس با موفقیت تعمیر شد!")
-        
-        # بررسی نهایی
-        db.check_and_fix_database()
-        db.close()
-        
-        if backup_file:
-            print(f"📁 پشتیبان در فایل: {backup_file}")
-        
+                schema = new.execute(
+                    "SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'index') AND sql IS NOT NULL"
+                ).fetchall()
+                for kind, name, _ in schema:
+                    new.execute(f"DROP {kind.upper()} {name}")
+
+                old_tables = {row[0] for row in old.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                total = 0
+                for table in REBUILD_TABLES:
+                    if table not in old_tables:
+                        continue
+                    table_started = time.perf_counter()
+                    read, written = _copy_table(old, new, table)
+                    orphans = _drop_orphans(new, table)
+                    elapsed = time.perf_counter() - table_started
+                    total += written - orphans
+                    print(
+                        f"📦 {table}: {written - orphans}/{read} ردیف در {elapsed:.2f} ثانیه "
+                        f"({read / max(elapsed, 1e-9):.0f} ردیف/ثانیه)"
+                        + (f"، {read - written} تکراری" if read != written else "")
+                        + (f"، {orphans} یتیم" if orphans else "")
+                    )
+                load_time = time.perf_counter() - started
+
+                # ساخت یکجای ایندکس‌ها بعد از بارگذاری سریع‌تر از به‌روزرسانی ردیف به ردیف است
+                started = time.perf_counter()
+                for kind, _, sql in schema:
+                    if kind == 'index':
+                        new.execute(sql)
+                new.execute("COMMIT")
+            except Exception:
+                new.execute("ROLLBACK")
+                raise
+        finally:
+            old.close()
+            new.close()
+
+        # ساخت دوباره تریگرها و شمارنده‌ها از روی داده‌های کپی شده
+        Database(tmp_path).close()
+        index_time = time.perf_counter() - started
+    finally:
+        logging.disable(logging.NOTSET)
+
+    problems = check_database(tmp_path)
+    if problems:
+        print(f"❌ فایل بازسازی شده سالم نیست: {problems[:5]}")
+        return False
+
+    # فایل‌های WAL قدیمی نباید روی فایل جدید اعمال شوند
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(tmp_path, db_path)
+
+    print(
+        f"⏱️ بارگذاری {total} ردیف در {load_time:.2f} ثانیه ({total / max(load_time, 1e-9):.0f} ردیف/ثانیه)، "
+        f"ساخت ایندکس‌ها و شمارنده‌ها {index_time:.2f} ثانیه"
+    )
+    return True
+
+
+def repair_database(db_path=DATABASE_NAME, force=False):
+    """تعمیر کامل دیتابیس (فقط در صورت وجود مشکل یا با force)"""
+
+    print("🔧 شروع بررسی دیتابیس...")
+
+    if not os.path.exists(db_path):
+        print(f"⚠️ فایل دیتابیس {db_path} پیدا نشد!")
+        return False
+
+    problems = check_database(db_path)
+    if not problems and not force:
+        print("✅ دیتابیس سالم است؛ نیازی به بازسازی نیست")
+        return True
+
+    for problem in problems[:20]:
+        print(f"   • {problem}")
+    if len(problems) > 20:
+        print(f"   ... و {len(problems) - 20} مشکل دیگر")
+
+    # 1. ایجاد پشتیبان
+    backup_file = backup_database(db_path)
+
+    # 2. بازسازی در فایل جدید و جایگزینی
+    print("🔄 بازسازی دیتابیس...")
+    try:
+        if not rebuild_database(db_path):
+            print("⚠️ فایل اصلی دست نخورده باقی ماند")
+            return False
     except Exception as e:
         print(f"❌ خطا در تعمیر دیتابیس: {e}")
-        
-        # بازگردانی از پشتیبان
-        if backup_file and os.path.exists(backup_file):
-            print("🔄 بازگردانی از پشتیبان...")
-            import shutil
-            shutil.copy2(backup_file, "league_bot.db")
-            print("✅ دیتابیس به حالت قبل بازگردانی شد")
+        print("⚠️ فایل اصلی دست نخورده باقی ماند")
+        return False
+
+    print("✅ دیتابیس با موفقیت تعمیر شد!")
+    if backup_file:
+        print(f"📁 پشتیبان در فایل: {backup_file}")
+    return True
 
 if __name__ == "__main__":
-    repair_database()
\ No newline at end of file
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    ok = repair_database(args[0] if args else DATABASE_NAME, force="--force" in sys.argv[1:])
+    sys.exit(0 if ok else 1)
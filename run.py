@@ -1,21 +1,59 @@
 # run.py
-import threading
+import signal
+import asyncio
+import logging
+from contextlib import suppress
+
 import main
 import admin_bot
+from bot_session import get_shared_session
+from inflight import track_updates
+
+logger = logging.getLogger(__name__)
+
+
+async def run_bots():
+    """
+    اجرای هر دو ربات در یک حلقه رویداد
+
+    هر دو ربات یک استخر دیتابیس و یک session HTTP مشترک دارند. با SIGTERM
+    یا SIGINT: دریافت آپدیت متوقف، آپدیت‌های در حال پردازش تمام، FSM و
+    دیتابیس بسته و در آخر session HTTP بسته می‌شود.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    bots = [(main.dp, main.bot), (admin_bot.dp, admin_bot.bot)]
+    for dp, _ in bots:
+        track_updates(dp)
+
+    polling = [
+        asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+        for dp, bot in bots
+    ]
+    stopper = asyncio.create_task(stop.wait())
+    await asyncio.wait([stopper, *polling], return_when=asyncio.FIRST_COMPLETED)
+
+    logger.info("🛑 در حال خاموش کردن ربات‌ها...")
+    for dp, _ in bots:
+        # اگر polling یکی از ربات‌ها با خطا تمام شده باشد، stop_polling خطا می‌دهد
+        with suppress(RuntimeError):
+            await dp.stop_polling()
+
+    for task in polling:
+        try:
+            await task
+        except Exception as e:
+            logger.error(f"❌ خطا در اجرای ربات: {e}")
+    stopper.cancel()
 
-def run_main_bot():
-    main.main()
+    await get_shared_session().close()
+    logger.info("✅ ربات‌ها خاموش شدند")
 
-def run_admin_bot():
-    admin_bot.main()
 
 if __name__ == '__main__':
     print("🚀 در حال راه‌اندازی ربات‌ها...")
-    
-    # اجرای ربات اصلی در یک رشته جداگانه
-    main_thread = threading.Thread(target=run_main_bot)
-    main_thread.daemon = True
-    main_thread.start()
-    
-    # اجرای ربات ادمین در رشته اصلی
-    run_admin_bot()
\ No newline at end of file
+    asyncio.run(run_bots())
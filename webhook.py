@@ -0,0 +1,118 @@
+# webhook.py
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    WEBHOOK_BASE_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAIN_PATH,
+    WEBHOOK_ADMIN_PATH, WEBHOOK_SECRET, UPDATE_CONCURRENCY
+)
+from inflight import track_updates
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """
+    محدود کردن تعداد آپدیت‌هایی که همزمان پردازش می‌شوند
+
+    در حالت وبهوک هر آپدیت در یک task جدا اجرا می‌شود؛ بدون این محدودیت
+    یک موج آپدیت می‌تواند صدها هندلر همزمان روی دیتابیس بفرستد.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(self, handler, event, data):
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+class SharedSessionRequestHandler(SimpleRequestHandler):
+    """
+    SimpleRequestHandler بدون بستن session در خاموش شدن
+
+    ربات‌ها session مشترک دارند؛ اگر هر هندلر session ربات خودش را ببندد،
+    بستن ربات اول session را زیر پای هندلرهای در حال تخلیه ربات دوم
+    می‌بندد. build_app آن را یک بار بعد از shutdown تمام dispatcherها می‌بندد.
+    """
+
+    async def close(self) -> None:
+        pass
+
+
+def register_bot(app: web.Application, dispatcher: Dispatcher, bot: Bot, path: str,
+                 secret_token: str = WEBHOOK_SECRET, concurrency: int = UPDATE_CONCURRENCY):
+    """
+    ثبت یک ربات روی مسیر path از سرور وبهوک
+
+    مثل حالت polling، هنگام خاموش شدن اول آپدیت‌های در حال پردازش (که
+    در task پس‌زمینه اجرا می‌شوند) تمام می‌شوند و بعد FSM و دیتابیس بسته
+    می‌شوند. session ربات اینجا بسته نمی‌شود (build_app را ببینید).
+    """
+    # شمارنده بیرونی‌ترین middleware است تا آپدیت‌های منتظر سمافور هم شمرده شوند
+    track_updates(dispatcher)
+    dispatcher.update.outer_middleware(ConcurrencyLimitMiddleware(concurrency))
+    setup_application(app, dispatcher, bot=bot)
+    SharedSessionRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=secret_token or None
+    ).register(app, path=path)
+
+    async def set_webhook(_app):
+        if not WEBHOOK_BASE_URL:
+            logger.warning(f"⚠️ WEBHOOK_BASE_URL خالی است؛ وبهوک برای {path} تنظیم نشد")
+            return
+        await bot.set_webhook(
+            f"{WEBHOOK_BASE_URL.rstrip('/')}{path}",
+            secret_token=secret_token or None,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+            max_connections=concurrency
+        )
+        logger.info(f"✅ وبهوک روی {path} تنظیم شد")
+
+    app.on_startup.append(set_webhook)
+
+
+def build_app(bots=None, secret_token: str = WEBHOOK_SECRET) -> web.Application:
+    """
+    ساخت سرور aiohttp که هر دو ربات را روی مسیرهای جدا میزبانی می‌کند
+
+    bots: لیست (dispatcher, bot, path)؛ پیش‌فرض ربات اصلی و ربات ادمین
+    """
+    if bots is None:
+        import main
+        import admin_bot
+        bots = [
+            (main.dp, main.bot, WEBHOOK_MAIN_PATH),
+            (admin_bot.dp, admin_bot.bot, WEBHOOK_ADMIN_PATH),
+        ]
+
+    app = web.Application()
+    for dispatcher, bot, path in bots:
+        register_bot(app, dispatcher, bot, path, secret_token=secret_token)
+
+    async def close_sessions(_app):
+        # on_cleanup بعد از تمام هندلرهای on_shutdown (تخلیه و shutdown هر
+        # dispatcher) اجرا می‌شود؛ session مشترک فقط یک بار بسته می‌شود
+        sessions = {id(bot.session): bot.session for _, bot, _ in bots}
+        for session in sessions.values():
+            await session.close()
+
+    app.on_cleanup.append(close_sessions)
+    return app
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if not WEBHOOK_SECRET:
+        logger.warning("⚠️ WEBHOOK_SECRET تنظیم نشده؛ درخواست‌ها بدون بررسی توکن پذیرفته می‌شوند")
+    print(f"🌐 سرور وبهوک روی {WEBHOOK_HOST}:{WEBHOOK_PORT} در حال راه‌اندازی...")
+    web.run_app(build_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)